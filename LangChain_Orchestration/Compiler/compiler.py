@@ -2,16 +2,37 @@ import pandas as pd
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from Compiler.function_registry import FUNCTION_REGISTRY
+from Compiler.function_registry import FUNCTION_REGISTRY, ROW_LOCAL_FUNCTIONS
+from Functions.run_context import (CancelToken, RunCanceled, RunProgress, cancellation, collect_step_stats,
+                                   tracking_progress)
 
 
 
-def compile_and_run(path_request: list[dict], initial_df: pd.DataFrame):
+def compile_and_run(path_request: list[dict], initial_df: pd.DataFrame, cancel_token: CancelToken = None,
+                    progress: RunProgress = None):
+    """
+    Run each step of `path_request` in order and return (state, execution_log).
+
+    If `cancel_token` is canceled mid-run, the current step keeps the rows it
+    already finished (its log entry gets status "canceled") and later steps
+    are not run; a step that raises RunCanceled has no output. If `progress` is given, it tracks the current step and rows.
+    """
+    with cancellation(cancel_token), tracking_progress(progress):
+        return _run_steps(path_request, initial_df, cancel_token, progress)
+
+
+def _run_steps(path_request: list[dict], initial_df: pd.DataFrame, cancel_token: CancelToken = None,
+               progress: RunProgress = None):
     state = {"starting_df": (initial_df, None, None)}
     execution_log = []
+    is_canceled = lambda: cancel_token is not None and cancel_token.is_canceled()
 
-    for step in path_request:
+    for step_idx, step in enumerate(path_request, start=1):
+        if is_canceled():
+            break
         fn_name = step["function"]
+        if progress is not None:
+            progress.start_step(step_idx, len(path_request), fn_name)
         args = step.get("args", {})
         input_name = step['input_df_name']
         input_df = state[input_name][0]
@@ -23,16 +44,143 @@ def compile_and_run(path_request: list[dict], initial_df: pd.DataFrame):
         fn = FUNCTION_REGISTRY[fn_name]
 
         # Assume all functions take df as first arg
-        output_df = fn(input_df, **args)
+        with collect_step_stats() as stats:
+            try:
+                output_df = fn(input_df, **args)
+            except RunCanceled:
+                # The step couldn't finish on partial rows; keep the earlier steps' outputs
+                execution_log.append({"function": fn_name, "status": "canceled", "stats": stats.as_dict()})
+                break
 
         grouping_col = args.get("grouping_column", None)
         state[output_name] = (output_df, input_name, grouping_col)
-        execution_log.append({"function": fn_name, "status": "success"})
+        log_entry = {"function": fn_name, "status": "canceled" if is_canceled() else "success"}
+        if stats.as_dict():
+            log_entry["stats"] = stats.as_dict()
+        execution_log.append(log_entry)
 
 
     return state, execution_log
 
 
+class IncrementalUnavailable(Exception):
+    """The path can't be rerun on appended rows alone; run it on the full dataset instead."""
+
+
+def plan_incremental(path_request: list[dict]) -> list[dict]:
+    """
+    Decide, per step, how a rerun over appended rows works:
+    - "incremental": row-local step on row-local input, run on the new rows only
+    - "full": needs its whole input, which is the previous run's output plus the new rows
+
+    A full step can only rebuild its input if the previous run saved that exact
+    version of it, i.e. no later step overwrote the same output name; otherwise
+    this raises IncrementalUnavailable.
+    """
+    last_writer = {"starting_df": 0}
+    for step_idx, step in enumerate(path_request, start=1):
+        last_writer[step["output_df_name"]] = step_idx
+
+    version = {"starting_df": 0}
+    appended = {"starting_df"}  # states that hold only the new rows
+    plan = []
+    for step_idx, step in enumerate(path_request, start=1):
+        fn_name, input_name, output_name = step["function"], step["input_df_name"], step["output_df_name"]
+        if fn_name not in FUNCTION_REGISTRY:
+            raise ValueError(f"Unknown function: {fn_name}")
+        if input_name not in version:
+            raise ValueError(f"Step {step_idx} reads {input_name!r} before it is written")
+        if input_name in appended and fn_name in ROW_LOCAL_FUNCTIONS:
+            mode = "incremental"
+            appended.add(output_name)
+        else:
+            if input_name in appended and version[input_name] != last_writer[input_name]:
+                raise IncrementalUnavailable(
+                    f"Step {step_idx} ({fn_name}) needs all rows of {input_name!r}, "
+                    f"which a later step overwrites in the saved results"
+                )
+            mode = "full"
+            appended.discard(output_name)
+        version[output_name] = step_idx
+        plan.append({"step": step_idx, "function": fn_name, "mode": mode})
+    return plan
+
+
+def compile_and_run_incremental(path_request: list[dict], new_rows_df: pd.DataFrame, load_previous,
+                                cancel_token: CancelToken = None, progress: RunProgress = None):
+    """
+    Rerun `path_request` after rows were appended to its dataset.
+
+    `new_rows_df` holds only the appended rows; `load_previous(name)` returns
+    the previous run's DataFrame for a state name. Row-local steps run on the
+    new rows only; other steps run on their full input, and are skipped when
+    their input got no new rows (e.g. a filter dropped them all).
+
+    Returns (state, execution_log, appended, reused): states named in
+    `appended` hold only rows to add to the previous run's output of the same
+    name; states in `reused` didn't change, so the previous output is kept as
+    it is; the others are complete.
+    """
+    plan = plan_incremental(path_request)
+    with cancellation(cancel_token), tracking_progress(progress):
+        return _run_steps_incremental(path_request, plan, new_rows_df, load_previous, cancel_token, progress)
+
+
+def _run_steps_incremental(path_request: list[dict], plan: list[dict], new_rows_df: pd.DataFrame, load_previous,
+                           cancel_token: CancelToken = None, progress: RunProgress = None):
+    state = {"starting_df": (new_rows_df, None, None)}
+    appended = {"starting_df"}
+    reused = set()
+    execution_log = []
+    is_canceled = lambda: cancel_token is not None and cancel_token.is_canceled()
+
+    for step_idx, (step, step_plan) in enumerate(zip(path_request, plan), start=1):
+        if is_canceled():
+            break
+        fn_name = step["function"]
+        if progress is not None:
+            progress.start_step(step_idx, len(path_request), fn_name)
+        args = step.get("args", {})
+        input_name = step['input_df_name']
+        input_df = state[input_name][0]
+        output_name = step["output_df_name"]
+        fn = FUNCTION_REGISTRY[fn_name]
+
+        if input_name in appended and input_df.empty:
+            # No new rows reach this step: the previous output stands (the empty
+            # frame only tells later steps that nothing new reaches them)
+            output_df, mode = input_df, "reused"
+            appended.add(output_name)
+            reused.add(output_name)
+            execution_log.append({"function": fn_name, "status": "success", "mode": mode, "rows": 0})
+        else:
+            reused.discard(output_name)
+            if step_plan["mode"] == "incremental":
+                appended.add(output_name)
+            else:
+                if input_name in appended:
+                    input_df = pd.concat([load_previous(input_name), input_df], ignore_index=True)
+                appended.discard(output_name)
+            mode = step_plan["mode"]
+            with collect_step_stats() as stats:
+                try:
+                    output_df = fn(input_df, **args)
+                except RunCanceled:
+                    execution_log.append({"function": fn_name, "status": "canceled", "mode": mode,
+                                          "stats": stats.as_dict()})
+                    break
+            log_entry = {"function": fn_name, "status": "canceled" if is_canceled() else "success",
+                         "mode": mode, "rows": len(input_df)}
+            if stats.as_dict():
+                log_entry["stats"] = stats.as_dict()
+            execution_log.append(log_entry)
+
+        grouping_col = args.get("grouping_column", None)
+        state[output_name] = (output_df, input_name, grouping_col)
+
+    return state, execution_log, appended - reused, reused
+
+
 if __name__ == "__main__":
     import os
     
@@ -10,6 +10,7 @@ from Functions.token_based_splitter import token_based_splitter
 from Functions.unique_value_splitter import unique_value_splitter
 from Functions.unsupervised_grouping import unsupervised_grouping
 from Functions.filter import filter
+from Functions.transcript_compactor import transcript_compactor
 
 FUNCTION_REGISTRY = {
     "binary_classification": run_multiple_binary_classifiers,
@@ -23,4 +24,17 @@ FUNCTION_REGISTRY = {
     "unique_value_splitter": unique_value_splitter,
     "unsupervised_grouping": unsupervised_grouping,
     "filter": filter,
-}
\ No newline at end of file
+    "transcript_compactor": transcript_compactor,
+}
+
+# Functions whose output for a row depends only on that row (rows may be dropped, never
+# combined), so appended rows can be run on their own and concatenated to earlier results.
+# Everything else (grouping, theme discovery, category canonicalization, splitting by
+# running token counts) looks across rows and is recomputed on the full input.
+ROW_LOCAL_FUNCTIONS = {
+    "binary_classification",
+    "categorical_classification",
+    "open_classification",
+    "transcript_compactor",
+    "filter",
+}
@@ -0,0 +1,132 @@
+# test_runs.py
+import pandas as pd
+import pytest
+from Compiler import compiler
+from Functions.run_context import CancelToken, RunCanceled
+
+
+def _step(function, input_name="starting_df", output_name="starting_df", **args):
+    return {"function": function, "args": args, "input_df_name": input_name, "output_df_name": output_name}
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Swap in test functions; the registry is otherwise the real one."""
+    functions = dict(compiler.FUNCTION_REGISTRY)
+    monkeypatch.setattr(compiler, "FUNCTION_REGISTRY", functions)
+    return functions
+
+
+def test_canceled_step_keeps_its_output_and_stops_the_run(registry):
+    cancel_token = CancelToken()
+
+    def label_then_cancel(df):
+        cancel_token.cancel()
+        return df.assign(label=["x", None])
+
+    registry["label_then_cancel"] = label_then_cancel
+    registry["never_runs"] = lambda df: pytest.fail("ran after cancel")
+    df = pd.DataFrame({"text": ["a", "b"]})
+
+    state, log = compiler.compile_and_run(
+        [_step("label_then_cancel", output_name="labeled"), _step("never_runs", "labeled", "after")],
+        df, cancel_token,
+    )
+
+    assert list(state["labeled"][0]["label"]) == ["x", None]
+    assert "after" not in state
+    assert [entry["status"] for entry in log] == ["canceled"]
+
+
+def test_run_canceled_drops_only_that_step(registry):
+    cancel_token = CancelToken()
+
+    def needs_every_row(df):
+        cancel_token.cancel()
+        raise RunCanceled("partial input")
+
+    registry["needs_every_row"] = needs_every_row
+    state, log = compiler.compile_and_run(
+        [_step("needs_every_row", output_name="themes")], pd.DataFrame({"text": ["a"]}), cancel_token
+    )
+
+    assert "themes" not in state
+    assert log == [{"function": "needs_every_row", "status": "canceled", "stats": {}}]
+
+
+def test_real_errors_are_not_hidden_by_a_cancel(registry):
+    cancel_token = CancelToken()
+
+    def broken(df):
+        cancel_token.cancel()
+        raise KeyError("missing column")
+
+    registry["broken"] = broken
+    with pytest.raises(KeyError):
+        compiler.compile_and_run([_step("broken")], pd.DataFrame({"text": ["a"]}), cancel_token)
+
+
+def test_plan_runs_row_local_steps_on_new_rows_and_the_rest_in_full():
+    plan = compiler.plan_incremental([
+        _step("filter", output_name="kept"),
+        _step("binary_classification", "kept", "labeled"),
+        _step("summarizer", "labeled", "summary"),
+        _step("filter", "summary", "short_summary"),
+    ])
+
+    # The last filter reads a complete (recomputed) table, so it runs in full too
+    assert [step["mode"] for step in plan] == ["incremental", "incremental", "full", "full"]
+
+
+def test_plan_refuses_a_full_step_whose_saved_input_is_overwritten():
+    path_request = [
+        _step("binary_classification", output_name="labeled"),
+        _step("summarizer", "labeled", "summary"),
+        _step("filter", "labeled", "labeled"),
+    ]
+    with pytest.raises(compiler.IncrementalUnavailable):
+        compiler.plan_incremental(path_request)
+
+
+@pytest.mark.parametrize("path_request", [
+    [_step("no_such_function")],
+    [_step("filter", "labeled", "kept")],
+])
+def test_plan_rejects_invalid_paths(path_request):
+    with pytest.raises(ValueError):
+        compiler.plan_incremental(path_request)
+
+
+@pytest.fixture
+def incremental_registry(registry, monkeypatch):
+    """`label` is row-local, `count` looks across rows; both are test functions."""
+    registry["label"] = lambda df, keep=None: (df[df["text"] != "drop"] if keep else df).assign(label="x")
+    registry["count"] = lambda df: pd.DataFrame({"rows": [len(df)]})
+    monkeypatch.setattr(compiler, "ROW_LOCAL_FUNCTIONS", {"label"})
+    return registry
+
+
+def test_incremental_run_appends_row_local_output_and_recomputes_full_steps(incremental_registry):
+    previous = {"labeled": pd.DataFrame({"text": ["a", "b"], "label": ["x", "x"]})}
+    state, log, appended, reused = compiler.compile_and_run_incremental(
+        [_step("label", output_name="labeled"), _step("count", "labeled", "counts")],
+        pd.DataFrame({"text": ["c"]}), previous.__getitem__,
+    )
+
+    assert list(state["labeled"][0]["text"]) == ["c"]
+    assert state["counts"][0]["rows"].tolist() == [3]
+    assert appended == {"starting_df", "labeled"} and reused == set()
+    assert [(entry["mode"], entry["rows"]) for entry in log] == [("incremental", 1), ("full", 3)]
+
+
+def test_incremental_run_reuses_previous_output_when_no_new_rows_reach_a_step(incremental_registry):
+    incremental_registry["count"] = lambda df: pytest.fail("recomputed without new rows")
+    state, log, appended, reused = compiler.compile_and_run_incremental(
+        [_step("label", output_name="kept", keep=True), _step("count", "kept", "counts")],
+        pd.DataFrame({"text": ["drop"]}), lambda name: pytest.fail(f"loaded {name}"),
+    )
+
+    # `counts` keeps the previous output; nothing is appended to it
+    assert reused == {"counts"}
+    assert appended == {"starting_df", "kept"}
+    assert [entry["mode"] for entry in log] == ["incremental", "reused"]
@@ -1,17 +1,25 @@
+import numpy as np
 import pandas as pd  
 from pydantic import BaseModel
-from concurrent.futures import ThreadPoolExecutor
 from client import client
-from typing import Optional
+from typing import List, Optional
+from Functions.evidence_gate import gate_rows
+from Functions.context_selection import prune_context_column
+from Functions.map_reduce import DEFAULT_OVERLAP_TOKENS, DEFAULT_WINDOW_TOKENS, any_positive, fan_out_windows
+from Functions.near_duplicates import run_on_representatives
+from Functions.output_modes import (
+    as_bool, classify_with_explanations, enum_label_schema, justify_labels, resolve_explanation_policy
+)
+from Functions.prompts import layout_messages
+from Functions.run_context import cancel_requested, record_usage, report_row_error
+from Functions.row_executor import estimate_row_costs, read_columns
 
 # Define schema for structured output
 class BinaryOutcome(BaseModel):
-    call_id: str
     binary_label: str
     binary_explanation: str
 
 class BinaryOutcomeNoExplanation(BaseModel):
-    call_id: str
     binary_label: str
     
 
@@ -24,76 +32,145 @@ def process_row_binary(row,
                        positive_label,
                        negative_label,
                        client,
-                       include_explanation=True):
-    call_id = row["call_id"]
+                       include_explanation=True,
+                       id_column="call_id",
+                       compact=False):
+    call_id = str(row[id_column])
     transcript = row[input_data]
+    include_explanation = as_bool(row.get("explain", include_explanation))
 
-        # Build base JSON format dynamically
+    # Build base JSON format dynamically
+    label_key, explanation_key = ("label", "explanation") if compact else ("binary_label", "binary_explanation")
     json_structure = (
-        f'{{ "binary_label": "{positive_label}" or "{negative_label}" }}'
+        f'{{ "{label_key}": "{positive_label}" or "{negative_label}" }}'
         if not include_explanation
         else f'''{{
-            "binary_label": "{positive_label}" or "{negative_label}",
-            "binary_explanation": "Reasoning citing evidence from the transcript"
+            "{label_key}": "{positive_label}" or "{negative_label}",
+            "{explanation_key}": "Reasoning citing evidence from the transcript"
         }}'''
     )
 
-    messages = [
-        {
-            "role": "system",
-            "content": """
-            You are a precise binary classifier. Answer strictly based only on evidence in the transcript. 
-            Do not make assumptions. 
+    # Transcript before the question so every question about this call shares a cacheable prefix
+    messages = layout_messages(
+        instructions="""
+            You are a precise binary classifier. Answer strictly based only on evidence in the transcript.
+            Do not make assumptions.
             Always respond with valid JSON.
             """,
-        },
-        {
-            "role": "user",
-            "content": f"""
+        document=transcript,
+        task=f"""
             Question: {context_prompt}
-            Transcript: {transcript}
 
             Respond ONLY as JSON:
             {json_structure}
             """,
-        },
-    ]
+    )
 
-   
+    if compact:
+        # The label is constrained to the two allowed values
+        text_format = enum_label_schema((positive_label, negative_label), include_explanation)
+    else:
+        text_format = BinaryOutcome if include_explanation else BinaryOutcomeNoExplanation
 
     try:
-        text_format = BinaryOutcome # Default assignment
-
-        if(include_explanation == "false"):
-            text_format = BinaryOutcomeNoExplanation
-
         response = client.responses.parse(
             model="gpt-5-mini",
             input=messages,
             text_format=text_format,
             temperature=1.0,
         )
-
-        if(include_explanation == "false"):
-            parsed:  BinaryOutcomeNoExplanation = response.output_parsed
-        else:
-            parsed:  BinaryOutcome = response.output_parsed
-
-        parsed.call_id = call_id
+        record_usage(response)
+        parsed = response.output_parsed.model_dump()
 
     except Exception as e:
         print(f"Failed to parse {call_id}: {e}")
-        parsed = text_format(
-            call_id=call_id,
-            binary_label=negative_label,
-            binary_explanation=None if not include_explanation else "No explanation found",
-        )
+        report_row_error()
+        parsed = {label_key: negative_label, explanation_key: "No explanation found"}
 
-    return parsed.model_dump()
+    return {
+        "binary_label": parsed[label_key],
+        "binary_explanation": parsed.get(explanation_key) if include_explanation else None,
+    }
 
 # -------------------------------
 # Parallel classifier
 # -------------------------------
+def _classify_binary_question(df,
+                              context_prompt,
+                              input_data="call_text",
+                              positive_label="true",
+                              negative_label="false",
+                              include_explanation=True,
+                              max_workers=8,
+                              evidence_keywords: Optional[List[str]] = None,
+                              evidence_patterns: Optional[List[str]] = None,
+                              audit_sample_size: int = 5,
+                              context_token_budget: Optional[int] = None,
+                              id_column: str = "call_id",
+                              label_col: str = "binary_label",
+                              compact: bool = False,
+                              explanation_policy: Optional[str] = None,
+                              explanation_sample_size: int = 20,
+                              previous_label_col: Optional[str] = None,
+                              window_tokens: int = DEFAULT_WINDOW_TOKENS,
+                              overlap_tokens: int = DEFAULT_OVERLAP_TOKENS) -> dict:
+    """Classify every row for one question; returns label/explanation arrays aligned with df."""
+    policy = resolve_explanation_policy(include_explanation, explanation_policy, previous_label_col)
+    compact = as_bool(compact, default=False)
+    columns = read_columns(df, [id_column, input_data])
+
+    # Rows with no lexical evidence get the negative label without an LLM call
+    has_evidence = gate_rows(df, input_data, evidence_keywords, evidence_patterns,
+                             id_column=id_column, output_col=label_col, default_label=negative_label,
+                             audit_sample_size=audit_sample_size)
+    positions = np.flatnonzero(has_evidence.to_numpy())
+
+    # Optionally send only the speaker-turn windows most relevant to the question
+    if context_token_budget:
+        texts = columns[input_data].copy()
+        texts[positions] = prune_context_column(
+            df.iloc[positions], input_data, context_prompt, context_token_budget, output_col=label_col
+        ).to_numpy()
+        columns[input_data] = texts
+
+    costs = estimate_row_costs(columns[input_data])
+
+    # Transcripts longer than window_tokens are classified per window: positive if any
+    # window is, and the remaining windows of a row are skipped once one says yes
+    def classify(run_positions, explain):
+        return fan_out_windows(
+            lambda row: process_row_binary(row, context_prompt, input_data, positive_label,
+                                           negative_label, client, id_column=id_column, compact=compact),
+            {**columns, "explain": explain},
+            input_data,
+            ["binary_label", "binary_explanation"],
+            any_positive("binary_label", "binary_explanation", positive_label),
+            window_tokens=window_tokens,
+            overlap_tokens=overlap_tokens,
+            stop_when=lambda result: str(result["binary_label"]) == str(positive_label),
+            max_workers=max_workers,
+            positions=run_positions,
+            fill={
+                "binary_label": negative_label,
+                "binary_explanation": "No evidence keywords found in transcript" if policy != "none" else None,
+            },
+            costs=costs,
+            label=label_col,
+        )
+
+    def justify(run_positions, labels):
+        return justify_labels(columns, input_data, context_prompt, labels, run_positions, client,
+                              id_column=id_column, window_tokens=window_tokens, overlap_tokens=overlap_tokens,
+                              max_workers=max_workers, costs=costs, label=label_col)
+
+    previous_labels = df[previous_label_col].to_numpy() if policy == "changed" else None
+    return classify_with_explanations(
+        classify, len(df), positions, policy, "binary_label", "binary_explanation",
+        sample_size=explanation_sample_size, previous_labels=previous_labels, justify=justify,
+        output_col=label_col,
+    )
+
+
 def binary_classifier_parallel(df,
                                context_prompt,
                                input_data="call_text",
@@ -102,59 +179,103 @@ def binary_classifier_parallel(df,
                                explanation_col="binary_explanation",
                                label_col="binary_label",
                                include_explanation=True,
-                               max_workers=8) -> pd.DataFrame:
-    
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [
-            executor.submit(
-                process_row_binary,
-                row,
-                context_prompt,
-                input_data,
-                positive_label,
-                negative_label,
-                client,
-                include_explanation
-            )
-            for _, row in df.iterrows()
-        ]
-        results = [f.result() for f in futures]
-
-    # Convert list of dicts into DataFrame and merge
-    results_df = pd.DataFrame(results)
-    results_df = results_df.rename(columns={
-        "binary_explanation": explanation_col,
-        "binary_label": label_col,
-    })
-
-    # Drop explanation column if not requested
-    if not include_explanation and explanation_col in results_df.columns:
-        results_df = results_df.drop(columns=[explanation_col])
-
-    df = df.merge(results_df, on="call_id", how="left")
+                               max_workers=8,
+                               evidence_keywords: Optional[List[str]] = None,
+                               evidence_patterns: Optional[List[str]] = None,
+                               audit_sample_size: int = 5,
+                               context_token_budget: Optional[int] = None,
+                               id_column: str = "call_id",
+                               compact: bool = False,
+                               explanation_policy: Optional[str] = None,
+                               explanation_sample_size: int = 20,
+                               previous_label_col: Optional[str] = None,
+                               window_tokens: int = DEFAULT_WINDOW_TOKENS,
+                               overlap_tokens: int = DEFAULT_OVERLAP_TOKENS) -> pd.DataFrame:
+
+    outputs = _classify_binary_question(
+        df, context_prompt, input_data, positive_label, negative_label, include_explanation,
+        max_workers, evidence_keywords, evidence_patterns, audit_sample_size,
+        context_token_budget, id_column, label_col, compact, explanation_policy,
+        explanation_sample_size, previous_label_col, window_tokens, overlap_tokens
+    )
+
+    df = df.copy()
+    df[label_col] = outputs["binary_label"]
+    # Only write the explanation column if requested
+    if resolve_explanation_policy(include_explanation, explanation_policy, previous_label_col) != "none":
+        df[explanation_col] = outputs["binary_explanation"]
     return df
 
 # -------------------------------
 # Multi-Binary classifier (Compiler-compatible)
 # -------------------------------
-def run_multiple_binary_classifiers(df: pd.DataFrame, questions: list[dict], max_workers=5) -> pd.DataFrame:
+def run_multiple_binary_classifiers(df: pd.DataFrame,
+                                    questions: list[dict],
+                                    max_workers=5,
+                                    dedupe_threshold: Optional[float] = None,
+                                    dedupe_column: str = "call_text",
+                                    id_column: str = "call_id") -> pd.DataFrame:
     """
     Runs multiple binary classification questions sequentially on the same dataframe.
     Each question adds two new columns (label + explanation).
+
+    A question may set `evidence_keywords` and/or `evidence_patterns` (regex);
+    rows matching none of them get the negative label without an LLM call
+    (`audit_sample_size` of those rows are sampled into the step log).
+    A question may also set `context_token_budget` to send only the transcript
+    windows most relevant to the question.
+
+    Output size: `compact` asks for the label only through an enum schema, and
+    `explanation_policy` ("all", "none", "sample", "changed") limits which rows
+    get an explanation (`explanation_sample_size`, `previous_label_col`).
+    `include_explanation` may be a bool or a "true"/"false" string.
+
+    Transcripts longer than `window_tokens` (per question) are split into
+    overlapping windows classified in parallel; the row is positive if any
+    window is.
+
+    If `dedupe_threshold` is set, near-duplicate transcripts in `dedupe_column`
+    are classified once and the result is copied to the rest of their cluster.
     """
+    if dedupe_threshold:
+        return run_on_representatives(
+            df, dedupe_column, dedupe_threshold,
+            lambda rep_df: run_multiple_binary_classifiers(rep_df, questions, max_workers, None, dedupe_column,
+                                                           id_column)
+        )
+
+    # One copy for the whole run; each question writes its columns positionally
     df = df.copy()
 
     for q in questions:
+        if cancel_requested():
+            break
         print(f"Running classifier: {q['context_prompt']}")
-        df = binary_classifier_parallel(
+        policy = resolve_explanation_policy(
+            q.get("include_explanation", True), q.get("explanation_policy"), q.get("previous_label_col")
+        )
+        outputs = _classify_binary_question(
             df,
             context_prompt=q["context_prompt"],
+            input_data=q.get("input_data", "call_text"),
             positive_label=q["positive_label"],
             negative_label=q["negative_label"],
-            explanation_col=q["explanation_col"],
-            label_col=q["label_col"],
-            include_explanation=q.get("include_explanation", True),
             max_workers=max_workers,
+            evidence_keywords=q.get("evidence_keywords"),
+            evidence_patterns=q.get("evidence_patterns"),
+            audit_sample_size=q.get("audit_sample_size", 5),
+            context_token_budget=q.get("context_token_budget"),
+            id_column=id_column,
+            label_col=q["label_col"],
+            compact=q.get("compact", False),
+            explanation_policy=policy,
+            explanation_sample_size=q.get("explanation_sample_size", 20),
+            previous_label_col=q.get("previous_label_col"),
+            window_tokens=q.get("window_tokens", DEFAULT_WINDOW_TOKENS),
+            overlap_tokens=q.get("overlap_tokens", DEFAULT_OVERLAP_TOKENS),
         )
+        df[q["label_col"]] = outputs["binary_label"]
+        if policy != "none":
+            df[q["explanation_col"]] = outputs["binary_explanation"]
 
     return df
\ No newline at end of file
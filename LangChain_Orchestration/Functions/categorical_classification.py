@@ -1,20 +1,32 @@
+import numpy as np
 import pandas as pd  
 from pydantic import BaseModel
-from concurrent.futures import ThreadPoolExecutor
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 from client import client
-from typing import List
+from typing import List, Optional
+from Functions.evidence_gate import gate_rows
+from Functions.map_reduce import DEFAULT_OVERLAP_TOKENS, DEFAULT_WINDOW_TOKENS, fan_out_windows, majority_vote
+from Functions.near_duplicates import run_on_representatives
+from Functions.output_modes import (
+    as_bool, classify_with_explanations, index_label_schema, justify_labels, numbered_options,
+    resolve_explanation_policy
+)
+from Functions.prompts import layout_messages
+from Functions.run_context import record_usage, report_row_error
+from Functions.row_executor import estimate_row_costs, read_columns
 
 # =========================
 # SCHEMA
 # =========================
 class CategoricalOutcome(BaseModel):
-    call_id: str
     categorical_explanation: str
     categorical_label: str
 
+class CategoricalOutcomeNoExplanation(BaseModel):
+    categorical_label: str
+
 # -------------------------------
 # Helper function for one row
 # -------------------------------
@@ -23,61 +35,106 @@ def process_row_categorical(row,
                             context_prompt,
                             input_data,
                             client,
-                            id_column="call_id"):
-    call_id = row[id_column]
+                            id_column="call_id",
+                            compact=False):
+    call_id = str(row[id_column])
     transcript = row[input_data]
+    include_explanation = as_bool(row.get("explain", True))
+
+    if compact:
+        return _process_row_categorical_compact(call_id, transcript, classifications, context_prompt,
+                                                client, include_explanation)
 
     # Create classifications string for the prompt
     classifications_str = ", ".join(classifications)
+    json_structure = (
+        '{ "categorical_label": "selected_classification" }'
+        if not include_explanation
+        else '''{
+                "categorical_explanation": "Short reason for the choice referencing transcript evidence",
+                "categorical_label": "selected_classification"
+            }'''
+    )
 
-    messages = [
-        {
-            "role": "system",
-            "content": f"""
+    # Fixed instructions, then the transcript, then the task and class list last,
+    # so every question about the same call shares a cacheable prefix
+    messages = layout_messages(
+        instructions="""
             You are an expert at analyzing sales call transcripts for categorical classification purposes.
-            Your task: {context_prompt}
-            Available classifications: {classifications_str}
-            
+
             Instructions:
-            1. Choose exactly ONE classification.
-            2. Provide a short explanation referencing transcript evidence.
-            3. Return valid JSON exactly as:
-            {{
-                "classification": "selected_classification",
-                "explanation": "Reason for choice based on transcript"
-            }}
+            1. Choose exactly ONE of the available classifications.
+            2. Return valid JSON in the requested format.
             """,
-        },
-        {
-            "role": "user",
-            "content": f"""
-            Call ID: {call_id}
-            Transcript:-
-            {transcript}
+        document=transcript,
+        task=f"""
+            Your task: {context_prompt}
+            Available classifications: {classifications_str}
+
+            Return JSON exactly as:
+            {json_structure}
             """,
-        },
-    ]
+    )
 
     try:
         response = client.responses.parse(
             model="gpt-5-mini",
             input=messages,
-            text_format=CategoricalOutcome,
+            text_format=CategoricalOutcome if include_explanation else CategoricalOutcomeNoExplanation,
             temperature=0,
         )
-
-        parsed: CategoricalOutcome = response.output_parsed
-        parsed.call_id = call_id
+        record_usage(response)
+        result = response.output_parsed.model_dump()
 
     except Exception as e:
         print(f"Failed to parse {call_id}: {e}")
-        parsed = CategoricalOutcome(
-            call_id=call_id,
-            categorical_explanation="No explanation found",
-            categorical_label="None"
+        report_row_error()
+        result = {"categorical_label": "None", "categorical_explanation": "No explanation found"}
+
+    if not include_explanation:
+        result["categorical_explanation"] = None
+    return result
+
+
+def _process_row_categorical_compact(call_id, transcript, classifications, context_prompt,
+                                     client, include_explanation):
+    """Label-only request: the model returns the index of a numbered class (plus an optional explanation)."""
+    explanation_field = ', "explanation": "Short reason citing the transcript"' if include_explanation else ""
+    messages = layout_messages(
+        instructions="""
+            You are an expert at analyzing sales call transcripts for categorical classification purposes.
+            Choose exactly ONE of the numbered classifications and answer with its number. Return valid JSON.
+            """,
+        document=transcript,
+        task="\n".join([
+            f"Your task: {context_prompt}",
+            "Classifications:",
+            numbered_options(classifications),
+            f'Return JSON: {{"label": <number>{explanation_field}}}',
+        ]),
+    )
+
+    try:
+        response = client.responses.parse(
+            model="gpt-5-mini",
+            input=messages,
+            text_format=index_label_schema(len(classifications), include_explanation),
+            temperature=0,
         )
+        record_usage(response)
+        parsed = response.output_parsed
+        return {
+            "categorical_label": classifications[parsed.label],
+            "categorical_explanation": getattr(parsed, "explanation", None),
+        }
 
-    return parsed.model_dump()
+    except Exception as e:
+        print(f"Failed to parse {call_id}: {e}")
+        report_row_error()
+        return {
+            "categorical_label": "None",
+            "categorical_explanation": "No explanation found" if include_explanation else None,
+        }
 
 # -------------------------------
 # Multi-row categorical classification with parallel processing
@@ -89,7 +146,19 @@ def categorical_classification(df,
                                    explanation_col: str = "categorical_explanation",
                                    label_col: str = "categorical_label",
                                    max_workers: int = 8,
-                                   id_column: str = "call_id") -> pd.DataFrame:
+                                   id_column: str = "call_id",
+                                   evidence_keywords: Optional[List[str]] = None,
+                                   evidence_patterns: Optional[List[str]] = None,
+                                   default_label: str = "None",
+                                   audit_sample_size: int = 5,
+                                   dedupe_threshold: Optional[float] = None,
+                                   include_explanation: bool = True,
+                                   compact: bool = False,
+                                   explanation_policy: Optional[str] = None,
+                                   explanation_sample_size: int = 20,
+                                   previous_label_col: Optional[str] = None,
+                                   window_tokens: int = DEFAULT_WINDOW_TOKENS,
+                                   overlap_tokens: int = DEFAULT_OVERLAP_TOKENS) -> pd.DataFrame:
     """
     Classify call transcripts using categorical classification with parallel processing.
     
@@ -101,33 +170,81 @@ def categorical_classification(df,
         explanation_col (str): Name for the output explanation column
         label_col (str): Name for the output label column
         max_workers (int): Maximum number of parallel workers
+        evidence_keywords (List[str]): Optional keywords; rows containing none of them
+            (and matching no evidence_patterns) get default_label without an LLM call
+        evidence_patterns (List[str]): Optional regex patterns used the same way
+        default_label (str): Label assigned to rows with no evidence
+        audit_sample_size (int): Number of skipped rows sampled into the step log
+        dedupe_threshold (float): Optional MinHash similarity above which near-duplicate
+            transcripts share one classification
+        include_explanation (bool): Write the explanation column (bool or "true"/"false")
+        compact (bool): Ask for the class index only (enum schema), not free text
+        explanation_policy (str): "all", "none", "sample" (explain an audit sample of
+            explanation_sample_size rows) or "changed" (explain only rows whose label
+            differs from previous_label_col); overrides include_explanation
+        window_tokens (int): Transcripts longer than this are classified per overlapping
+            window (overlap_tokens) and the window labels are combined by majority vote
     
     Returns:
         pd.DataFrame: Original DataFrame with added classification columns
     """
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [
-            executor.submit(
-                process_row_categorical,
-                row,
-                classifications,
-                context_prompt,
-                input_data, 
-                client,
-                id_column
+    if dedupe_threshold:
+        return run_on_representatives(
+            df, input_data, dedupe_threshold,
+            lambda rep_df: categorical_classification(
+                rep_df, context_prompt, classifications, input_data, explanation_col, label_col,
+                max_workers, id_column, evidence_keywords, evidence_patterns, default_label,
+                audit_sample_size, None, include_explanation, compact, explanation_policy,
+                explanation_sample_size, previous_label_col, window_tokens, overlap_tokens
             )
-            for _, row in df.iterrows()
-        ]
-        results = [f.result() for f in futures]
-
-    # 3️⃣ Merge results
-    results_df = pd.DataFrame(results)
-    results_df = results_df.rename(columns={
-        "categorical_explanation": explanation_col,
-        "categorical_label": label_col,
-    })
-
-    df = df.merge(results_df, left_on=id_column, right_on='call_id', how="left")
-    if id_column != 'call_id':
-        df = df.drop(columns=['call_id'])
+        )
+
+    policy = resolve_explanation_policy(include_explanation, explanation_policy, previous_label_col)
+    compact = as_bool(compact, default=False)
+
+    has_evidence = gate_rows(df, input_data, evidence_keywords, evidence_patterns,
+                             id_column=id_column, output_col=label_col,
+                             default_label=default_label, audit_sample_size=audit_sample_size)
+
+    columns = read_columns(df, [id_column, input_data])
+    costs = estimate_row_costs(columns[input_data])
+
+    def classify(run_positions, explain):
+        return fan_out_windows(
+            lambda row: process_row_categorical(row, classifications, context_prompt, input_data,
+                                                client, id_column, compact),
+            {**columns, "explain": explain},
+            input_data,
+            ["categorical_label", "categorical_explanation"],
+            majority_vote("categorical_label", "categorical_explanation", abstain_label=default_label),
+            window_tokens=window_tokens,
+            overlap_tokens=overlap_tokens,
+            max_workers=max_workers,
+            positions=run_positions,
+            fill={
+                "categorical_label": default_label,
+                "categorical_explanation": "No evidence keywords found in transcript" if policy != "none" else None,
+            },
+            costs=costs,
+            label=label_col,
+        )
+
+    def justify(run_positions, labels):
+        return justify_labels(columns, input_data, context_prompt, labels, run_positions, client,
+                              id_column=id_column, window_tokens=window_tokens, overlap_tokens=overlap_tokens,
+                              max_workers=max_workers, costs=costs, label=label_col)
+
+    outputs = classify_with_explanations(
+        classify, len(df), np.flatnonzero(has_evidence.to_numpy()), policy,
+        "categorical_label", "categorical_explanation",
+        sample_size=explanation_sample_size,
+        previous_labels=df[previous_label_col].to_numpy() if policy == "changed" else None,
+        justify=justify,
+        output_col=label_col,
+    )
+
+    df = df.copy()
+    if policy != "none":
+        df[explanation_col] = outputs["categorical_explanation"]
+    df[label_col] = outputs["categorical_label"]
     return df
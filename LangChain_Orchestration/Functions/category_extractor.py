@@ -1,60 +1,95 @@
+import numpy as np
 import pandas as pd
-from typing import List
-from concurrent.futures import ThreadPoolExecutor
+import re
+from collections import Counter
+from typing import Dict, List, Optional
 import json
 from client import client
+from Functions.prompts import layout_messages
+from Functions.run_context import log_step_stats, record_usage, report_row_error
+from Functions.token_based_splitter import split_text_into_token_windows
+from Functions.near_duplicates import run_on_representatives
+from Functions.row_executor import estimate_row_costs, fan_out_rows
 
 
 # -------------------------------
-# Helper: Extract categories for a single transcript
+# Helper: Extract categories for a single transcript window
 # -------------------------------
 def _extract_category_names_from_transcript(transcript_text: str,
                                             context_prompt: str,
-                                            transcript_idx: int) -> List[str]:
-    """Extract category names from one transcript."""
-    processed_transcript = (
-        transcript_text[:8000] + "... [truncated]"
-        if len(transcript_text) > 8000 else transcript_text
-    )
-
-    system_prompt = f"""
-    You are an expert at extracting category names from text.
-    Your task: {context_prompt}
-
-    Instructions:
-    1. Extract 1–10 distinct categories mentioned in the transcript.
-    2. Use exact text; no duplicates.
-    3. Return ONLY categories clearly referenced.
-    4. Respond as JSON:
-    {{
-        "categoryNames": ["Category A", "Category B"]
-    }}
-    """
+                                            transcript_idx: int,
+                                            part: Optional[str] = None) -> List[str]:
+    """Extract category names from one transcript (or one window of a long transcript)."""
+    part_line = f"Transcript part: {part}\n" if part else ""
+    messages = layout_messages(
+        instructions="""
+            You are an expert at extracting category names from text.
 
-    user_prompt = f"""
-    Transcript ID: {transcript_idx}
-    Transcript:
-    {processed_transcript}
-    """
+            Instructions:
+            1. Extract 1–10 distinct categories mentioned in the transcript.
+            2. Use exact text; no duplicates.
+            3. Return ONLY categories clearly referenced.
+            4. Respond as JSON:
+            {
+                "categoryNames": ["Category A", "Category B"]
+            }
+            """,
+        document=transcript_text,
+        task=f"Transcript ID: {transcript_idx}\n{part_line}Your task: {context_prompt}",
+    )
 
     try:
         response = client.chat.completions.create(
             model="gpt-5-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
+            messages=messages,
             temperature=0,
             response_format={"type": "json_object"},
         )
+        record_usage(response)
         parsed = json.loads(response.choices[0].message.content.strip())
         return [str(name) for name in parsed.get("categoryNames", [])]
 
     except Exception as e:
         print(f"⚠️ Error extracting categories for transcript {transcript_idx}: {e}")
+        report_row_error()
         return []
 
 
+# -------------------------------
+# Helper: Dataset-wide category name normalization
+# -------------------------------
+def _normalize_category_key(name: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace so spelling variants share a key."""
+    key = re.sub(r"[^\w\s]", " ", str(name).lower())
+    key = re.sub(r"\s+", " ", key).strip()
+    return re.sub(r"^(the|a|an) ", "", key)
+
+
+def _build_category_index(category_lists: List[List[str]]) -> Dict[str, str]:
+    """
+    Map every normalized key to one canonical display name: the most frequent
+    surface form across the whole dataset (first seen wins ties).
+    """
+    surface_forms: Dict[str, Counter] = {}
+    for categories in category_lists:
+        for name in categories:
+            key = _normalize_category_key(name)
+            if key:
+                surface_forms.setdefault(key, Counter())[name.strip()] += 1
+    return {key: forms.most_common(1)[0][0] for key, forms in surface_forms.items()}
+
+
+def _canonicalize(categories: List[str], index: Dict[str, str]) -> List[str]:
+    """Replace names with their canonical form and drop duplicates, keeping first-mention order."""
+    seen, result = set(), []
+    for name in categories:
+        key = _normalize_category_key(name)
+        if key and key not in seen:
+            seen.add(key)
+            result.append(index[key])
+    return result
+
+
 # -------------------------------
 # Main function (returns DataFrame)
 # -------------------------------
@@ -62,29 +97,83 @@ def category_extractor(df: pd.DataFrame,
                        transcript_column: str,
                        context_prompt: str,
                        target_column: str = "category_list",
-                       max_workers: int = 8) -> pd.DataFrame:
+                       max_workers: int = 8,
+                       window_tokens: int = 6000,
+                       overlap_tokens: int = 200,
+                       dedupe_threshold: Optional[float] = None) -> pd.DataFrame:
     """
     Extracts category names from each transcript and adds a column containing
     the list of categories found per transcript.
+
+    Long transcripts are split into overlapping token windows; all windows of
+    all transcripts are extracted in parallel, then merged per transcript and
+    canonicalized through a normalization index shared across the dataset.
+    If `dedupe_threshold` is set, near-duplicate transcripts are extracted once.
     Returns a new DataFrame with the added column.
     """
+    if dedupe_threshold:
+        return run_on_representatives(
+            df, transcript_column, dedupe_threshold,
+            lambda rep_df: category_extractor(rep_df, transcript_column, context_prompt, target_column,
+                                              max_workers, window_tokens, overlap_tokens)
+        )
 
     print(f"🚀 Starting category extraction for {len(df)} transcripts...")
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [
-            executor.submit(
-                _extract_category_names_from_transcript,
-                str(row[transcript_column]),
-                context_prompt,
-                idx + 1
-            )
-            for idx, row in df.iterrows()
-        ]
+    texts = df[transcript_column].astype(str).to_numpy()
+    windows_per_row = [
+        split_text_into_token_windows(text, window_tokens, overlap_tokens)
+        for text in texts
+    ]
+
+    # One task per window, so the windows of a long transcript run concurrently
+    task_rows, task_windows, task_parts = [], [], []
+    for position, windows in enumerate(windows_per_row):
+        for window_idx, window in enumerate(windows):
+            task_rows.append(position)
+            task_windows.append(window)
+            task_parts.append(f"{window_idx + 1} of {len(windows)}" if len(windows) > 1 else None)
 
-        results = [future.result() for future in futures]
+    windows_column = np.empty(len(task_windows), dtype=object)
+    windows_column[:] = task_windows
+    outputs = fan_out_rows(
+        lambda task: {"categories": _extract_category_names_from_transcript(
+            task["window"], context_prompt, task["row"] + 1, task["part"]
+        )},
+        {
+            "row": np.array(task_rows, dtype=np.int64),
+            "window": windows_column,
+            "part": np.array(task_parts, dtype=object),
+        },
+        ["categories"],
+        max_workers=max_workers,
+        costs=estimate_row_costs(windows_column),
+        label=target_column,
+    )
+
+    # A window skipped by cancellation leaves its transcript None; the others keep their categories
+    raw_results: List[Optional[List[str]]] = [[] for _ in windows_per_row]
+    for position, categories in zip(task_rows, outputs["categories"]):
+        if categories is None:
+            raw_results[position] = None
+        elif raw_results[position] is not None:
+            raw_results[position].extend(categories)
+
+    extracted = [categories for categories in raw_results if categories is not None]
+    index = _build_category_index(extracted)
+    results = [None if categories is None else _canonicalize(categories, index) for categories in raw_results]
+
+    split_rows = sum(1 for windows in windows_per_row if len(windows) > 1)
+    log_step_stats(
+        extraction_requests=len(task_rows),
+        transcripts_split=split_rows,
+        raw_category_mentions=sum(len(categories) for categories in extracted),
+        distinct_categories=len(index),
+    )
 
+    df = df.copy()
     df[target_column] = results
-    print(f"✅ Completed category extraction — added column: '{target_column}'")
+    print(f"✅ Completed category extraction — added column: '{target_column}' "
+          f"({len(task_rows)} windows, {split_rows} long transcripts split, {len(index)} distinct categories)")
 
     return df
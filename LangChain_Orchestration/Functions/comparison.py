@@ -5,6 +5,8 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from client import client
+from Functions.prompts import layout_messages
+from Functions.run_context import record_usage
 
 
 # -------------------------------
@@ -41,19 +43,13 @@ def comparison(df,
     # Build prompt with all groups
     group_prompt = "\n\n".join([f"Group {gv}:\n{text}" for gv, text in grouped_texts.items()])
 
-    messages = [
-        {
-            "role": "system", 
-            "content": "You are an AI assistant that compares and contrasts groups. Respond ONLY in structured JSON."
-        },
-        {
-            "role": "user", 
-            "content": f"""
+    messages = layout_messages(
+        instructions="You are an AI assistant that compares and contrasts groups. Respond ONLY in structured JSON.",
+        document=group_prompt,
+        document_label="Here are the groups and their contents",
+        task=f"""
         Context: {context_prompt}
 
-        Here are the groups and their contents:
-        {group_prompt}
-
         For each group, provide:
         1. comparison: how it is similar to other groups
         2. contrast: how it differs from other groups
@@ -68,8 +64,8 @@ def comparison(df,
                 }}
             ]
         }}
-        """}
-    ]
+        """,
+    )
     
     class GroupOutput(BaseModel):
         group_value: str
@@ -84,6 +80,7 @@ def comparison(df,
         input=messages, 
         text_format=AllGroups
     )
+    record_usage(response)
 
     parsed = response.output_parsed
     
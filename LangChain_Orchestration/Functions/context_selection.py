@@ -0,0 +1,122 @@
+# context_selection.py
+import math
+import re
+from collections import Counter
+from typing import List
+import pandas as pd
+from Functions.run_context import append_step_stat
+from Functions.token_based_splitter import count_tokens
+
+# Raw [Agent]/[Customer] tags, or the "A:"/"C:" line prefixes written by transcript_compactor
+_SPEAKER_MARKER = re.compile(r"(?=\[(?:Agent|Customer)\])|(?<=\n)(?=[AC]: )")
+_WORD = re.compile(r"[a-z0-9']+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "did", "do", "does", "for", "from",
+    "had", "has", "have", "how", "i", "if", "in", "is", "it", "of", "on", "or", "so", "that",
+    "the", "their", "there", "they", "this", "to", "was", "were", "what", "when", "which",
+    "who", "will", "with", "you", "your",
+}
+
+
+def _tokenize(text: str) -> List[str]:
+    return [w for w in _WORD.findall(text.lower()) if w not in _STOPWORDS]
+
+
+def split_speaker_turns(transcript: str) -> List[str]:
+    """Split a transcript on its speaker markers, one string per turn."""
+    return [turn.strip() for turn in _SPEAKER_MARKER.split(transcript) if turn.strip()]
+
+
+def build_turn_windows(transcript: str, turns_per_window: int = 4) -> List[str]:
+    """Group consecutive speaker turns into fixed-size windows."""
+    turns = split_speaker_turns(transcript)
+    return [" ".join(turns[i:i + turns_per_window]) for i in range(0, len(turns), turns_per_window)]
+
+
+class BM25:
+    """Minimal Okapi BM25 over a small in-memory corpus of pre-tokenized documents."""
+
+    def __init__(self, documents: List[List[str]], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_freqs = [Counter(doc) for doc in documents]
+        self.doc_lens = [len(doc) for doc in documents]
+        self.avg_len = (sum(self.doc_lens) / len(documents)) if documents else 0.0
+        df = Counter(term for doc in documents for term in set(doc))
+        n = len(documents)
+        self.idf = {term: math.log(1 + (n - freq + 0.5) / (freq + 0.5)) for term, freq in df.items()}
+
+    def scores(self, query: List[str]) -> List[float]:
+        results = []
+        for freqs, length in zip(self.doc_freqs, self.doc_lens):
+            norm = self.k1 * (1 - self.b + self.b * length / self.avg_len) if self.avg_len else self.k1
+            score = 0.0
+            for term in query:
+                tf = freqs.get(term, 0)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            results.append(score)
+        return results
+
+
+def select_relevant_context(transcript: str,
+                            query: str,
+                            token_budget: int,
+                            turns_per_window: int = 4,
+                            model: str = "gpt-5-mini") -> str:
+    """
+    Keep only the speaker-turn windows that best match `query` (BM25) and fit in
+    `token_budget`, in their original order. Transcripts that already fit are
+    returned unchanged.
+    """
+    if not isinstance(transcript, str) or count_tokens(transcript, model) <= token_budget:
+        return transcript
+
+    windows = build_turn_windows(transcript, turns_per_window)
+    if len(windows) <= 1:
+        return transcript
+
+    scores = BM25([_tokenize(w) for w in windows]).scores(_tokenize(query))
+    ranked = sorted(range(len(windows)), key=lambda i: -scores[i])
+
+    selected, used = [], 0
+    for i in ranked:
+        window_tokens = count_tokens(windows[i], model)
+        if used + window_tokens > token_budget:
+            continue
+        selected.append(i)
+        used += window_tokens
+
+    if not selected:
+        return windows[ranked[0]]
+    return " [...] ".join(windows[i] for i in sorted(selected))
+
+
+def prune_context_column(df: pd.DataFrame,
+                         text_column: str,
+                         query: str,
+                         token_budget: int,
+                         output_col: str = None,
+                         turns_per_window: int = 4,
+                         model: str = "gpt-5-mini") -> pd.Series:
+    """
+    Apply select_relevant_context to every row and write the token reduction
+    to the step log. Returns the pruned text aligned with df.
+    """
+    texts = df[text_column]
+    pruned = texts.map(lambda t: select_relevant_context(t, query, token_budget, turns_per_window, model))
+
+    original_tokens = int(sum(count_tokens(t, model) for t in texts))
+    sent_tokens = int(sum(count_tokens(t, model) for t in pruned))
+    rows_pruned = int((pruned.fillna("") != texts.fillna("")).sum())
+    append_step_stat("context_selection", {
+        "output_col": output_col,
+        "token_budget": token_budget,
+        "rows": len(df),
+        "rows_pruned": rows_pruned,
+        "tokens_original": original_tokens,
+        "tokens_sent": sent_tokens,
+    })
+    print(f"✂️ Context selection for '{output_col}': {rows_pruned}/{len(df)} rows pruned, "
+          f"~{original_tokens} → ~{sent_tokens} transcript tokens.")
+    return pruned
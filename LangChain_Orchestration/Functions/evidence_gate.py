@@ -0,0 +1,72 @@
+# evidence_gate.py
+import re
+import pandas as pd
+from typing import List, Optional
+from Functions.run_context import append_step_stat
+
+
+def build_evidence_pattern(keywords: Optional[List[str]] = None,
+                           patterns: Optional[List[str]] = None) -> Optional[str]:
+    """
+    Combine plain keywords (matched as whole words) and raw regex patterns
+    into one alternation. Returns None when no rules are given.
+    """
+    parts = [rf"\b{re.escape(k.strip())}\b" for k in (keywords or []) if k and k.strip()]
+    parts += [p for p in (patterns or []) if p]
+    if not parts:
+        return None
+    return "|".join(f"(?:{p})" for p in parts)
+
+
+def find_evidence_rows(texts: pd.Series,
+                       keywords: Optional[List[str]] = None,
+                       patterns: Optional[List[str]] = None) -> pd.Series:
+    """
+    Vectorized, case-insensitive check of which rows contain at least one
+    keyword/pattern. Returns an all-True mask when no rules are configured.
+    """
+    pattern = build_evidence_pattern(keywords, patterns)
+    if pattern is None:
+        return pd.Series(True, index=texts.index)
+    return texts.fillna("").astype(str).str.contains(pattern, case=False, regex=True)
+
+
+def gate_rows(df: pd.DataFrame,
+              text_column: str,
+              keywords: Optional[List[str]] = None,
+              patterns: Optional[List[str]] = None,
+              id_column: str = "call_id",
+              output_col: Optional[str] = None,
+              default_label: Optional[str] = None,
+              audit_sample_size: int = 5) -> pd.Series:
+    """
+    Decide which rows need an LLM call. Rows without any evidence are meant to
+    get the default label directly; their count and a small random audit
+    sample are written to the step log.
+
+    Returns:
+        pd.Series: Boolean mask aligned with df, True where the LLM should run.
+    """
+    mask = find_evidence_rows(df[text_column], keywords, patterns)
+    if not (keywords or patterns):
+        return mask
+
+    skipped = df.loc[~mask]
+    sample = skipped.sample(n=min(audit_sample_size, len(skipped)), random_state=0)
+    audit = [
+        {
+            "id": str(row[id_column]) if id_column in skipped.columns else str(idx),
+            "preview": str(row[text_column])[:200],
+        }
+        for idx, row in sample.iterrows()
+    ]
+    append_step_stat("evidence_gate", {
+        "output_col": output_col,
+        "default_label": default_label,
+        "rows": len(df),
+        "skipped": len(skipped),
+        "audit_sample": audit,
+    })
+    print(f"🔎 Evidence gate for '{output_col}': {len(skipped)}/{len(df)} rows have no evidence, "
+          f"assigning '{default_label}' without an LLM call.")
+    return mask
@@ -0,0 +1,175 @@
+# map_reduce.py
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+from Functions.row_executor import estimate_row_costs, fan_out_rows
+from Functions.run_context import append_step_stat
+from Functions.token_based_splitter import split_text_into_token_windows
+
+# Rows above this many tokens are classified window by window (map) and combined (reduce)
+DEFAULT_WINDOW_TOKENS = 100_000
+DEFAULT_OVERLAP_TOKENS = 500
+
+
+def fan_out_windows(row_fn: Callable[[Dict[str, Any]], Dict[str, Any]],
+                    columns: Dict[str, np.ndarray],
+                    text_column: str,
+                    output_keys: List[str],
+                    reduce_fn: Callable[[List[Dict[str, Any]]], Dict[str, Any]],
+                    window_tokens: int = DEFAULT_WINDOW_TOKENS,
+                    overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+                    stop_when: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                    max_workers: int = 8,
+                    positions: Optional[np.ndarray] = None,
+                    fill: Optional[Dict[str, Any]] = None,
+                    costs: Optional[np.ndarray] = None,
+                    label: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """
+    fan_out_rows for text that may not fit in one request.
+
+    Rows whose `text_column` is longer than `window_tokens` are split into
+    overlapping token windows; every window of every row is one task, so the
+    windows of a long row run in parallel. The window results of each row are
+    combined with `reduce_fn` (see any_positive, majority_vote, concatenate).
+    Rows that fit are sent as-is and their result is used unchanged.
+
+    If `stop_when(result)` is true for a window, the row's windows that have
+    not started yet are skipped (e.g. a binary question already answered yes).
+    Rows with a window skipped by cancellation are left None, as in fan_out_rows.
+
+    `costs` may pass precomputed token counts of `text_column` (estimate_row_costs).
+    Returns the same positional output arrays as fan_out_rows.
+    """
+    num_rows = len(columns[text_column])
+    positions = np.arange(num_rows) if positions is None else np.asarray(positions, dtype=np.int64)
+    fill = fill or {}
+    token_counts = estimate_row_costs(columns[text_column]) if costs is None else costs
+
+    # One task per window; rows that fit are a single task
+    task_rows, task_texts, split_rows = [], [], 0
+    for position in positions:
+        text = columns[text_column][position]
+        windows = (
+            split_text_into_token_windows(text, window_tokens, overlap_tokens)
+            if token_counts[position] > window_tokens else [text]
+        )
+        split_rows += len(windows) > 1
+        task_rows.extend([position] * len(windows))
+        task_texts.extend(windows)
+
+    task_rows = np.array(task_rows, dtype=np.int64)
+    if not split_rows:
+        # Nothing to split
+        return fan_out_rows(row_fn, columns, output_keys, max_workers=max_workers, positions=positions,
+                            fill=fill, costs=token_counts, label=label)
+
+    task_columns = {name: values[task_rows] for name, values in columns.items()}
+    texts = np.empty(len(task_texts), dtype=object)
+    texts[:] = task_texts
+    task_columns[text_column] = texts
+    task_columns["_row"] = task_rows
+
+    resolved = set()
+    lock = threading.Lock()
+    skipped = 0
+
+    def run_window(task):
+        nonlocal skipped
+        row = task["_row"]
+        with lock:
+            if row in resolved:
+                skipped += 1
+                return None
+        result = row_fn(task)
+        if stop_when is not None and stop_when(result):
+            with lock:
+                resolved.add(row)
+        return result
+
+    # "ran" stays None for windows the executor skipped because the run was canceled
+    window_outputs = fan_out_rows(
+        lambda task: {"result": run_window(task), "ran": True},
+        task_columns,
+        ["result", "ran"],
+        max_workers=max_workers,
+        costs=estimate_row_costs(texts),
+        label=label,
+    )
+
+    outputs = {}
+    for key in output_keys:
+        outputs[key] = np.empty(num_rows, dtype=object)
+        outputs[key][:] = fill.get(key)
+
+    # Reduce: window results of each row, in window order
+    per_row: Dict[int, List[Dict[str, Any]]] = {}
+    canceled_rows = set()
+    for row, result, ran in zip(task_rows, window_outputs["result"], window_outputs["ran"]):
+        if ran is None:
+            canceled_rows.add(int(row))
+        elif result is not None:
+            per_row.setdefault(int(row), []).append(result)
+    # A row already answered by stop_when is complete even if its other windows were canceled
+    canceled_rows -= {int(row) for row in resolved}
+    for row in canceled_rows:
+        for key in output_keys:
+            outputs[key][row] = None
+    for row, results in per_row.items():
+        if row in canceled_rows:
+            continue
+        combined = results[0] if len(results) == 1 else reduce_fn(results)
+        for key in output_keys:
+            outputs[key][row] = combined.get(key)
+
+    append_step_stat("map_reduce", {
+        "label": label,
+        "window_tokens": window_tokens,
+        "rows_split": split_rows,
+        "window_requests": int(len(task_rows)),
+        "windows_skipped": skipped,
+    })
+    return outputs
+
+
+# -------------------------------
+# Reducers
+# -------------------------------
+def _with_parts(results, key, keep=None):
+    """Join a text field across windows, tagging each with its window number."""
+    parts = [
+        f"[part {i + 1}/{len(results)}] {result.get(key)}"
+        for i, result in enumerate(results)
+        if result.get(key) and (keep is None or keep(result))
+    ]
+    return "\n".join(parts) or None
+
+
+def any_positive(label_key: str, explanation_key: str, positive_label) -> Callable:
+    """Binary: positive if any window is positive; explanations from the positive windows."""
+    def reduce(results):
+        is_positive = lambda result: str(result.get(label_key)) == str(positive_label)
+        if any(is_positive(result) for result in results):
+            return {label_key: positive_label,
+                    explanation_key: _with_parts(results, explanation_key, keep=is_positive)}
+        return {label_key: results[0].get(label_key), explanation_key: _with_parts(results, explanation_key)}
+    return reduce
+
+
+def majority_vote(label_key: str, explanation_key: str, abstain_label=None) -> Callable:
+    """Categorical: most frequent window label (first seen wins ties); `abstain_label` only wins if unanimous."""
+    def reduce(results):
+        votes = Counter(result.get(label_key) for result in results)
+        if abstain_label is not None and len(votes) > 1:
+            votes.pop(abstain_label, None)
+        winner = max(votes, key=votes.get)
+        return {label_key: winner,
+                explanation_key: _with_parts(results, explanation_key, keep=lambda r: r.get(label_key) == winner)}
+    return reduce
+
+
+def concatenate(response_key: str) -> Callable:
+    """Open-ended: the window answers joined in transcript order."""
+    def reduce(results):
+        return {response_key: _with_parts(results, response_key)}
+    return reduce
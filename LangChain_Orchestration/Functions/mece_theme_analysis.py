@@ -1,12 +1,16 @@
+import numpy as np
 import pandas as pd
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from pydantic import BaseModel
 import json
-from concurrent.futures import ThreadPoolExecutor
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 from client import client
+from Functions.prompts import layout_messages
+from Functions.run_context import RunCanceled, cancel_requested, log_step_stats, record_usage, report_row_error
+from Functions.token_based_splitter import count_tokens
+from Functions.row_executor import estimate_row_costs, fan_out_rows, read_columns
 
 # =========================
 # SCHEMAS
@@ -27,50 +31,59 @@ def _make_api_call(messages: List[Dict], model: str = "gpt-4o-mini", max_tokens:
     try:
         response = client.chat.completions.create(
             model=model,
-            input=messages,
+            messages=messages,
             temperature=0,
             response_format={"type": "json_object"}
         )
+        record_usage(response)
         return json.loads(response.choices[0].message.content.strip())
     except Exception as e:
         print(f"API call failed: {e}")
+        report_row_error()
         return {}
 
-def _create_theme_prompt(context_prompt: str, transcript: str) -> tuple[str, str]:
-    """Create system and user prompts for theme generation."""
-    system_prompt = f"""You are an expert at creating MECE categorization frameworks.
-
-Task: {context_prompt}
+def _create_theme_prompt(context_prompt: str, transcript: str) -> List[Dict]:
+    """Create messages for theme generation (fixed instructions, transcript, then task)."""
+    return layout_messages(
+        instructions="""You are an expert at creating MECE categorization frameworks.
 
 Generate 3-10 themes that are:
 - Mutually Exclusive: No overlap
 - Collectively Exhaustive: All content fits
 
-Return JSON: {{"themes": [{{"themeName": "...", "themeDescription": "..."}}], "mece_validation": "..."}}"""
-
-    user_prompt = f"Analyze this transcript and create MECE themes:\n\n{transcript}"
-    
-    return system_prompt, user_prompt
+Return JSON: {"themes": [{"themeName": "...", "themeDescription": "..."}], "mece_validation": "..."}""",
+        document=transcript,
+        task=f"Task: {context_prompt}\n\nAnalyze this transcript and create MECE themes.",
+    )
 
-def _create_classification_prompt(context_prompt: str, themes: List[Theme], transcript: str, single_theme: bool = True) -> tuple[str, str]:
-    """Create prompts for transcript classification."""
+def _create_batch_classification_prompt(context_prompt: str, themes: List[Theme],
+                                       transcripts: List[Tuple[str, str]], single_theme: bool = True) -> List[Dict]:
+    """
+    Create messages that classify several (id, transcript) pairs in one request.
+    The theme list is identical for every batch, so it leads the prompt.
+    """
     themes_text = "\n".join([f"- {t.themeName}: {t.themeDescription}" for t in themes])
     instruction = "Assign exactly ONE theme" if single_theme else "Assign one or more themes"
     
-    system_prompt = f"""Classify transcript using these themes:
+    system_prompt = f"""Classify each transcript using these themes:
 
 {themes_text}
 
 Rules:
-1. {instruction}
+1. {instruction} to every transcript
 2. Use only provided themes
-3. Assign transcript to at least one theme
+3. Assign every transcript to at least one theme
+4. Key each result by the exact transcript id given
 
-Return JSON: {{"classifications": {{"id": ["Theme"]}}}}"""
+Return JSON: {{"classifications": {{"<transcript id>": ["Theme"]}}}}"""
 
-    user_prompt = f"Context: {context_prompt}\n\nTranscript:\n{transcript}"
-    
-    return system_prompt, user_prompt
+    transcripts_text = "\n\n".join([f"### Transcript id: {transcript_id}\n{text}" for transcript_id, text in transcripts])
+    return layout_messages(
+        instructions=system_prompt,
+        document=transcripts_text,
+        task=f"Context: {context_prompt}",
+        document_label="Transcripts",
+    )
 
 # -------------------------------
 # Core Theme Analysis Functions
@@ -79,28 +92,31 @@ def _generate_themes_parallel(dataframe: pd.DataFrame, transcript_column: str, c
     """Generate themes using parallel processing - no batching, each transcript processed individually."""
     def process_single_transcript(row):
         transcript = row[transcript_column]
-        system_prompt, user_prompt = _create_theme_prompt(context_prompt, transcript)
+        response = _make_api_call(_create_theme_prompt(context_prompt, transcript))
         
-        response = _make_api_call([
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ])
-        
-        return [Theme(**theme) for theme in response.get("themes", [])]
+        return {"themes": [Theme(**theme) for theme in response.get("themes", [])]}
     
     print(f"Generating themes from {len(dataframe)} individual transcripts...")
     
     # Process each transcript individually in parallel
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        transcript_results = list(executor.map(process_single_transcript, [row for _, row in dataframe.iterrows()]))
+    columns = read_columns(dataframe, [transcript_column])
+    transcript_results = fan_out_rows(
+        process_single_transcript,
+        columns,
+        ["themes"],
+        max_workers=max_workers,
+        costs=estimate_row_costs(columns[transcript_column]),
+        label="theme_generation",
+    )["themes"]
     
-    # Flatten results
-    all_themes = [theme for transcript_themes in transcript_results for theme in transcript_themes]
+    # Flatten results (transcripts skipped by cancellation have none)
+    all_themes = [theme for transcript_themes in transcript_results if transcript_themes
+                  for theme in transcript_themes]
     
     print(f"Generated {len(all_themes)} total themes from individual transcripts")
     
     # Merge similar themes
-    if len(all_themes) > 1:
+    if len(all_themes) > 1 and not cancel_requested():
         return _merge_themes(all_themes, context_prompt)
     
     return all_themes
@@ -109,57 +125,118 @@ def _merge_themes(themes: List[Theme], context_prompt: str) -> List[Theme]:
     """Merge similar themes semantically."""
     themes_text = "\n".join([f"- {t.themeName}: {t.themeDescription}" for t in themes])
     
-    system_prompt = f"""Merge similar themes while maintaining MECE principles.
+    response = _make_api_call(layout_messages(
+        instructions="""Merge similar themes while maintaining MECE principles.
 
-Task: {context_prompt}
+Merge the given themes into 3-10 final themes.
 
-Merge these themes into 3-10 final themes:
-{themes_text}
-
-Return JSON: {{"themes": [{{"themeName": "...", "themeDescription": "..."}}], "mece_validation": "..."}}"""
-
-    user_prompt = "Create final MECE framework by merging similar themes."
-    
-    response = _make_api_call([
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": user_prompt}
-    ])
+Return JSON: {"themes": [{"themeName": "...", "themeDescription": "..."}], "mece_validation": "..."}""",
+        document=themes_text,
+        task=f"Task: {context_prompt}\n\nCreate final MECE framework by merging similar themes.",
+        document_label="Themes",
+    ))
     
     return [Theme(**theme) for theme in response.get("themes", themes)]
 
+def _pack_transcripts(items: List[Tuple[str, str, int]], batch_token_budget: int,
+                      max_batch_size: int) -> List[List[Tuple[str, str, int]]]:
+    """Greedily pack (id, transcript, tokens) items into batches that fit the token budget."""
+    batches, current, current_tokens = [], [], 0
+    for item in items:
+        tokens = item[2]
+        if current and (current_tokens + tokens > batch_token_budget or len(current) >= max_batch_size):
+            batches.append(current)
+            current, current_tokens = [], 0
+        # A transcript larger than the budget still gets a batch of its own
+        current.append(item)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
 def _classify_transcripts_parallel(dataframe: pd.DataFrame, transcript_column: str, themes: List[Theme], 
                                  context_prompt: str, id_column: str, single_theme: bool = True, 
-                                 max_workers: int = 4) -> Dict[str, List[str]]:
-    """Classify transcripts using parallel processing - no batching, each transcript processed individually."""
-    def process_single_transcript(row):
-        transcript = row[transcript_column]
-        transcript_id = str(row[id_column])
-        system_prompt, user_prompt = _create_classification_prompt(context_prompt, themes, transcript, single_theme)
-        
-        response = _make_api_call([
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ])
-        
-        # Extract classification for this single transcript
+                                 max_workers: int = 4, batch_token_budget: int = 6000,
+                                 max_batch_size: int = 10, max_retries: int = 2) -> Dict[str, List[str]]:
+    """
+    Classify transcripts in token-budgeted batches so the theme list is sent once per batch
+    instead of once per transcript. Ids missing from a response are re-packed and retried.
+    """
+    ids = dataframe[id_column].astype(str).to_numpy()
+    texts = dataframe[transcript_column].fillna("").astype(str).to_numpy()
+    items = [(transcript_id, text, count_tokens(text)) for transcript_id, text in zip(ids, texts)]
+
+    theme_prompt_tokens = count_tokens(_create_batch_classification_prompt(context_prompt, themes, [], single_theme)[0]["content"])
+    transcript_tokens = sum(item[2] for item in items)
+
+    def process_batch(task):
+        batch = task["batch"]
+        response = _make_api_call(_create_batch_classification_prompt(
+            context_prompt, themes, [(transcript_id, text) for transcript_id, text, _ in batch], single_theme
+        ))
         classifications = response.get("classifications", {})
-        # The response should have a single "id" key, but we'll use the actual transcript_id
-        if "id" in classifications:
-            return {transcript_id: classifications["id"]}
-        else:
-            return {transcript_id: ["Unclassified"]}
-    
-    print(f"Classifying {len(dataframe)} individual transcripts...")
-    
-    # Process each transcript individually in parallel
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        transcript_results = list(executor.map(process_single_transcript, [row for _, row in dataframe.iterrows()]))
-    
-    # Merge all classifications
-    all_classifications = {}
-    for transcript_result in transcript_results:
-        all_classifications.update(transcript_result)
-    
+        if not isinstance(classifications, dict):
+            return {"classifications": {}}
+
+        # Keep only ids that were actually sent, with a usable theme list
+        batch_results = {}
+        for transcript_id, _, _ in batch:
+            assigned = classifications.get(transcript_id)
+            if isinstance(assigned, str):
+                assigned = [assigned]
+            if isinstance(assigned, list) and assigned:
+                batch_results[transcript_id] = [str(theme) for theme in assigned]
+        return {"classifications": batch_results}
+
+    all_classifications: Dict[str, List[str]] = {}
+    pending = items
+    num_requests = 0
+    sent_tokens = 0
+    retried = 0
+
+    for attempt in range(max_retries + 1):
+        batches = _pack_transcripts(pending, batch_token_budget, max_batch_size)
+        print(f"Classifying {len(pending)} transcripts in {len(batches)} batches (attempt {attempt + 1})...")
+
+        batch_column = np.empty(len(batches), dtype=object)
+        batch_column[:] = batches
+        batch_costs = np.array([sum(item[2] for item in batch) for batch in batches], dtype=np.float64)
+        batch_results = fan_out_rows(
+            process_batch, {"batch": batch_column}, ["classifications"], max_workers=max_workers,
+            costs=batch_costs, label="theme_classification"
+        )["classifications"]
+
+        num_requests += len(batches)
+        sent_tokens += len(batches) * theme_prompt_tokens + sum(item[2] for item in pending)
+        for result in batch_results:
+            if result is not None:
+                all_classifications.update(result)
+
+        pending = [item for item in pending if item[0] not in all_classifications]
+        if not pending or cancel_requested():
+            break
+        if attempt < max_retries:
+            retried += len(pending)
+            print(f"⚠️ {len(pending)} transcript ids missing from responses, retrying only those...")
+
+    # Ids a canceled run never got to stay unmapped
+    canceled = cancel_requested()
+    if not canceled:
+        for transcript_id, _, _ in pending:
+            all_classifications[transcript_id] = ["Unclassified"]
+
+    unbatched_tokens = len(items) * theme_prompt_tokens + transcript_tokens
+    log_step_stats(
+        classification_requests=num_requests,
+        classification_requests_unbatched=len(items),
+        classification_retried_ids=retried,
+        classification_unclassified_ids=0 if canceled else len(pending),
+        classification_input_tokens=sent_tokens,
+        classification_input_tokens_unbatched=unbatched_tokens,
+    )
+    print(f"Phase 2 used {num_requests} requests instead of {len(items)} "
+          f"(~{sent_tokens} vs ~{unbatched_tokens} input tokens)")
+
     return all_classifications
 
 # -------------------------------
@@ -172,11 +249,14 @@ def mece_theme_analysis(
     id_column: str = None,
     target_column: str = "Theme_Analysis",
     themes_per_transcript: List[int] = [1],
-    max_workers: int = 4
+    max_workers: int = 4,
+    batch_token_budget: int = 6000,
+    max_batch_size: int = 10
 ) -> pd.DataFrame:
     """
-    Optimized MECE theme analysis with parallel processing - no batching.
-    Each transcript is processed individually in parallel.
+    Optimized MECE theme analysis with parallel processing.
+    Themes are generated per transcript; classification packs several
+    transcripts into each token-budgeted request.
     
     Args:
         dataframe: DataFrame with transcript data
@@ -186,6 +266,8 @@ def mece_theme_analysis(
         target_column: Output column name
         themes_per_transcript: 1 for single theme, "multiple" for multiple themes
         max_workers: Number of parallel workers
+        batch_token_budget: Max transcript tokens packed into one classification request
+        max_batch_size: Max transcripts packed into one classification request
     
     Returns:
         DataFrame with themes
@@ -193,10 +275,13 @@ def mece_theme_analysis(
     id_column = id_column or dataframe.columns[0]
     single_theme = themes_per_transcript == 1
     
-    print(f"MECE Analysis: {len(dataframe)} transcripts (no batching, parallel processing)")
+    print(f"MECE Analysis: {len(dataframe)} transcripts (parallel processing)")
     
     # Phase 1: Generate themes
     themes = _generate_themes_parallel(dataframe, transcript_column, context_prompt, max_workers)
+    if cancel_requested():
+        # Themes from part of the transcripts aren't a framework to classify against
+        raise RunCanceled("Canceled while generating themes")
     if not themes:
         return dataframe.assign(**{target_column: "Error: No themes generated"}), MECEThemeAnalysis(
             themes=[], theme_mappings={}
@@ -206,7 +291,8 @@ def mece_theme_analysis(
     
     # Phase 2: Classify transcripts
     theme_mappings = _classify_transcripts_parallel(
-        dataframe, transcript_column, themes, context_prompt, id_column, single_theme, max_workers
+        dataframe, transcript_column, themes, context_prompt, id_column, single_theme, max_workers,
+        batch_token_budget, max_batch_size
     )
     
     # Apply themes to dataframe
@@ -214,11 +300,13 @@ def mece_theme_analysis(
     if single_theme:
         theme_map = {str(id_val): themes[0] if themes else "Unclassified" 
                     for id_val, themes in theme_mappings.items()}
-        result_df[target_column] = result_df[id_column].astype(str).map(theme_map).fillna("Unclassified")
     else:
         theme_map = {str(id_val): ", ".join(themes) if themes else "Unclassified" 
                     for id_val, themes in theme_mappings.items()}
-        result_df[target_column] = result_df[id_column].astype(str).map(theme_map).fillna("Unclassified")
+    mapped = result_df[id_column].astype(str).map(theme_map)
+    # Rows a canceled run didn't classify are left None, like other row functions
+    result_df[target_column] = mapped.astype(object).where(mapped.notna(), None) if cancel_requested() \
+        else mapped.fillna("Unclassified")
     
     return result_df
 
@@ -0,0 +1,154 @@
+# near_duplicates.py
+import hashlib
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Callable, Tuple
+import numpy as np
+import pandas as pd
+from Functions.run_context import append_step_stat
+
+_PRIME = (1 << 31) - 1
+_WORD = re.compile(r"\w+")
+_INDEX_CACHE: "OrderedDict[Tuple, np.ndarray]" = OrderedDict()
+_INDEX_CACHE_SIZE = 16
+_cache_lock = threading.Lock()
+
+
+# -------------------------------
+# MinHash / LSH
+# -------------------------------
+def _shingles(text, shingle_size: int) -> np.ndarray:
+    """Hashed word k-grams of a lowercased text."""
+    words = _WORD.findall(str(text).lower()) if isinstance(text, str) else []
+    if len(words) < shingle_size:
+        grams = [" ".join(words)] if words else []
+    else:
+        grams = [" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)]
+    return np.array([zlib.crc32(g.encode("utf-8")) for g in set(grams)], dtype=np.uint64)
+
+
+def minhash_signatures(texts, num_perm: int = 64, shingle_size: int = 5, seed: int = 0) -> np.ndarray:
+    """MinHash signature matrix of shape (len(texts), num_perm)."""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+
+    signatures = np.full((len(texts), num_perm), _PRIME, dtype=np.uint64)
+    for i, text in enumerate(texts):
+        shingles = _shingles(text, shingle_size) % _PRIME
+        if len(shingles):
+            signatures[i] = ((a[:, None] * shingles[None, :] + b[:, None]) % _PRIME).min(axis=1)
+    return signatures
+
+
+def _choose_bands(num_perm: int, threshold: float) -> int:
+    """Pick the band count whose LSH threshold (1/b)^(1/r) is closest to (and not above) `threshold`."""
+    best_bands, best_gap = 1, float("inf")
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands:
+            continue
+        rows = num_perm // bands
+        lsh_threshold = (1 / bands) ** (1 / rows)
+        gap = threshold - lsh_threshold
+        if 0 <= gap < best_gap:
+            best_bands, best_gap = bands, gap
+    return best_bands
+
+
+def _find(parent: np.ndarray, i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def near_duplicate_representatives(texts: pd.Series,
+                                   threshold: float = 0.9,
+                                   num_perm: int = 64) -> np.ndarray:
+    """
+    For every row, the position of the row representing its near-duplicate
+    cluster (the first row of the cluster). Pairs are found with LSH banding
+    and confirmed when their estimated Jaccard similarity is >= threshold.
+
+    Results are cached per text column content, so several steps over the
+    same dataset column reuse one index.
+    """
+    content_hash = hashlib.sha1(pd.util.hash_pandas_object(texts, index=False).to_numpy().tobytes()).hexdigest()
+    key = (content_hash, threshold, num_perm)
+    with _cache_lock:
+        if key in _INDEX_CACHE:
+            _INDEX_CACHE.move_to_end(key)
+            return _INDEX_CACHE[key]
+
+    signatures = minhash_signatures(texts.to_numpy(), num_perm)
+    bands = _choose_bands(num_perm, threshold)
+    rows = num_perm // bands
+    parent = np.arange(len(texts))
+
+    for band in range(bands):
+        buckets = {}
+        for i, band_sig in enumerate(signatures[:, band * rows:(band + 1) * rows]):
+            buckets.setdefault(band_sig.tobytes(), []).append(i)
+        for members in buckets.values():
+            first = members[0]
+            for other in members[1:]:
+                root_first, root_other = _find(parent, first), _find(parent, other)
+                if root_first == root_other:
+                    continue
+                similarity = float(np.mean(signatures[first] == signatures[other]))
+                if similarity >= threshold:
+                    parent[max(root_first, root_other)] = min(root_first, root_other)
+
+    representatives = np.array([_find(parent, i) for i in range(len(texts))], dtype=np.int64)
+    with _cache_lock:
+        _INDEX_CACHE[key] = representatives
+        if len(_INDEX_CACHE) > _INDEX_CACHE_SIZE:
+            _INDEX_CACHE.popitem(last=False)
+    return representatives
+
+
+# -------------------------------
+# Fan-out helper for per-row steps
+# -------------------------------
+def run_on_representatives(df: pd.DataFrame,
+                           text_column: str,
+                           threshold: float,
+                           fn: Callable[[pd.DataFrame], pd.DataFrame]) -> pd.DataFrame:
+    """
+    Run a per-row step only on one representative per near-duplicate cluster
+    and copy the columns it wrote (added or overwritten) to the other members
+    of the cluster.
+
+    `fn` must return the rows it was given, in the same order, with the new
+    output columns added.
+    """
+    representatives = near_duplicate_representatives(df[text_column], threshold)
+    rep_positions = np.unique(representatives)
+    saved = len(df) - len(rep_positions)
+
+    append_step_stat("near_duplicates", {
+        "text_column": text_column,
+        "threshold": threshold,
+        "rows": len(df),
+        "clusters": int(len(rep_positions)),
+        "calls_saved": int(saved),
+    })
+    print(f"🧬 Near-duplicate index on '{text_column}': {len(rep_positions)} clusters for {len(df)} rows "
+          f"({saved} rows reuse a representative's result).")
+
+    if saved == 0:
+        return fn(df)
+
+    rep_df = df.iloc[rep_positions]
+    result = fn(rep_df)
+    # Columns the step wrote: new ones, and existing ones it overwrote with other values
+    written = [c for c in result.columns if c not in df.columns
+               or not result[c].reset_index(drop=True).equals(rep_df[c].reset_index(drop=True))]
+    lookup = np.searchsorted(rep_positions, representatives)
+
+    out = df.copy()
+    for column in written:
+        out[column] = result[column].to_numpy()[lookup]
+    return out
@@ -1,41 +1,40 @@
 import pandas as pd
 from pydantic import BaseModel
-from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 from client import client
+from Functions.context_selection import prune_context_column
+from Functions.map_reduce import DEFAULT_OVERLAP_TOKENS, DEFAULT_WINDOW_TOKENS, concatenate, fan_out_windows
+from Functions.near_duplicates import run_on_representatives
+from Functions.prompts import layout_messages
+from Functions.run_context import record_usage, report_row_error
+from Functions.row_executor import read_columns
 
 
 # -------------------------------
 # Schema for structured output
 # -------------------------------
 class OpenEnded(BaseModel):
-    call_id: str
     open_response: str
 
 
 # -------------------------------
 # Helper for one row
 # -------------------------------
-def process_row_open_ended(row, context_prompt, input_data, client):
-    call_id = row["call_id"]
+def process_row_open_ended(row, context_prompt, input_data, client, id_column="call_id"):
+    call_id = str(row[id_column])
     transcript = row[input_data]
-    messages = [
-        {
-            "role": "system",
-            "content": "You are an assistant answering open-ended questions about sales calls. Return JSON only.",
-        },
-        {
-            "role": "user",
-            "content": f"""
+    messages = layout_messages(
+        instructions="You are an assistant answering open-ended questions about sales calls. Return JSON only.",
+        document=transcript,
+        task=f"""
             Question: {context_prompt}
-            Transcript: {transcript}
 
             Respond with:
             {{
                 "open_response": "1–2 sentences answering the question based on transcript"
             }}
             """,
-        },
-    ]
+    )
     try:
         response = client.responses.parse(
             model="gpt-5-mini",
@@ -43,11 +42,12 @@ def process_row_open_ended(row, context_prompt, input_data, client):
             text_format=OpenEnded,
             temperature=0,
         )
+        record_usage(response)
         parsed = response.output_parsed
-        parsed.call_id = call_id
     except Exception as e:
         print(f"Failed to parse {call_id}: {e}")
-        parsed = OpenEnded(call_id=call_id, open_response="No answer found")
+        report_row_error()
+        parsed = OpenEnded(open_response="No answer found")
 
     return parsed.model_dump()
 
@@ -59,19 +59,49 @@ def open_classification(df,
                         context_prompt: str,
                         input_data="call_text",
                         response_col="open_response",
-                        max_workers=8) -> pd.DataFrame:
+                        max_workers=8,
+                        context_token_budget: Optional[int] = None,
+                        dedupe_threshold: Optional[float] = None,
+                        id_column: str = "call_id",
+                        window_tokens: int = DEFAULT_WINDOW_TOKENS,
+                        overlap_tokens: int = DEFAULT_OVERLAP_TOKENS) -> pd.DataFrame:
     """
     Runs an open-ended question classifier across the dataframe.
     Returns the same dataframe with one new column (response_col).
+
+    If `context_token_budget` is set, long transcripts are reduced to the
+    speaker-turn windows that best match the question (BM25) within that budget.
+    If `dedupe_threshold` is set, near-duplicate transcripts are answered once
+    and the answer is copied to the rest of their cluster.
+    Transcripts longer than `window_tokens` are answered per window and the
+    window answers are concatenated in transcript order.
     """
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [
-            executor.submit(process_row_open_ended, row, context_prompt, input_data, client)
-            for _, row in df.iterrows()
-        ]
-        results = [future.result() for future in futures]
+    if dedupe_threshold:
+        return run_on_representatives(
+            df, input_data, dedupe_threshold,
+            lambda rep_df: open_classification(rep_df, context_prompt, input_data, response_col,
+                                               max_workers, context_token_budget, id_column=id_column,
+                                               window_tokens=window_tokens, overlap_tokens=overlap_tokens)
+        )
+
+    columns = read_columns(df, [id_column, input_data])
+    if context_token_budget:
+        columns[input_data] = prune_context_column(
+            df, input_data, context_prompt, context_token_budget, output_col=response_col
+        ).to_numpy()
 
-    results_df = pd.DataFrame(results)
-    results_df = results_df.rename(columns={"open_response": response_col})
+    outputs = fan_out_windows(
+        lambda row: process_row_open_ended(row, context_prompt, input_data, client, id_column),
+        columns,
+        input_data,
+        ["open_response"],
+        concatenate("open_response"),
+        window_tokens=window_tokens,
+        overlap_tokens=overlap_tokens,
+        max_workers=max_workers,
+        label=response_col,
+    )
 
-    return df.merge(results_df, on="call_id", how="left")
+    df = df.copy()
+    df[response_col] = outputs["open_response"]
+    return df
@@ -0,0 +1,178 @@
+# output_modes.py
+from functools import lru_cache
+from typing import Callable, Dict, Literal, Optional, Tuple
+import numpy as np
+from pydantic import BaseModel, create_model
+from Functions.map_reduce import DEFAULT_OVERLAP_TOKENS, DEFAULT_WINDOW_TOKENS, concatenate, fan_out_windows
+from Functions.prompts import layout_messages
+from Functions.run_context import append_step_stat, record_usage, report_row_error
+
+EXPLANATION_POLICIES = ("all", "none", "sample", "changed")
+
+
+def as_bool(value, default: bool = True) -> bool:
+    """Read a flag that may arrive from a graph/JSON as a bool, a string ("false", "0", "no") or None."""
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() not in ("false", "0", "no", "off", "")
+    return bool(value)
+
+
+def resolve_explanation_policy(include_explanation=True,
+                               explanation_policy: Optional[str] = None,
+                               previous_label_col: Optional[str] = None) -> str:
+    """
+    Decide which rows get an explanation:
+    - "all":     every classified row (default)
+    - "none":    no row (include_explanation=False)
+    - "sample":  a random audit sample of classified rows
+    - "changed": only rows whose label differs from `previous_label_col`; the
+                 explanation justifies the label already chosen (justify_labels)
+    """
+    policy = explanation_policy or ("all" if as_bool(include_explanation) else "none")
+    if policy not in EXPLANATION_POLICIES:
+        raise ValueError(f"Unknown explanation_policy '{policy}'. Expected one of {EXPLANATION_POLICIES}.")
+    if policy == "changed" and not previous_label_col:
+        raise ValueError("explanation_policy 'changed' requires previous_label_col.")
+    return policy
+
+
+# -------------------------------
+# Compact response schemas
+# -------------------------------
+@lru_cache(maxsize=None)
+def enum_label_schema(labels: Tuple[str, ...], with_explanation: bool):
+    """Schema whose only required output is one of `labels` (no echoed ids)."""
+    fields = {"label": (Literal[labels], ...)}
+    if with_explanation:
+        fields["explanation"] = (str, ...)
+    return create_model("CompactLabel", **fields)
+
+
+@lru_cache(maxsize=None)
+def index_label_schema(num_labels: int, with_explanation: bool):
+    """Schema whose label is the index of a class in a numbered list."""
+    return enum_label_schema(tuple(range(num_labels)), with_explanation)
+
+
+def numbered_options(labels) -> str:
+    return "\n".join(f"{i}: {label}" for i, label in enumerate(labels))
+
+
+class LabelJustification(BaseModel):
+    explanation: str
+
+
+# -------------------------------
+# Explanation policies
+# -------------------------------
+def classify_with_explanations(classify: Callable[[np.ndarray, np.ndarray], Dict[str, np.ndarray]],
+                               num_rows: int,
+                               positions: np.ndarray,
+                               policy: str,
+                               label_key: str,
+                               explanation_key: str,
+                               sample_size: int = 20,
+                               previous_labels: Optional[np.ndarray] = None,
+                               justify: Optional[Callable[[np.ndarray, np.ndarray], np.ndarray]] = None,
+                               output_col: Optional[str] = None,
+                               seed: int = 0) -> Dict[str, np.ndarray]:
+    """
+    Run `classify(positions, explain)` so explanations are generated only for
+    the rows the policy selects; all other rows get a label-only request.
+
+    For "changed", every row is labeled without an explanation, then
+    `justify(changed_positions, labels)` explains the chosen label of rows
+    whose label differs from `previous_labels` (see justify_labels); it never
+    changes a label. A summary is written to the step log.
+    """
+    explain = np.zeros(num_rows, dtype=bool)
+    if policy == "all":
+        explain[positions] = True
+    elif policy == "sample" and len(positions):
+        rng = np.random.default_rng(seed)
+        explain[rng.choice(positions, size=min(sample_size, len(positions)), replace=False)] = True
+
+    outputs = classify(positions, explain)
+
+    if policy == "changed":
+        labels = outputs[label_key]
+        # Rows left unlabeled by a canceled run have nothing to explain
+        changed = positions[np.array([labels[p] is not None and str(labels[p]) != str(previous_labels[p])
+                                      for p in positions], dtype=bool)]
+        explain[changed] = True
+        if len(changed):
+            outputs[explanation_key][changed] = justify(changed, labels)[changed]
+
+    append_step_stat("explanations", {
+        "output_col": output_col,
+        "policy": policy,
+        "rows_labeled": int(len(positions)),
+        "rows_explained": int(explain.sum()),
+    })
+    return outputs
+
+
+def _justify_label_row(row, text_column, context_prompt, client, id_column="call_id"):
+    """Explain the label in `row["label"]` from the transcript, without re-deciding it."""
+    messages = layout_messages(
+        instructions="""
+            You explain classification decisions. The label has already been chosen:
+            do not change or question it, cite the evidence in the transcript that supports it.
+            Always respond with valid JSON.
+            """,
+        document=row[text_column],
+        task=f"""
+            Question: {context_prompt}
+            Chosen label: {row["label"]}
+
+            Respond ONLY as JSON:
+            {{ "explanation": "Reasoning citing evidence from the transcript" }}
+            """,
+    )
+    try:
+        response = client.responses.parse(
+            model="gpt-5-mini",
+            input=messages,
+            text_format=LabelJustification,
+            temperature=1.0,
+        )
+        record_usage(response)
+        return {"explanation": response.output_parsed.explanation}
+    except Exception as e:
+        print(f"Failed to explain {row[id_column]}: {e}")
+        report_row_error()
+        return {"explanation": "No explanation found"}
+
+
+def justify_labels(columns: Dict[str, np.ndarray],
+                   text_column: str,
+                   context_prompt: str,
+                   labels: np.ndarray,
+                   positions: np.ndarray,
+                   client,
+                   id_column: str = "call_id",
+                   window_tokens: int = DEFAULT_WINDOW_TOKENS,
+                   overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+                   max_workers: int = 8,
+                   costs: Optional[np.ndarray] = None,
+                   label: Optional[str] = None) -> np.ndarray:
+    """
+    One explanation per row in `positions` for the label it already has
+    (`labels`, aligned with `columns`); long transcripts are explained per
+    window and the parts joined. Used as the `justify` of the "changed" policy.
+    """
+    return fan_out_windows(
+        lambda row: _justify_label_row(row, text_column, context_prompt, client, id_column),
+        {**columns, "label": labels},
+        text_column,
+        ["explanation"],
+        concatenate("explanation"),
+        window_tokens=window_tokens,
+        overlap_tokens=overlap_tokens,
+        max_workers=max_workers,
+        positions=positions,
+        costs=costs,
+        label=f"{label}_justification" if label else "justification",
+    )["explanation"]
@@ -0,0 +1,33 @@
+# prompts.py
+import textwrap
+from typing import Dict, List, Optional
+
+
+def _clean(text: str) -> str:
+    return textwrap.dedent(text).strip()
+
+
+def layout_messages(instructions: str,
+                    document: Optional[str] = None,
+                    task: Optional[str] = None,
+                    document_label: str = "Transcript") -> List[Dict[str, str]]:
+    """
+    Build chat messages ordered from most to least stable so provider prompt
+    caching can reuse the longest possible prefix:
+
+    1. system: fixed instructions for the function (identical for every row)
+    2. user:   the document, shared by every question asked about it
+    3. user:   the row/question-specific task and response format, last
+
+    Keep anything that varies per question (the question itself, labels,
+    class lists, ids) in `task`, never in `instructions`.
+    """
+    user_parts = []
+    if document is not None:
+        user_parts.append(f"{document_label}:\n{document}")
+    if task:
+        user_parts.append(_clean(task))
+    return [
+        {"role": "system", "content": _clean(instructions)},
+        {"role": "user", "content": "\n\n".join(user_parts)},
+    ]
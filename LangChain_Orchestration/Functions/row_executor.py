@@ -0,0 +1,172 @@
+# row_executor.py
+import contextvars
+import heapq
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import numpy as np
+import pandas as pd
+import tiktoken
+from Functions.run_context import append_step_stat, current_cancel_token, current_progress
+
+# How often a waiting fan-out re-checks for cancellation with policy "abort"
+_CANCEL_POLL_SECONDS = 0.5
+# Result placeholder for rows that were not run because the run was canceled
+_SKIPPED = object()
+
+
+def read_columns(df: pd.DataFrame, columns: Iterable[str]) -> Dict[str, np.ndarray]:
+    """Read the columns a per-row function needs as plain arrays (no per-row Series objects)."""
+    return {column: df[column].to_numpy() for column in dict.fromkeys(columns)}
+
+
+def estimate_row_costs(texts: np.ndarray, model: str = "gpt-5-mini") -> np.ndarray:
+    """Token count per row (tiktoken), used as the cost estimate for scheduling."""
+    encoding = tiktoken.encoding_for_model(model)
+    strings = [t if isinstance(t, str) else "" for t in texts]
+    return np.array([len(tokens) for tokens in encoding.encode_ordinary_batch(strings)], dtype=np.float64)
+
+
+def _predicted_makespan(costs: np.ndarray, num_workers: int) -> float:
+    """Makespan of greedily handing tasks, in order, to the least-loaded worker."""
+    loads = [0.0] * max(1, min(num_workers, len(costs)))
+    for cost in costs:
+        heapq.heappush(loads, heapq.heappop(loads) + float(cost))
+    return max(loads) if len(costs) else 0.0
+
+
+def fan_out_rows(row_fn: Callable[[Dict[str, Any]], Dict[str, Any]],
+                 columns: Dict[str, np.ndarray],
+                 output_keys: List[str],
+                 max_workers: int = 8,
+                 positions: Optional[np.ndarray] = None,
+                 fill: Optional[Dict[str, Any]] = None,
+                 costs: Optional[np.ndarray] = None,
+                 label: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """
+    Shared fan-out engine for per-row LLM calls.
+
+    Each selected row is passed to `row_fn` as a plain dict of the given
+    columns. Results stream back in submission order and are written
+    positionally into preallocated output arrays, so callers can assign them
+    straight onto their DataFrame without a merge.
+
+    When `costs` are given (e.g. estimate_row_costs), rows are submitted
+    longest first so one huge request doesn't run alone at the end; outputs
+    still come back in original row order. Predicted and achieved makespan
+    are written to the step log.
+
+    If the run is canceled (see run_context.CancelToken), rows that have not
+    started are skipped and keep None; rows in flight finish or are abandoned
+    according to the token's policy. Completed rows are always returned.
+    Row counts are reported to the run's RunProgress, if any.
+
+    Args:
+        row_fn: Called once per row with {column: value}; returns a dict.
+        columns: Equal-length arrays keyed by column name (see read_columns).
+        output_keys: Keys of the row_fn result to collect.
+        max_workers: Thread pool size.
+        positions: Optional row positions to run; other rows keep `fill`.
+        fill: Optional default value per output key for rows that are not run.
+        costs: Optional estimated cost per row (aligned with columns) for scheduling.
+        label: Optional name for this fan-out in the step log.
+
+    Returns:
+        Dict[str, np.ndarray]: One object array per output key, aligned with the input rows.
+    """
+    num_rows = len(next(iter(columns.values()))) if columns else 0
+    positions = np.arange(num_rows) if positions is None else np.asarray(positions, dtype=np.int64)
+    fill = fill or {}
+
+    outputs = {}
+    for key in output_keys:
+        outputs[key] = np.empty(num_rows, dtype=object)
+        outputs[key][:] = fill.get(key)
+
+    if len(positions) == 0:
+        return outputs
+
+    if costs is not None:
+        costs = np.asarray(costs, dtype=np.float64)
+        # Longest first; stable so equal-cost rows keep their original order
+        positions = positions[np.argsort(-costs[positions], kind="stable")]
+
+    names = list(columns)
+    # Run each row in a copy of the caller's context so step stats reach the current step
+    parent_context = contextvars.copy_context()
+    cancel_token = current_cancel_token()
+    progress = current_progress()
+    if progress is not None:
+        progress.add_total(len(positions))
+    durations = np.zeros(num_rows)
+
+    def run(position):
+        if cancel_token is not None and cancel_token.is_canceled():
+            return _SKIPPED
+        row = {name: columns[name][position] for name in names}
+        started = time.perf_counter()
+        result = parent_context.copy().run(row_fn, row)
+        durations[position] = time.perf_counter() - started
+        return result
+
+    started = time.perf_counter()
+    completed = 0
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = [executor.submit(run, position) for position in positions]
+        for position, future in zip(positions, futures):
+            result = _wait_for_row(future, cancel_token)
+            completed += result is not _SKIPPED
+            if progress is not None and result is not _SKIPPED:
+                progress.row_done()
+            for key in output_keys:
+                # Rows skipped by a cancel stay empty rather than taking `fill`
+                outputs[key][position] = None if result is _SKIPPED else result.get(key)
+    finally:
+        # On abort, don't wait for abandoned requests; otherwise all rows are already done
+        executor.shutdown(wait=not (cancel_token and cancel_token.aborts_in_flight()), cancel_futures=True)
+    achieved = time.perf_counter() - started
+
+    if cancel_token is not None and cancel_token.is_canceled():
+        append_step_stat("cancellation", {
+            "label": label,
+            "policy": cancel_token.policy,
+            "rows_completed": completed,
+            "rows_not_run": int(len(positions) - completed),
+        })
+    elif costs is not None:
+        _log_schedule(label, costs, positions, durations, max_workers, achieved)
+    return outputs
+
+
+def _wait_for_row(future, cancel_token):
+    """Result of one row, or _SKIPPED if the run was canceled with policy "abort" before it finished."""
+    if cancel_token is None:
+        return future.result()
+    while True:
+        if cancel_token.aborts_in_flight() and not future.done():
+            return _SKIPPED
+        try:
+            return future.result(timeout=_CANCEL_POLL_SECONDS)
+        except FutureTimeout:
+            continue
+
+
+def _log_schedule(label, costs, positions, durations, max_workers, achieved):
+    """Report predicted (cost-model) vs. achieved makespan for one fan-out."""
+    scheduled_costs = costs[positions]
+    original_costs = costs[np.sort(positions)]
+    # Calibrate cost units to seconds with the measured per-row durations
+    total_cost = scheduled_costs.sum()
+    seconds_per_cost = durations[positions].sum() / total_cost if total_cost else 0.0
+
+    predicted = _predicted_makespan(scheduled_costs, max_workers) * seconds_per_cost
+    predicted_in_order = _predicted_makespan(original_costs, max_workers) * seconds_per_cost
+    append_step_stat("scheduling", {
+        "label": label,
+        "rows": int(len(positions)),
+        "workers": max_workers,
+        "predicted_makespan_s": round(float(predicted), 2),
+        "predicted_makespan_in_row_order_s": round(float(predicted_in_order), 2),
+        "achieved_makespan_s": round(achieved, 2),
+    })
@@ -0,0 +1,235 @@
+# run_context.py
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+
+# -------------------------------
+# Per-step stats collected into the execution log
+# -------------------------------
+class StepStats:
+    """Thread-safe bag of metrics that a function reports for the current step."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[str, Any] = {}
+
+    def update(self, **values):
+        with self._lock:
+            self._data.update(values)
+
+    def append(self, key: str, value: Any):
+        with self._lock:
+            self._data.setdefault(key, []).append(value)
+
+    def increment(self, **counts):
+        with self._lock:
+            for key, value in counts.items():
+                self._data[key] = self._data.get(key, 0) + value
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._data)
+
+
+_current_stats: ContextVar[Optional[StepStats]] = ContextVar("step_stats", default=None)
+
+
+@contextmanager
+def collect_step_stats():
+    """
+    Collect stats reported by the function running inside this block.
+    The compiler wraps every step in this so functions can report metrics
+    without changing their return type.
+    """
+    stats = StepStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+def log_step_stats(**values):
+    """Record metrics for the current step (no-op outside of a compiler run)."""
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.update(**values)
+
+
+def increment_step_stats(**counts):
+    """Add to counters for the current step (no-op outside of a compiler run)."""
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.increment(**counts)
+
+
+def append_step_stat(key: str, value: Any):
+    """Append one entry to a list-valued stat, e.g. one record per question (no-op outside of a compiler run)."""
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.append(key, value)
+
+
+def record_usage(response):
+    """
+    Add one LLM response's token usage to the current step, including the
+    input tokens served from the provider's prompt cache. Works with both
+    Responses API and Chat Completions usage objects.
+    """
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    input_tokens = getattr(usage, "input_tokens", None)
+    if input_tokens is None:
+        input_tokens = getattr(usage, "prompt_tokens", 0)
+    output_tokens = getattr(usage, "output_tokens", None)
+    if output_tokens is None:
+        output_tokens = getattr(usage, "completion_tokens", 0)
+    details = getattr(usage, "input_tokens_details", None) or getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", 0) if details is not None else 0
+
+    increment_step_stats(
+        llm_requests=1,
+        input_tokens=input_tokens or 0,
+        cached_input_tokens=cached_tokens or 0,
+        output_tokens=output_tokens or 0,
+    )
+
+
+# -------------------------------
+# Cooperative cancellation
+# -------------------------------
+class RunCanceled(Exception):
+    """
+    Raised by a step that can't produce an output from the rows a canceled
+    run finished (e.g. themes from part of the transcripts); the compiler
+    then drops that step's output. Any other exception is a real error.
+    """
+
+
+class CancelToken:
+    """
+    Set by the runner when a run is canceled; checked by the per-row executor.
+
+    policy "finish": requests already sent are allowed to complete and keep their results.
+    policy "abort":  in-flight requests are abandoned and their rows are left empty.
+    """
+
+    POLICIES = ("finish", "abort")
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.policy = "finish"
+
+    def cancel(self, policy: Optional[str] = None):
+        if policy is not None:
+            if policy not in self.POLICIES:
+                raise ValueError(f"Unknown cancel policy '{policy}'. Expected one of {self.POLICIES}.")
+            self.policy = policy
+        self._event.set()
+
+    def is_canceled(self) -> bool:
+        return self._event.is_set()
+
+    def aborts_in_flight(self) -> bool:
+        return self._event.is_set() and self.policy == "abort"
+
+
+_current_cancel: ContextVar[Optional[CancelToken]] = ContextVar("cancel_token", default=None)
+
+
+@contextmanager
+def cancellation(cancel_token: Optional[CancelToken]):
+    """Make `cancel_token` visible to every function (and row thread) run inside this block."""
+    token = _current_cancel.set(cancel_token)
+    try:
+        yield cancel_token
+    finally:
+        _current_cancel.reset(token)
+
+
+def current_cancel_token() -> Optional[CancelToken]:
+    return _current_cancel.get()
+
+
+def cancel_requested() -> bool:
+    """True once the current run has been canceled (always False outside of a run)."""
+    cancel_token = _current_cancel.get()
+    return cancel_token is not None and cancel_token.is_canceled()
+
+
+# -------------------------------
+# Run progress
+# -------------------------------
+class RunProgress:
+    """
+    Live progress of one run: current step, rows processed/total (summed over
+    the step's fan-outs), errors, throughput and ETA. Row threads update it in
+    memory; the runner reads snapshots and persists them on its own schedule.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = 0
+        self._state: Dict[str, Any] = {"step_idx": 0, "of": 0, "function": None,
+                                       "processed": 0, "total": 0, "errors": 0}
+        self._step_started: Optional[float] = None
+
+    def start_step(self, step_idx: int, of: int, function: str):
+        with self._lock:
+            self._state.update(step_idx=step_idx, of=of, function=function, processed=0, total=0, errors=0)
+            self._step_started = time.monotonic()
+            self.version += 1
+
+    def add_total(self, rows: int):
+        with self._lock:
+            self._state["total"] += rows
+            self.version += 1
+
+    def row_done(self):
+        with self._lock:
+            self._state["processed"] += 1
+            self.version += 1
+
+    def row_error(self):
+        with self._lock:
+            self._state["errors"] += 1
+            self.version += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            state = dict(self._state)
+            elapsed = time.monotonic() - self._step_started if self._step_started else 0.0
+        rate = state["processed"] / elapsed if elapsed > 0 else 0.0
+        remaining = state["total"] - state["processed"]
+        state["rows_per_s"] = round(rate, 2)
+        state["eta_s"] = round(remaining / rate, 1) if rate > 0 else None
+        return state
+
+
+_current_progress: ContextVar[Optional[RunProgress]] = ContextVar("run_progress", default=None)
+
+
+@contextmanager
+def tracking_progress(progress: Optional[RunProgress]):
+    """Make `progress` visible to every function (and row thread) run inside this block."""
+    token = _current_progress.set(progress)
+    try:
+        yield progress
+    finally:
+        _current_progress.reset(token)
+
+
+def current_progress() -> Optional[RunProgress]:
+    return _current_progress.get()
+
+
+def report_row_error():
+    """Count a row whose LLM call failed and fell back to a default (step stats + live progress)."""
+    increment_step_stats(row_errors=1)
+    progress = _current_progress.get()
+    if progress is not None:
+        progress.row_error()
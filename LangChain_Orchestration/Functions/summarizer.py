@@ -1,7 +1,9 @@
 import pandas as pd
 from pydantic import BaseModel
-from concurrent.futures import ThreadPoolExecutor
 from client import client
+from Functions.prompts import layout_messages
+from Functions.row_executor import estimate_row_costs, fan_out_rows
+from Functions.run_context import record_usage, report_row_error
 
 
 class SummarizationOutput(BaseModel):
@@ -17,26 +19,20 @@ def summarize_text_block(group_text: str, context_prompt: str) -> SummarizationO
         return SummarizationOutput(summary="No content to summarize", explanation="Empty or whitespace-only text")
 
     print("😎Starting the summarize text block function")
-    messages = [
-        {
-            "role": "system",
-            "content": "You are an expert assistant summarizing grouped text. Output JSON only."
-        },
-        {
-            "role": "user",
-            "content": f"""
+    messages = layout_messages(
+        instructions="You are an expert assistant summarizing grouped text. Output JSON only.",
+        document=group_text,
+        task=f"""
             Context: {context_prompt}
-            Data to summarize:
-            {group_text}
-            
+
             Respond in JSON with:
             {{
                 "summary": "Concise summary of the key points",
                 "explanation": "Evidence/trends used to create the summary"
             }}
             """,
-        },
-    ]
+        document_label="Data to summarize",
+    )
 
     try:
         response = client.responses.parse(
@@ -45,11 +41,13 @@ def summarize_text_block(group_text: str, context_prompt: str) -> SummarizationO
             text_format=SummarizationOutput,
             temperature=0,
         )
+        record_usage(response)
         
         return response.output_parsed
 
     except Exception as e:
         print(f"⚠️ Failed to summarize group: {e}")
+        report_row_error()
         return SummarizationOutput(summary="Summary failed", explanation=str(e))
 
 
@@ -86,25 +84,31 @@ def summarize_column_by_group(
     if group_by_col not in df.columns:
             raise ValueError(f"Column '{group_by_col}' not found in DataFrame.")
 
-    grouped = df.groupby(group_by_col)
+    # Combine all text for each group up front; each group is then one summarization task
+    grouped = df.groupby(group_by_col)[target_col].apply(
+        lambda texts: "\n\n".join(texts.dropna().astype(str).tolist())
+    )
 
-    def process_group(name, group):
-        """
-        Combine all text for a group and summarize it.
-        """
-        combined_text = "\n\n".join(group[target_col].dropna().astype(str).tolist())
-        result = summarize_text_block(combined_text, context_prompt)
-        return {
-            group_by_col: name,
-            "summary": result.summary,
-            "explanation": result.explanation,
-        }
+    def process_group(task):
+        result = summarize_text_block(task["text"], context_prompt)
+        return {"summary": result.summary, "explanation": result.explanation}
 
     # Run summarization in parallel
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        results = list(executor.map(lambda g: process_group(*g), grouped))
-
-    summary_df = pd.DataFrame(results)
+    group_texts = grouped.to_numpy()
+    outputs = fan_out_rows(
+        process_group,
+        {"text": group_texts},
+        ["summary", "explanation"],
+        max_workers=max_workers,
+        costs=estimate_row_costs(group_texts),
+        label="summaries",
+    )
+
+    summary_df = pd.DataFrame({
+        group_by_col: grouped.index.to_numpy(),
+        "summary": outputs["summary"],
+        "explanation": outputs["explanation"],
+    })
 
     print(f"✅ Generated {len(summary_df)} summaries (grouped by '{group_by_col}').")
     return summary_df
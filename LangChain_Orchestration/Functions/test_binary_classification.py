@@ -0,0 +1,58 @@
+# test_binary_classification.py
+import numpy as np
+import pandas as pd
+import pytest
+from Functions import binary_classification as binary
+from Functions.run_context import collect_step_stats
+
+GREETING = ("thank you for calling optimum please listen carefully as our menu options have changed "
+            "press one for billing press two for sales press three for support")
+
+
+@pytest.fixture
+def fake_rows(monkeypatch):
+    """Rows mentioning "refund" are positive; `calls` lists the call ids sent to the model."""
+    calls = []
+
+    def process_row(row, context_prompt, input_data, positive_label, negative_label, client, **kwargs):
+        calls.append(row["call_id"])
+        positive = "refund" in row[input_data]
+        return {"binary_label": positive_label if positive else negative_label, "binary_explanation": None}
+
+    monkeypatch.setattr(binary, "process_row_binary", process_row)
+    monkeypatch.setattr(binary, "estimate_row_costs", lambda texts: np.zeros(len(texts)))
+    return calls
+
+
+def _question(**extra):
+    return {"context_prompt": "Refund?", "positive_label": "yes", "negative_label": "no",
+            "label_col": "refund", "explanation_col": "refund_why", "include_explanation": False, **extra}
+
+
+def test_question_audit_sample_size_reaches_the_evidence_gate(fake_rows):
+    df = pd.DataFrame({"call_id": [f"c{i}" for i in range(10)],
+                       "call_text": ["asked for a refund"] + [f"call number {i}" for i in range(9)]})
+
+    with collect_step_stats() as stats:
+        out = binary.run_multiple_binary_classifiers(
+            df, [_question(evidence_keywords=["refund"], audit_sample_size=2)]
+        )
+
+    assert fake_rows == ["c0"]
+    assert out["refund"].tolist() == ["yes"] + ["no"] * 9
+    gate = stats.as_dict()["evidence_gate"][0]
+    assert (gate["skipped"], len(gate["audit_sample"])) == (9, 2)
+
+
+def test_dedupe_classifies_representatives_of_dedupe_column(fake_rows):
+    df = pd.DataFrame({
+        "call_id": ["c0", "c1", "c2"],
+        "summary": [GREETING, GREETING + " refund", GREETING],
+        "call_text": ["refund please", "refund please", "no thanks"],
+    })
+
+    out = binary.run_multiple_binary_classifiers(df, [_question()], dedupe_threshold=0.8, dedupe_column="summary")
+
+    # c1 and c2 are near duplicates of c0 in `summary`, so only c0 is sent and its answer copied
+    assert fake_rows == ["c0"]
+    assert out["refund"].tolist() == ["yes", "yes", "yes"]
@@ -0,0 +1,172 @@
+# test_cancellation.py
+import numpy as np
+import pandas as pd
+import pytest
+from Functions import category_extractor as category_module
+from Functions import map_reduce
+from Functions import mece_theme_analysis as mece_module
+from Functions.map_reduce import any_positive, fan_out_windows
+from Functions.row_executor import fan_out_rows
+from Functions.run_context import CancelToken, RunCanceled, cancellation
+
+
+def _column(values):
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def _cancel_after(cancel_token, calls):
+    """row_fn that answers its row, then cancels the run once `calls` rows have run."""
+    seen = []
+
+    def row_fn(row):
+        seen.append(row["text"])
+        if len(seen) >= calls:
+            cancel_token.cancel()
+        return {"label": f"done {row['text']}"}
+    return row_fn
+
+
+@pytest.fixture
+def split_on_bars(monkeypatch):
+    """Windows are the '|'-separated parts of a text; costs are their lengths (no tokenizer needed)."""
+    monkeypatch.setattr(map_reduce, "split_text_into_token_windows", lambda text, *args: text.split("|"))
+    monkeypatch.setattr(map_reduce, "estimate_row_costs",
+                        lambda texts: np.array([float(len(str(t))) for t in texts]))
+
+
+def test_fan_out_rows_keeps_finished_rows_and_leaves_skipped_rows_none():
+    cancel_token = CancelToken()
+    columns = {"text": _column(["a", "b", "c", "d"])}
+    with cancellation(cancel_token):
+        outputs = fan_out_rows(_cancel_after(cancel_token, 2), columns, ["label"], max_workers=1,
+                               fill={"label": "not selected"})
+    assert list(outputs["label"]) == ["done a", "done b", None, None]
+
+
+def test_fan_out_rows_fill_only_applies_to_unselected_rows():
+    cancel_token = CancelToken()
+    columns = {"text": _column(["a", "b", "c"])}
+    with cancellation(cancel_token):
+        outputs = fan_out_rows(_cancel_after(cancel_token, 1), columns, ["label"], max_workers=1,
+                               positions=np.array([0, 1]), fill={"label": "not selected"})
+    assert list(outputs["label"]) == ["done a", None, "not selected"]
+
+
+def test_fan_out_windows_marks_canceled_rows_none_not_fill(split_on_bars):
+    cancel_token = CancelToken()
+    # Row 0 is split in two windows; both finish before the cancel, row 1's single window doesn't run
+    columns = {"text": _column(["x1|x2", "y"])}
+    with cancellation(cancel_token):
+        outputs = fan_out_windows(
+            _cancel_after(cancel_token, 2), columns, "text", ["label"],
+            lambda results: {"label": "+".join(r["label"] for r in results)},
+            window_tokens=1, costs=np.array([10.0, 1.0]), max_workers=1, fill={"label": "filled"},
+        )
+    assert list(outputs["label"]) == ["done x1+done x2", None]
+
+
+def test_fan_out_windows_row_with_a_canceled_window_is_none(split_on_bars):
+    cancel_token = CancelToken()
+    columns = {"text": _column(["x1|x2|x3", "y"])}
+    with cancellation(cancel_token):
+        outputs = fan_out_windows(
+            _cancel_after(cancel_token, 1), columns, "text", ["label"],
+            lambda results: {"label": "+".join(r["label"] for r in results)},
+            window_tokens=1, costs=np.array([10.0, 1.0]), max_workers=1, fill={"label": "filled"},
+        )
+    # Only one window of row 0 ran: a partial reduce would look like a complete answer
+    assert list(outputs["label"]) == [None, None]
+
+
+def test_fan_out_windows_row_resolved_by_stop_when_survives_cancel(split_on_bars):
+    cancel_token = CancelToken()
+    columns = {"text": _column(["yes|x2|x3", "y"])}
+
+    def row_fn(row):
+        cancel_token.cancel()
+        return {"label": "true" if row["text"] == "yes" else "false", "explanation": row["text"]}
+
+    with cancellation(cancel_token):
+        outputs = fan_out_windows(
+            row_fn, columns, "text", ["label", "explanation"], any_positive("label", "explanation", "true"),
+            window_tokens=1, costs=np.array([10.0, 1.0]), max_workers=1,
+            stop_when=lambda result: result["label"] == "true",
+        )
+    assert list(outputs["label"]) == ["true", None]
+
+
+def test_category_extractor_keeps_rows_finished_before_cancel(monkeypatch):
+    cancel_token = CancelToken()
+    calls = []
+
+    def extract(text, context_prompt, transcript_idx, part=None):
+        calls.append(text)
+        if len(calls) == 2:
+            cancel_token.cancel()
+        return [text.upper(), "Billing"]
+
+    monkeypatch.setattr(category_module, "_extract_category_names_from_transcript", extract)
+    monkeypatch.setattr(category_module, "split_text_into_token_windows", lambda text, *args: [text])
+    monkeypatch.setattr(category_module, "estimate_row_costs", lambda texts: np.zeros(len(texts)))
+    df = pd.DataFrame({"call_text": ["a", "b", "c"]})
+
+    with cancellation(cancel_token):
+        result = category_module.category_extractor(df, "call_text", "categories?", max_workers=1)
+
+    assert list(result["category_list"]) == [["A", "Billing"], ["B", "Billing"], None]
+
+
+@pytest.fixture
+def fake_mece_calls(monkeypatch):
+    """One theme per transcript and one transcript per classification batch; `calls` logs each request."""
+    calls = []
+
+    def api_call(messages, *args, **kwargs):
+        content = messages[-1]["content"]
+        calls.append(content)
+        if "classifications" in messages[0]["content"]:
+            transcript_id = content.split("### Transcript id: ")[1].split("\n")[0]
+            return {"classifications": {transcript_id: ["Billing"]}}
+        return {"themes": [{"themeName": "Billing", "themeDescription": "Invoices"}]}
+
+    monkeypatch.setattr(mece_module, "_make_api_call", api_call)
+    monkeypatch.setattr(mece_module, "count_tokens", lambda text: 1)
+    monkeypatch.setattr(mece_module, "estimate_row_costs", lambda texts: np.zeros(len(texts)))
+    return calls
+
+
+def test_mece_classification_cancel_leaves_unclassified_rows_none(fake_mece_calls, monkeypatch):
+    cancel_token = CancelToken()
+    api_call = mece_module._make_api_call
+
+    def cancel_on_first_batch(messages, *args, **kwargs):
+        if "classifications" in messages[0]["content"]:
+            cancel_token.cancel()
+        return api_call(messages)
+
+    monkeypatch.setattr(mece_module, "_make_api_call", cancel_on_first_batch)
+    df = pd.DataFrame({"call_id": ["1", "2", "3"], "call_text": ["a", "b", "c"]})
+    with cancellation(cancel_token):
+        result = mece_module.mece_theme_analysis(df, "call_text", "why?", "call_id", max_workers=1,
+                                                 max_batch_size=1)
+
+    # The batch in flight finishes; the others are neither sent nor marked "Unclassified"
+    assert result["Theme_Analysis"].tolist() == ["Billing", None, None]
+    assert sum("### Transcript id" in call for call in fake_mece_calls) == 1
+
+
+def test_mece_cancel_during_theme_generation_raises_run_canceled(fake_mece_calls, monkeypatch):
+    cancel_token = CancelToken()
+    generate = mece_module._generate_themes_parallel
+
+    def generate_then_cancel(*args, **kwargs):
+        themes = generate(*args, **kwargs)
+        cancel_token.cancel()
+        return themes
+
+    monkeypatch.setattr(mece_module, "_generate_themes_parallel", generate_then_cancel)
+    df = pd.DataFrame({"call_id": ["1", "2"], "call_text": ["a", "b"]})
+    with cancellation(cancel_token), pytest.raises(RunCanceled):
+        mece_module.mece_theme_analysis(df, "call_text", "why?", "call_id", max_workers=1)
@@ -0,0 +1,22 @@
+# test_mece_theme_analysis.py
+from Functions.mece_theme_analysis import _pack_transcripts
+
+
+def _ids(batches):
+    return [[transcript_id for transcript_id, _, _ in batch] for batch in batches]
+
+
+def test_pack_fills_batches_up_to_the_token_budget():
+    items = [("1", "a", 40), ("2", "b", 40), ("3", "c", 30), ("4", "d", 50)]
+    assert _ids(_pack_transcripts(items, batch_token_budget=100, max_batch_size=10)) == [["1", "2"], ["3", "4"]]
+
+
+def test_pack_caps_batch_size():
+    items = [(str(i), "t", 1) for i in range(5)]
+    assert _ids(_pack_transcripts(items, batch_token_budget=100, max_batch_size=2)) == [["0", "1"], ["2", "3"], ["4"]]
+
+
+def test_pack_gives_an_oversized_transcript_its_own_batch():
+    items = [("1", "a", 10), ("2", "long", 500), ("3", "c", 10)]
+    assert _ids(_pack_transcripts(items, batch_token_budget=100, max_batch_size=10)) == [["1"], ["2"], ["3"]]
+    assert _pack_transcripts([], batch_token_budget=100, max_batch_size=10) == []
@@ -0,0 +1,39 @@
+# test_near_duplicates.py
+import pandas as pd
+from Functions.near_duplicates import near_duplicate_representatives, run_on_representatives
+
+GREETING = ("thank you for calling optimum please listen carefully as our menu options have changed "
+            "press one for billing press two for sales press three for support")
+OTHER = "completely different call about pricing and installing internet at a new office building in brooklyn"
+
+
+def _calls():
+    return pd.DataFrame({
+        "call_id": ["c0", "c1", "c2", "c3"],
+        "call_text": [GREETING, OTHER, GREETING + " goodbye", GREETING],
+        "label": ["old 0", "old 1", "old 2", "old 3"],
+    })
+
+
+def test_representatives_group_near_duplicates():
+    representatives = near_duplicate_representatives(_calls()["call_text"], 0.8)
+    assert list(representatives) == [0, 1, 0, 0]
+
+
+def test_written_columns_reach_every_cluster_member():
+    seen = []
+
+    def step(rep_df):
+        seen.append(rep_df["call_id"].tolist())
+        out = rep_df.copy()
+        out["label"] = ["new " + call_id for call_id in rep_df["call_id"]]
+        out["explanation"] = "because"
+        return out
+
+    result = run_on_representatives(_calls(), "call_text", 0.8, step)
+
+    assert seen == [["c0", "c1"]]
+    # Overwritten columns are copied like added ones; columns the step didn't touch keep each row's own value
+    assert result["label"].tolist() == ["new c0", "new c1", "new c0", "new c0"]
+    assert result["explanation"].tolist() == ["because"] * 4
+    assert result["call_id"].tolist() == ["c0", "c1", "c2", "c3"]
@@ -0,0 +1,78 @@
+# test_output_modes.py
+import types
+import numpy as np
+import pytest
+from Functions import open_classification
+from Functions.output_modes import as_bool, classify_with_explanations, resolve_explanation_policy
+
+
+def _column(values):
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+class FakeClassifier:
+    """classify/justify pair that records which rows were asked for what."""
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.classified, self.justified = [], []
+
+    def classify(self, positions, explain):
+        self.classified.append((list(positions), list(np.flatnonzero(explain))))
+        outputs = {"label": _column([None] * len(self.labels)), "explanation": _column([None] * len(self.labels))}
+        for p in positions:
+            outputs["label"][p] = self.labels[p]
+            outputs["explanation"][p] = f"classified {p}" if explain[p] else None
+        return outputs
+
+    def justify(self, positions, labels):
+        self.justified.append(list(positions))
+        return _column([f"why {label}" for label in labels])
+
+
+def test_changed_policy_explains_the_chosen_label_without_relabeling():
+    fake = FakeClassifier(["yes", "no", "yes", None])
+    previous = _column(["yes", "yes", "no", "no"])
+
+    outputs = classify_with_explanations(fake.classify, 4, np.arange(4), "changed", "label", "explanation",
+                                         previous_labels=previous, justify=fake.justify)
+
+    # One label-only pass; row 3 was left unlabeled (e.g. canceled) and isn't explained
+    assert fake.classified == [([0, 1, 2, 3], [])]
+    assert fake.justified == [[1, 2]]
+    assert list(outputs["label"]) == ["yes", "no", "yes", None]
+    assert list(outputs["explanation"]) == [None, "why no", "why yes", None]
+
+
+def test_sample_policy_explains_at_most_sample_size_rows():
+    fake = FakeClassifier(["a"] * 10)
+    outputs = classify_with_explanations(fake.classify, 10, np.arange(10), "sample", "label", "explanation",
+                                         sample_size=3)
+    assert len(fake.classified[0][1]) == 3
+    assert sum(explanation is not None for explanation in outputs["explanation"]) == 3
+
+
+def test_policy_resolution():
+    assert resolve_explanation_policy("false") == "none"
+    assert resolve_explanation_policy(True, "sample") == "sample"
+    with pytest.raises(ValueError):
+        resolve_explanation_policy(True, "changed")
+    assert as_bool(None) is True and as_bool("off") is False
+
+
+def test_open_response_schema_has_no_echoed_id(monkeypatch):
+    requests = []
+
+    def parse(**kwargs):
+        requests.append(kwargs)
+        return types.SimpleNamespace(output_parsed=kwargs["text_format"](open_response="Pricing"), usage=None)
+
+    monkeypatch.setattr(open_classification, "record_usage", lambda response: None)
+    client = types.SimpleNamespace(responses=types.SimpleNamespace(parse=parse))
+    row = {"call_id": "42", "call_text": "..."}
+
+    assert open_classification.process_row_open_ended(row, "why?", "call_text", client) == {"open_response": "Pricing"}
+    # The id isn't in the prompt, so the model would have to invent one for every row
+    assert list(requests[0]["text_format"].model_fields) == ["open_response"]
@@ -12,6 +12,34 @@ def count_tokens(text: str, model: str = "gpt-5-mini") -> int:
     return len(encoding.encode(text))
 
 
+def split_text_into_token_windows(text: str,
+                                  window_tokens: int = 6000,
+                                  overlap_tokens: int = 200,
+                                  model: str = "gpt-5-mini") -> list[str]:
+    """
+    Split a string into windows of at most `window_tokens` tokens, where each
+    window repeats the last `overlap_tokens` tokens of the previous one.
+    Text that already fits is returned as a single window.
+    """
+    if not isinstance(text, str) or not text.strip():
+        return [text if isinstance(text, str) else ""]
+    if overlap_tokens >= window_tokens:
+        raise ValueError("overlap_tokens must be smaller than window_tokens.")
+
+    encoding = tiktoken.encoding_for_model(model)
+    tokens = encoding.encode(text)
+    if len(tokens) <= window_tokens:
+        return [text]
+
+    step = window_tokens - overlap_tokens
+    windows = []
+    for start in range(0, len(tokens), step):
+        windows.append(encoding.decode(tokens[start:start + window_tokens]))
+        if start + window_tokens >= len(tokens):
+            break
+    return windows
+
+
 def token_based_splitter(
     df: pd.DataFrame,
     target_col: str,
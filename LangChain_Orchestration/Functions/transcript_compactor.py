@@ -0,0 +1,97 @@
+# transcript_compactor.py
+import re
+import pandas as pd
+from typing import Optional
+from Functions.run_context import log_step_stats
+from Functions.token_based_splitter import count_tokens
+
+_SPEAKER_TAG = re.compile(r"\[(Agent|Customer)\]")
+_SPEAKER_CODES = {"Agent": "A", "Customer": "C"}
+_REDACTION = re.compile(r"\bX+(?:[-./]X+)*\b")
+_FILLERS = re.compile(r"\b(?:um+|uh+|uhm|erm|hmm+|mhm|mm+|ah)\b[,.]?\s*", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def compact_transcript(text, speaker_codes: bool = True, remove_fillers: bool = False) -> str:
+    """
+    Rewrite one transcript into a token-minimal form:
+    - undo doubled quote escapes and drop the quotes wrapping each turn
+    - merge consecutive turns by the same speaker under one tag
+    - shorten [Agent]/[Customer] to "A:"/"C:" (one turn per line) if speaker_codes
+    - collapse runs of XX redactions to a single "X"
+    - optionally remove filler words (um, uh, mhm, ...)
+    - collapse whitespace
+    """
+    if not isinstance(text, str):
+        return text
+
+    text = text.replace('""', '"')
+    if remove_fillers:
+        text = _FILLERS.sub("", text)
+    text = _REDACTION.sub("X", text)
+
+    parts = _SPEAKER_TAG.split(text)
+    preamble, pairs = parts[0], list(zip(parts[1::2], parts[2::2]))
+
+    turns = []
+    for speaker, content in pairs:
+        content = _WHITESPACE.sub(" ", content).strip().strip('"').strip()
+        if not content:
+            continue
+        if turns and turns[-1][0] == speaker:
+            turns[-1][1].append(content)
+        else:
+            turns.append((speaker, [content]))
+
+    lines = [_WHITESPACE.sub(" ", preamble).strip()] if preamble.strip() else []
+    for speaker, contents in turns:
+        tag = f"{_SPEAKER_CODES[speaker]}:" if speaker_codes else f"[{speaker}]"
+        lines.append(f"{tag} {' '.join(contents)}")
+
+    return ("\n" if speaker_codes else " ").join(lines)
+
+
+def transcript_compactor(df: pd.DataFrame,
+                         text_column: str = "call_text",
+                         target_column: Optional[str] = None,
+                         speaker_codes: bool = True,
+                         remove_fillers: bool = False,
+                         model: str = "gpt-5-mini") -> pd.DataFrame:
+    """
+    Rewrites a transcript column into a token-minimal form so every downstream
+    LLM step pays for fewer input tokens. Before/after token counts (tiktoken)
+    are written to the step log.
+
+    Args:
+        df (pd.DataFrame): Input DataFrame containing transcripts.
+        text_column (str): Column with transcript text.
+        target_column (str): Output column; defaults to overwriting text_column.
+        speaker_codes (bool): Replace [Agent]/[Customer] tags with "A:"/"C:".
+        remove_fillers (bool): Drop filler words such as "um", "uh", "mhm".
+        model (str): Model name for tiktoken encoding.
+
+    Returns:
+        pd.DataFrame: DataFrame with the compacted text column.
+    """
+    if text_column not in df.columns:
+        raise ValueError(f"Column '{text_column}' not found in DataFrame.")
+
+    target_column = target_column or text_column
+    original = df[text_column]
+    compacted = original.map(lambda t: compact_transcript(t, speaker_codes, remove_fillers))
+
+    tokens_before = int(sum(count_tokens(t, model) for t in original))
+    tokens_after = int(sum(count_tokens(t, model) for t in compacted))
+    reduction = round(100 * (1 - tokens_after / tokens_before), 1) if tokens_before else 0.0
+    log_step_stats(
+        text_column=text_column,
+        tokens_before=tokens_before,
+        tokens_after=tokens_after,
+        token_reduction_pct=reduction,
+    )
+
+    df = df.copy()
+    df[target_column] = compacted
+    print(f"✅ Compacted '{text_column}' → '{target_column}': {tokens_before} → {tokens_after} tokens "
+          f"({reduction}% fewer).")
+    return df
@@ -3,6 +3,8 @@ import pandas as pd
 import json
 from typing import Optional
 from client import client
+from Functions.prompts import layout_messages
+from Functions.run_context import record_usage
 
 
 def unsupervised_grouping(
@@ -39,41 +41,41 @@ def unsupervised_grouping(
         if pd.notna(row[input_column])
     ])
 
-    # System + User prompt
-    system_prompt = f"""
+    # Fixed instructions first, then the entries, then the task
+    instructions = """
     You are an expert at unsupervised text grouping and categorization.
-    Your task: {context_prompt}
 
     Instructions:
     1. Identify 2–5 meaningful categories.
     2. Provide clear category names + short descriptions.
     3. Assign each ID to exactly one category.
     4. Respond ONLY in JSON:
-    {{
+    {
         "categories": [
-            {{"name": "Category Name", "description": "Short description"}}
+            {"name": "Category Name", "description": "Short description"}
         ],
-        "assignments": {{
+        "assignments": {
             "1": "Category Name",
             "2": "Another Category"
-        }}
-    }}
+        }
+    }
     """
 
-    user_prompt = f"Text entries to group:\n\n{input_data}"
-
     print(f"🧠 Running unsupervised grouping on {len(df)} rows...")
 
     try:
         response = client.chat.completions.create(
             model="gpt-5-mini",
-            input=[
-                {"role": "system", "content": system_prompt.strip()},
-                {"role": "user", "content": user_prompt.strip()}
-            ],
+            messages=layout_messages(
+                instructions=instructions,
+                document=input_data,
+                task=f"Your task: {context_prompt}",
+                document_label="Text entries to group",
+            ),
             temperature=0,
             response_format={"type": "json_object"}
         )
+        record_usage(response)
 
         parsed = json.loads(response.choices[0].message.content)
 
@@ -0,0 +1,14 @@
+# conftest.py
+# Shared setup for the pytest unit tests (Functions/, Compiler/, server/). The
+# older test_*.py scripts next to them call a running server or the LLM instead.
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Code imports `Functions.*` / `Compiler.*` from here, and server modules import each other by name
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "server"))
+
+# client.py builds its clients at import time; unit tests never reach the API
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("AZURE_OPENAI_API_KEY", "test")
@@ -0,0 +1,262 @@
+# server/artifacts.py
+"""
+Run outputs (artifacts) on disk.
+
+DataFrame outputs are written as Parquet with fixed-size row groups, so a
+page of rows only decodes the row groups it overlaps, and only the requested
+columns. Filters and sorts are evaluated by Arrow over the needed columns.
+CSV is generated on the fly for downloads. Analyses saved before Parquet
+artifacts still have CSV files; those are loaded once (df_cache) and then go
+through the same Arrow code.
+"""
+from __future__ import annotations
+import json
+import math
+import os
+from typing import Iterator, List, Optional, Tuple
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as pads
+import pyarrow.parquet as pq
+from df_cache import df_cache, file_version
+from storage import read_parquet_rows
+from config import ARTIFACT_ROW_GROUP_ROWS, PARQUET_COMPRESSION
+
+# filter=<column>:<op>:<value>
+FILTER_OPS = ('eq', 'ne', 'lt', 'le', 'gt', 'ge', 'in', 'contains', 'null', 'notnull')
+
+
+def artifact_file(value) -> Optional[str]:
+    """Path of a file artifact (stored as a path, or as (path, ...) by older runs); None for inline values."""
+    if isinstance(value, (list, tuple)) and len(value) == 3 and isinstance(value[0], str):
+        return value[0]
+    if isinstance(value, str) and value.endswith(('.parquet', '.csv')):
+        return value
+    return None
+
+
+# -------------------------------
+# Writing
+# -------------------------------
+def _is_missing(value) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def to_arrow_table(df: pd.DataFrame) -> pa.Table:
+    """
+    Arrow table of a step output. Object columns Arrow can't type (e.g. mixed
+    ints and strings) are stored as strings, the same text the CSV had.
+    """
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        arrays = {}
+        for name in df.columns:
+            try:
+                arrays[str(name)] = pa.array(df[name], from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+                arrays[str(name)] = pa.array([None if _is_missing(v) else str(v) for v in df[name]], pa.string())
+        return pa.table(arrays)
+
+
+def write_artifact(df: pd.DataFrame, path: str, row_group_rows: int = ARTIFACT_ROW_GROUP_ROWS) -> str:
+    tmp_path = f"{path}.tmp"
+    pq.write_table(to_arrow_table(df), tmp_path, row_group_size=row_group_rows, compression=PARQUET_COMPRESSION)
+    os.replace(tmp_path, path)
+    return path
+
+
+def append_artifact(base_path: str, df: pd.DataFrame, path: str, row_group_rows: int = ARTIFACT_ROW_GROUP_ROWS) -> str:
+    """
+    Write `path` as the rows of the artifact at `base_path` followed by `df`,
+    copying the existing rows batch by batch. Columns only one side has are
+    null on the other; types are widened where they differ (e.g. all-null
+    columns). With no rows to add the base schema is kept as it is.
+    """
+    base = arrow_source(base_path)
+    new_rows = to_arrow_table(df) if len(df) else None
+    schema = base.schema.remove_metadata()
+    if new_rows is not None:
+        schema = pa.unify_schemas([schema, new_rows.schema.remove_metadata()], promote_options='permissive')
+
+    def conform(table: pa.Table) -> pa.Table:
+        columns = [table[f.name].cast(f.type) if f.name in table.column_names else pa.nulls(table.num_rows, f.type)
+                   for f in schema]
+        return pa.Table.from_arrays(columns, schema=schema)
+
+    tmp_path = f"{path}.tmp"
+    with pq.ParquetWriter(tmp_path, schema, compression=PARQUET_COMPRESSION) as writer:
+        for batch in base.to_batches(batch_size=row_group_rows):
+            writer.write_table(conform(pa.Table.from_batches([batch])), row_group_size=row_group_rows)
+        if new_rows is not None:
+            writer.write_table(conform(new_rows), row_group_size=row_group_rows)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_artifact_df(path: str) -> pd.DataFrame:
+    return arrow_source(path).to_table().to_pandas()
+
+
+# -------------------------------
+# Reading
+# -------------------------------
+def arrow_source(path: str):
+    """A pyarrow dataset over the artifact (legacy CSVs are loaded into memory first)."""
+    if path.endswith('.parquet'):
+        return pads.dataset(path, format='parquet')
+    df = df_cache.get_or_load(('artifact', file_version(path)), lambda: pd.read_csv(path))
+    return pads.dataset(to_arrow_table(df))
+
+
+def check_columns(schema: pa.Schema, names: List[str]):
+    unknown = [name for name in names if name not in schema.names]
+    if unknown:
+        raise ValueError(f"Unknown column(s): {', '.join(unknown)}")
+
+
+def _typed(value: str, field: pa.Field):
+    """Cast a query-string value to the column's type."""
+    value_type = field.type.value_type if pa.types.is_list(field.type) else field.type
+    if pa.types.is_string(value_type) or pa.types.is_large_string(value_type):
+        return value
+    try:
+        return pa.scalar(value).cast(value_type)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        raise ValueError(f"Can't compare {field.name} ({field.type}) with {value!r}")
+
+
+def parse_filters(filters: Optional[List[str]], schema: pa.Schema) -> Optional[pc.Expression]:
+    """
+    Filters as an Arrow expression (all must match). Each filter is
+    `column:op:value` with op one of FILTER_OPS; `in` takes comma-separated
+    values, `null`/`notnull` take none.
+    """
+    expression = None
+    for spec in filters or []:
+        parts = spec.split(':', 2)
+        if len(parts) < 2 or parts[1] not in FILTER_OPS:
+            raise ValueError(f"Bad filter {spec!r}: expected column:op:value with op in {', '.join(FILTER_OPS)}")
+        name, op, value = parts[0], parts[1], parts[2] if len(parts) == 3 else ''
+        check_columns(schema, [name])
+        field, column = schema.field(name), pc.field(name)
+        if op == 'null':
+            condition = column.is_null()
+        elif op == 'notnull':
+            condition = column.is_valid()
+        elif op == 'contains':
+            text = column if pa.types.is_string(field.type) else column.cast(pa.string())
+            condition = pc.match_substring(text, value)
+        elif op == 'in':
+            condition = column.isin([_typed(v, field) for v in value.split(',')])
+        else:
+            typed = _typed(value, field)
+            condition = {'eq': column == typed, 'ne': column != typed, 'lt': column < typed,
+                         'le': column <= typed, 'gt': column > typed, 'ge': column >= typed}[op]
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def parse_sort(sort: Optional[str], schema: pa.Schema) -> List[Tuple[str, str]]:
+    """`sort=col1,-col2`: ascending by col1, then descending by col2."""
+    keys = []
+    for name in (sort or '').split(','):
+        name = name.strip()
+        if not name:
+            continue
+        order = 'descending' if name.startswith('-') else 'ascending'
+        keys.append((name.lstrip('-'), order))
+    check_columns(schema, [name for name, _ in keys])
+    return keys
+
+
+def read_artifact(path: str, columns: Optional[List[str]] = None, offset: int = 0, limit: Optional[int] = None,
+                  sort: Optional[str] = None, filters: Optional[List[str]] = None) -> Tuple[pa.Table, int]:
+    """
+    One page of an artifact.
+
+    Args:
+        path: Artifact file (.parquet, or .csv from older runs).
+        columns: Columns to return (default: all).
+        offset, limit: Page of the (filtered, sorted) rows.
+        sort: Comma-separated columns, "-" prefix for descending.
+        filters: `column:op:value` conditions (see parse_filters).
+
+    Returns:
+        (table, total) where total is the number of rows matching the filters.
+    """
+    source = arrow_source(path)
+    schema = source.schema
+    columns = list(columns) if columns else schema.names
+    check_columns(schema, columns)
+    expression = parse_filters(filters, schema)
+    sort_keys = parse_sort(sort, schema)
+    stop = None if limit is None else offset + limit
+
+    if expression is None and not sort_keys and path.endswith('.parquet'):
+        # Plain page: decode only the row groups it overlaps
+        total = pq.ParquetFile(path, memory_map=True).metadata.num_rows
+        return read_parquet_rows(path, columns=columns, row_range=(offset, stop)), total
+
+    needed = list(dict.fromkeys(columns + [name for name, _ in sort_keys]))
+    table = source.to_table(columns=needed, filter=expression)
+    if sort_keys:
+        table = table.sort_by(sort_keys)
+    total = table.num_rows
+    return table.slice(offset, None if limit is None else limit).select(columns), total
+
+
+def iter_artifact_ndjson(path: str, columns: Optional[List[str]] = None, offset: int = 0,
+                         limit: Optional[int] = None, sort: Optional[str] = None,
+                         filters: Optional[List[str]] = None, batch_rows: int = 1000) -> Iterator[str]:
+    """
+    Matching rows as newline-delimited JSON, produced batch by batch so the
+    response never holds the whole result. Sorted reads materialize the
+    sorted columns first. Bad columns/filters raise ValueError here, before
+    anything is streamed.
+    """
+    if sort:
+        table, _ = read_artifact(path, columns, offset, limit, sort, filters)
+        batches = table.to_batches(max_chunksize=batch_rows)
+        skip, remaining = 0, None
+    else:
+        source = arrow_source(path)
+        columns = list(columns) if columns else source.schema.names
+        check_columns(source.schema, columns)
+        batches = source.to_batches(columns=columns, filter=parse_filters(filters, source.schema),
+                                    batch_size=batch_rows)
+        skip, remaining = offset, limit
+    return _ndjson_lines(batches, skip, remaining)
+
+
+def _ndjson_lines(batches, skip: int, remaining: Optional[int]) -> Iterator[str]:
+    for batch in batches:
+        if skip >= batch.num_rows:
+            skip -= batch.num_rows
+            continue
+        batch, skip = batch.slice(skip), 0
+        if remaining is not None:
+            batch = batch.slice(0, remaining)
+            remaining -= batch.num_rows
+        if batch.num_rows:
+            yield ''.join(json.dumps(row, default=str) + '\n' for row in batch.to_pylist())
+        if remaining == 0:
+            return
+
+
+def iter_artifact_csv(path: str, batch_rows: int = ARTIFACT_ROW_GROUP_ROWS) -> Iterator[str]:
+    """A Parquet artifact as CSV text, one batch of rows at a time."""
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    header = True
+    list_columns = [f.name for f in parquet_file.schema_arrow if pa.types.is_list(f.type)]
+    for batch in parquet_file.iter_batches(batch_size=batch_rows):
+        df = batch.to_pandas()
+        for name in list_columns:
+            # Python lists, so cells read "['a', 'b']" as in the CSVs runs used to write
+            df[name] = batch.column(name).to_pylist()
+        yield df.to_csv(index=False, header=header)
+        header = False
+    if header:
+        yield pd.DataFrame(columns=parquet_file.schema_arrow.names).to_csv(index=False)
+
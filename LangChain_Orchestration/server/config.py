@@ -0,0 +1,61 @@
+# server/config.py
+import os
+
+# ---- SQLite ----
+# Writers wait this long for the database lock before failing
+SQLITE_BUSY_TIMEOUT_SECONDS = float(os.getenv("SQLITE_BUSY_TIMEOUT_SECONDS", "30"))
+# GET /analyses page size (default and maximum)
+ANALYSIS_PAGE_SIZE = int(os.getenv("ANALYSIS_PAGE_SIZE", "100"))
+MAX_ANALYSIS_PAGE_SIZE = int(os.getenv("MAX_ANALYSIS_PAGE_SIZE", "500"))
+
+# ---- Dataset ingestion ----
+# Uploads are written to disk in chunks of this size
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+# Largest single chunk accepted by PUT /uploads/{id}
+MAX_UPLOAD_CHUNK_BYTES = int(os.getenv("MAX_UPLOAD_CHUNK_BYTES", str(64 * 1024 * 1024)))
+# Threads in the API process that parse/profile uploaded files
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# CSVs are converted to Parquet in blocks of this many bytes; ingestion memory is a small multiple of it
+# whatever the file size. A single row must fit in one block.
+CSV_BLOCK_BYTES = int(os.getenv("CSV_BLOCK_BYTES", str(4 * 1024 * 1024)))
+# Datasets are stored as Parquet; row-range reads decode whole row groups of this many rows
+DATASET_ROW_GROUP_ROWS = int(os.getenv("DATASET_ROW_GROUP_ROWS", "1000"))
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+# Rows of the head preview stored with each dataset
+PREVIEW_ROWS = int(os.getenv("PREVIEW_ROWS", "10"))
+# GET /datasets page size (default and maximum)
+DATASET_PAGE_SIZE = int(os.getenv("DATASET_PAGE_SIZE", "100"))
+MAX_DATASET_PAGE_SIZE = int(os.getenv("MAX_DATASET_PAGE_SIZE", "500"))
+# Run outputs are stored as Parquet; a page read decodes whole row groups of this many rows
+ARTIFACT_ROW_GROUP_ROWS = int(os.getenv("ARTIFACT_ROW_GROUP_ROWS", "5000"))
+# GET /analyses/{id}/artifacts/{key}?format=json page size when no limit is given (ndjson streams everything)
+ARTIFACT_PAGE_SIZE = int(os.getenv("ARTIFACT_PAGE_SIZE", "1000"))
+# Run summaries (summaries.py): columns with at most this many distinct values are labels,
+# up to SUMMARY_MAX_GROUPS are groups; columns averaging more bytes per value are free text and skipped
+SUMMARY_MAX_LABELS = int(os.getenv("SUMMARY_MAX_LABELS", "50"))
+SUMMARY_MAX_GROUPS = int(os.getenv("SUMMARY_MAX_GROUPS", "5000"))
+SUMMARY_MAX_VALUE_BYTES = int(os.getenv("SUMMARY_MAX_VALUE_BYTES", "200"))
+SUMMARY_TOP_VALUES = int(os.getenv("SUMMARY_TOP_VALUES", "100"))
+# In-process cache of loaded datasets/artifacts (per process), evicted LRU beyond this size
+DF_CACHE_BYTES = int(os.getenv("DF_CACHE_BYTES", str(512 * 1024 * 1024)))
+
+# ---- Job queue / workers ----
+# Number of worker processes started by `python worker.py`
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", "2"))
+# A leased job is handed to another worker if its lease is not renewed in time
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_HEARTBEAT_SECONDS = int(os.getenv("JOB_HEARTBEAT_SECONDS", "15"))
+# How long an idle worker waits before polling the queue again
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+# Attempts before a job whose worker keeps dying is marked failed
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# ---- Cancellation ----
+# How often a running analysis checks whether it has been canceled
+CANCEL_POLL_SECONDS = float(os.getenv("CANCEL_POLL_SECONDS", "2"))
+
+# ---- Progress ----
+# Running analyses write progress to SQLite at most this often
+PROGRESS_FLUSH_SECONDS = float(os.getenv("PROGRESS_FLUSH_SECONDS", "1"))
+# How often the /events streams check SQLite for changes
+PROGRESS_STREAM_SECONDS = float(os.getenv("PROGRESS_STREAM_SECONDS", "1"))
@@ -0,0 +1,18 @@
+# conftest.py
+import pytest
+import storage
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Point storage at an empty data directory and SQLite database for one test."""
+    engine = storage.make_engine(str(tmp_path / "app.db"))
+    original_engine = storage.engine
+    monkeypatch.setattr(storage, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(storage, "engine", engine)
+    monkeypatch.setattr(storage, "_db_ready", False)
+    storage.Session.configure(bind=engine)
+    storage.init_db()
+    yield tmp_path
+    storage.Session.configure(bind=original_engine)
+    engine.dispose()
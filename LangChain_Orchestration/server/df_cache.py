@@ -0,0 +1,103 @@
+# server/df_cache.py
+"""
+In-process, memory-bounded cache of loaded DataFrames (datasets and artifacts).
+
+Entries are keyed by the file they were read from (path, mtime, size) plus
+the projection (columns, row range), so a file that changes on disk is
+simply a different key. Entries are evicted least-recently-used first once
+their estimated size exceeds DF_CACHE_BYTES. Each process (API, workers)
+has its own cache.
+"""
+from __future__ import annotations
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+import pandas as pd
+from config import DF_CACHE_BYTES
+
+
+class DataFrameCache:
+    def __init__(self, budget_bytes: int = DF_CACHE_BYTES):
+        self.budget_bytes = budget_bytes
+        self._entries: OrderedDict[Hashable, tuple] = OrderedDict()  # key -> (df, nbytes)
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """
+        Cached DataFrame for `key`, calling `loader()` on a miss. Callers get
+        their own copy, so adding or overwriting columns never leaks into the cache.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0].copy()
+            self.misses += 1
+
+        df = loader()
+        self.put(key, df)
+        return df.copy()
+
+    def peek(self, key: Hashable) -> Optional[pd.DataFrame]:
+        """
+        The cached DataFrame itself (not a copy; don't mutate it), or None.
+        Counts a hit when found; a caller that then loads counts the miss via get_or_load.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, df: pd.DataFrame):
+        nbytes = int(df.memory_usage(index=True, deep=True).sum())
+        if nbytes > self.budget_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (df, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.budget_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self._bytes -= evicted_bytes
+                self.evictions += 1
+
+    def invalidate(self, match: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key satisfies `match`. Returns how many were dropped."""
+        with self._lock:
+            stale = [key for key in self._entries if match(key)]
+            for key in stale:
+                self._bytes -= self._entries.pop(key)[1]
+            return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'budget_bytes': self.budget_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'evictions': self.evictions,
+                'pid': os.getpid(),
+            }
+
+
+df_cache = DataFrameCache()
+
+
+def file_version(path: str) -> tuple:
+    """(path, mtime, size): part of every cache key, so rewritten files are never served stale."""
+    stat = os.stat(path)
+    return (path, stat.st_mtime_ns, stat.st_size)
@@ -0,0 +1,105 @@
+# server/ingestion.py
+"""
+Non-blocking dataset ingestion.
+
+The upload endpoint streams the file to disk in chunks (never holding it
+in memory or blocking the event loop), creates the dataset record with
+status "ingesting" and returns. Decompression (gzip/zip/zstd, see uploads.py),
+parsing, conversion to Parquet and profiling (head preview, column metadata)
+run on a small thread pool; clients poll GET /datasets/{id}/status until it is
+"ready" or "failed". Content already stored by an earlier upload (same
+SHA-256) is not converted again: the new dataset points at the same blob.
+"""
+from __future__ import annotations
+import asyncio
+import hashlib
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import UploadFile
+from typing import Optional
+from storage import (new_id, dataset_path, file_sha256, store_dataset_blob, create_dataset_record, update_dataset,
+                     append_dataset_rows, get_dataset_status, get_dataset_ids_by_status)
+from uploads import compression_of, decompress_to_csv
+from config import UPLOAD_CHUNK_BYTES, INGEST_WORKERS
+
+_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+
+
+async def _stream_to_disk(upload: UploadFile, path: str) -> Optional[str]:
+    """
+    Write an upload to `path` chunk by chunk, hashing it. Returns the SHA-256
+    for a plain CSV; compressed uploads (None) are hashed when decompressed.
+    """
+    digest, head = hashlib.sha256(), b''
+    try:
+        with open(path, 'wb') as f:
+            while chunk := await upload.read(UPLOAD_CHUNK_BYTES):
+                head = head or chunk[:4]
+                digest.update(chunk)
+                await asyncio.to_thread(f.write, chunk)
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return digest.hexdigest() if compression_of(head) is None else None
+
+
+async def receive_upload(upload: UploadFile) -> str:
+    """Stream an upload to disk chunk by chunk, hashing it, register it and queue ingestion. Returns the dataset id."""
+    ds_id = new_id('ds')
+    path = dataset_path(ds_id, 'upload')
+    content_hash = await _stream_to_disk(upload, path)
+    await asyncio.to_thread(create_dataset_record, ds_id, upload.filename, path, content_hash=content_hash)
+    start_ingestion(ds_id)
+    return ds_id
+
+
+async def receive_append(ds_id: str, upload: UploadFile) -> dict:
+    """
+    Stream a CSV of new rows to disk and append them to the dataset
+    (storage.append_dataset_rows). Unlike a new upload this finishes within
+    the request, so a rerun can be started as soon as it returns.
+    """
+    part = new_id('append')
+    upload_path, csv_path = dataset_path(ds_id, f"{part}.upload"), dataset_path(ds_id, f"{part}.csv")
+    try:
+        rows_hash = await _stream_to_disk(upload, upload_path)
+        rows_hash = await asyncio.to_thread(decompress_to_csv, upload_path, csv_path) or rows_hash
+        return await asyncio.to_thread(append_dataset_rows, ds_id, csv_path, rows_hash)
+    finally:
+        for path in (upload_path, csv_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def start_ingestion(ds_id: str):
+    _executor.submit(ingest_dataset, ds_id)
+
+
+def ingest_dataset(ds_id: str):
+    """Decompress and validate the uploaded CSV, convert it to Parquet and profile it (runs on the ingestion pool)."""
+    try:
+        upload_path, csv_path = dataset_path(ds_id, 'upload'), dataset_path(ds_id, 'csv')
+        content_hash = get_dataset_status(ds_id)['content_hash']
+        if os.path.exists(upload_path):
+            content_hash = decompress_to_csv(upload_path, csv_path) or content_hash
+        content_hash = content_hash or file_sha256(csv_path)
+        blob, num_rows, preview, column_info, reused = store_dataset_blob(csv_path, content_hash)
+        update_dataset(ds_id, status='ready', num_rows=num_rows, file_path=blob, content_hash=content_hash,
+                       preview=preview, column_info=column_info, error=None)
+        # The upload is only kept until it is converted; CSV is an export format (GET /datasets/{id}/export)
+        os.remove(csv_path)
+        if reused:
+            print(f"♻️ Dataset {ds_id} has the same content as an earlier upload: reusing blob {content_hash[:12]}")
+        print(f"✅ Ingested dataset {ds_id}: {num_rows} rows")
+    except Exception as e:
+        traceback.print_exc()
+        update_dataset(ds_id, status='failed', error=str(e))
+
+
+def resume_pending_ingestions():
+    """Re-queue datasets left "ingesting" by a server restart."""
+    for ds_id in get_dataset_ids_by_status('ingesting'):
+        print(f"♻️ Resuming ingestion of dataset {ds_id}")
+        start_ingestion(ds_id)
@@ -0,0 +1,174 @@
+# server/jobs.py
+"""
+Durable job queue stored in the app's SQLite database.
+
+The API process only enqueues jobs and reads their status; worker processes
+(worker.py) lease jobs, renew the lease with heartbeats while they run, and
+mark them done or failed. A job whose lease expires (its worker died or
+hung) is leased again by another worker, up to `max_attempts`.
+"""
+from __future__ import annotations
+from typing import Any, Dict, Optional
+from datetime import datetime, timedelta
+import json
+from sqlalchemy import or_, and_
+from storage import Session, Job, Analysis, init_db, new_id
+from config import JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS
+
+
+def _job_dict(job: Job) -> Dict[str, Any]:
+    return {
+        'id': job.id, 'kind': job.kind, 'analysis_id': job.analysis_id,
+        'payload': json.loads(job.payload) if job.payload else {},
+        'priority': job.priority, 'status': job.status, 'attempts': job.attempts,
+        'max_attempts': job.max_attempts, 'lease_owner': job.lease_owner,
+        'heartbeat_at': job.heartbeat_at.isoformat() if job.heartbeat_at else None,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def enqueue_job(kind: str, payload: Dict[str, Any], priority: int = 0,
+                analysis_id: Optional[str] = None, max_attempts: int = JOB_MAX_ATTEMPTS) -> str:
+    init_db()
+    job_id = new_id('job')
+    with Session() as session:
+        session.add(Job(id=job_id, kind=kind, payload=json.dumps(payload), analysis_id=analysis_id,
+                        priority=priority, status='queued', attempts=0, max_attempts=max_attempts,
+                        created_at=datetime.now()))
+        session.commit()
+    return job_id
+
+
+def get_job(job_id: str) -> Dict[str, Any]:
+    init_db()
+    with Session() as session:
+        job = session.query(Job).filter_by(id=job_id).first()
+        if not job:
+            raise KeyError(f"Job {job_id} not found")
+        return _job_dict(job)
+
+
+def request_cancel(analysis_id: str, in_flight: str = "finish") -> str:
+    """
+    Cancel an analysis. A job that hasn't been leased yet is canceled outright;
+    a running analysis is marked "canceling" and its worker stops it
+    cooperatively (see runner.py). Returns the analysis status afterwards.
+    """
+    init_db()
+    with Session() as session:
+        analysis = session.query(Analysis).filter_by(id=analysis_id).first()
+        if not analysis:
+            raise KeyError(f"Analysis {analysis_id} not found")
+
+        now = datetime.now()
+        unstarted = session.query(Job).filter_by(analysis_id=analysis_id, status='queued').update(
+            {'status': 'canceled', 'finished_at': now}, synchronize_session=False
+        )
+        if unstarted and analysis.status == 'queued':
+            analysis.status = 'canceled'
+            analysis.finished_at = now
+        elif analysis.status in ('queued', 'running', 'canceling'):
+            analysis.status = 'canceling'
+            analysis.cancel_policy = in_flight
+        session.commit()
+        return analysis.status
+
+
+def _fail_expired_jobs(session, now: datetime):
+    """Jobs whose lease expired after their last allowed attempt are failed, with their analysis."""
+    expired = session.query(Job).filter(
+        Job.status == 'leased', Job.lease_expires_at < now, Job.attempts >= Job.max_attempts
+    ).all()
+    for job in expired:
+        job.status = 'failed'
+        job.error = f"Lease expired after {job.attempts} attempts (worker {job.lease_owner} stopped responding)"
+        job.finished_at = now
+        if job.analysis_id:
+            session.query(Analysis).filter_by(id=job.analysis_id).update(
+                {'status': 'failed', 'error': job.error, 'finished_at': now}
+            )
+    if expired:
+        session.commit()
+        print(f"⚠️ Marked {len(expired)} expired job(s) as failed")
+
+
+def lease_job(worker_id: str, lease_seconds: int = JOB_LEASE_SECONDS) -> Optional[Dict[str, Any]]:
+    """
+    Claim the highest-priority (then oldest) runnable job: queued, or leased
+    with an expired lease. Returns the job, or None if the queue is empty.
+
+    The claim is a conditional UPDATE on the row, so two workers racing for
+    the same job can't both win; the loser simply tries the next candidate.
+    """
+    with Session() as session:
+        while True:
+            now = datetime.now()
+            _fail_expired_jobs(session, now)
+            runnable = or_(
+                Job.status == 'queued',
+                and_(Job.status == 'leased', Job.lease_expires_at < now),
+            )
+            candidate = (
+                session.query(Job.id, Job.status, Job.lease_owner)
+                .filter(runnable)
+                .order_by(Job.priority.desc(), Job.created_at)
+                .first()
+            )
+            if candidate is None:
+                return None
+
+            claimed = session.query(Job).filter(Job.id == candidate.id, runnable).update({
+                'status': 'leased',
+                'lease_owner': worker_id,
+                'lease_expires_at': now + timedelta(seconds=lease_seconds),
+                'heartbeat_at': now,
+                'attempts': Job.attempts + 1,
+            }, synchronize_session=False)
+            session.commit()
+            if claimed:
+                if candidate.status == 'leased':
+                    print(f"♻️ Re-leasing job {candidate.id} from unresponsive worker {candidate.lease_owner}")
+                return _job_dict(session.query(Job).filter_by(id=candidate.id).first())
+
+
+def heartbeat_job(job_id: str, worker_id: str, lease_seconds: int = JOB_LEASE_SECONDS) -> bool:
+    """Extend the lease. Returns False if this worker no longer holds it."""
+    now = datetime.now()
+    with Session() as session:
+        renewed = session.query(Job).filter_by(id=job_id, lease_owner=worker_id, status='leased').update({
+            'lease_expires_at': now + timedelta(seconds=lease_seconds),
+            'heartbeat_at': now,
+        }, synchronize_session=False)
+        session.commit()
+        return bool(renewed)
+
+
+def complete_job(job_id: str, worker_id: str):
+    _finish_job(job_id, worker_id, status='done')
+
+
+def fail_job(job_id: str, worker_id: str, error: str):
+    """Record a handler error; the job is queued again while attempts remain."""
+    with Session() as session:
+        job = session.query(Job).filter_by(id=job_id, lease_owner=worker_id).first()
+        if job and job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.lease_owner = None
+            job.lease_expires_at = None
+            job.error = error
+            session.commit()
+            return
+    _finish_job(job_id, worker_id, status='failed', error=error)
+
+
+def _finish_job(job_id: str, worker_id: str, status: str, error: Optional[str] = None):
+    with Session() as session:
+        session.query(Job).filter_by(id=job_id, lease_owner=worker_id).update({
+            'status': status,
+            'error': error,
+            'lease_expires_at': None,
+            'finished_at': datetime.now(),
+        }, synchronize_session=False)
+        session.commit()
@@ -1,18 +1,28 @@
 # server/main.py
 from __future__ import annotations
 import io
+import json
+import asyncio
 import pandas as pd
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Response, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Dict, Optional
-from models import DatasetInfo, ExecuteRequest, ExecuteResponse, RunStatus, CompilerRequest, CompilerResponse, DatasetWithHead, AnalysisSummary, FullAnalysis, SaveGraphRequest
-from storage import init_db, save_dataset, get_datasets, get_analysis, get_analyses, create_analysis, save_graph, get_saved_graphs, get_saved_graph, get_dataset_df, delete_dataset_record
+from typing import Any, List, Dict, Literal, Optional
+from models import DatasetInfo, ExecuteRequest, ExecuteResponse, RunStatus, CompilerRequest, CompilerResponse, DatasetWithHead, AnalysisSummary, FullAnalysis, SaveGraphRequest, JobStatus, CancelRequest, DatasetStatus, QueryRequest, QueryResponse, UploadCreate, UploadStatus, UploadComplete, GraphRunRequest
+from storage import init_db, get_datasets, get_dataset, get_dataset_status, get_analysis, get_analyses, create_analysis, save_graph, get_saved_graphs, get_saved_graph, get_dataset_df, get_dataset_file_path, df_records, iter_dataset_csv, delete_dataset_record, get_analysis_states, get_analysis_summaries, update_analysis, page_cursor, create_upload, get_upload, get_latest_completed_analysis, ACTIVE_STATUSES
 import os
 import sys
 import traceback
-from runner import run_flow_background
-from starlette.responses import FileResponse
+from df_cache import df_cache
+from query import run_query
+from summaries import summarize_artifacts
+from artifacts import artifact_file, read_artifact, iter_artifact_ndjson, iter_artifact_csv
+from jobs import enqueue_job, get_job, request_cancel
+from ingestion import receive_upload, receive_append, resume_pending_ingestions
+from uploads import UPLOAD_SUFFIXES, OffsetMismatch, write_chunk, complete_upload, abort_upload
+from config import PROGRESS_STREAM_SECONDS, PREVIEW_ROWS, ARTIFACT_PAGE_SIZE, ANALYSIS_PAGE_SIZE, MAX_ANALYSIS_PAGE_SIZE, DATASET_PAGE_SIZE, MAX_DATASET_PAGE_SIZE
+from starlette.responses import FileResponse, StreamingResponse
 from Compiler.function_registry import FUNCTION_REGISTRY
+from Compiler.compiler import plan_incremental, IncrementalUnavailable
 
 app = FastAPI(title="Transcript Analysis MVP", version="0.1.0")
 
@@ -23,41 +33,140 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "X-Next-Cursor"],
 )
 
 @app.on_event("startup")
 def startup():
     init_db()
+    resume_pending_ingestions()
 
 # ---- Health ----
 @app.get("/health")
 def health():
     return {"ok": True}
 
+# ---- Cache ----
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit/miss counts and memory use of this API process's DataFrame cache (workers log their own)."""
+    return df_cache.stats()
+
 # ---- Datasets ----
 @app.post("/datasets")
 async def upload_dataset(file: UploadFile = File(...)):
     """
-    Accept a CSV (MVP). Reads into pandas and stores in memory.
+    Accept a CSV, optionally gzip/zip/zstd-compressed. The file is streamed to
+    disk and parsed in the background; poll GET /datasets/{id}/status until it
+    is "ready". Large files should use the resumable /uploads endpoints.
+    """
+    if not file.filename.lower().endswith(UPLOAD_SUFFIXES):
+        raise HTTPException(400, f"Only CSV supported ({', '.join(UPLOAD_SUFFIXES)})")
+    ds_id = await receive_upload(file)
+    return {"success": True, "dataset_id": ds_id, "status": "ingesting"}
+
+# ---- Chunked uploads ----
+@app.post("/uploads", response_model=UploadStatus)
+def start_upload(req: UploadCreate):
+    """Open a resumable upload; send the file with PUT /uploads/{id}?offset=N, then POST .../complete."""
+    if not req.filename.lower().endswith(UPLOAD_SUFFIXES):
+        raise HTTPException(400, f"Only CSV supported ({', '.join(UPLOAD_SUFFIXES)})")
+    return create_upload(req.filename, req.total_bytes)
+
+@app.get("/uploads/{upload_id}", response_model=UploadStatus)
+def get_upload_status(upload_id: str):
+    """`offset` is where to resume after an interrupted chunk."""
+    try:
+        return get_upload(upload_id)
+    except KeyError:
+        raise HTTPException(404, "Upload not found")
+
+@app.put("/uploads/{upload_id}", response_model=UploadStatus)
+async def put_upload_chunk(upload_id: str, request: Request, offset: int = Query(..., ge=0),
+                           x_chunk_sha256: Optional[str] = Header(None)):
+    """
+    Append the request body at `offset`. A wrong offset gets 409 with the
+    current offset; a chunk failing its X-Chunk-SHA256 check gets 400 and is
+    discarded, so the client just resends it.
+    """
+    try:
+        return await write_chunk(upload_id, offset, request.stream(), x_chunk_sha256)
+    except KeyError:
+        raise HTTPException(404, "Upload not found")
+    except OffsetMismatch as e:
+        raise HTTPException(409, {"message": str(e), "offset": e.offset})
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+@app.post("/uploads/{upload_id}/complete")
+async def finish_upload(upload_id: str, req: UploadComplete):
+    """Assemble the upload into a dataset and start ingestion, as POST /datasets does."""
+    try:
+        ds_id = await complete_upload(upload_id, req.sha256)
+    except KeyError:
+        raise HTTPException(404, "Upload not found")
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return {"success": True, "dataset_id": ds_id, "status": "ingesting"}
+
+@app.delete("/uploads/{upload_id}")
+async def cancel_upload(upload_id: str):
+    try:
+        await abort_upload(upload_id)
+    except KeyError:
+        raise HTTPException(404, "Upload not found")
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return {"success": True}
+
+@app.post("/datasets/{dataset_id}/rows")
+async def append_dataset(dataset_id: str, file: UploadFile = File(...)):
+    """
+    Append the rows of a CSV with the dataset's columns (compressed like
+    uploads, if needed). Existing rows keep their ids (positions); rerun a
+    saved graph with POST /saved-graphs/{id}/run to process only the new rows.
     """
-    if not file.filename.endswith(".csv"):
-        raise HTTPException(400, "Only CSV supported")
-    ds_id = save_dataset(file, file.filename)
-    return {"success": True, "dataset_id": ds_id}
+    if not file.filename.lower().endswith(UPLOAD_SUFFIXES):
+        raise HTTPException(400, f"Only CSV supported ({', '.join(UPLOAD_SUFFIXES)})")
+    try:
+        return await receive_append(dataset_id, file)
+    except KeyError:
+        raise HTTPException(404, "Dataset not found")
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+@app.get("/datasets/{dataset_id}/status", response_model=DatasetStatus)
+def get_dataset_ingestion_status(dataset_id: str):
+    try:
+        return get_dataset_status(dataset_id)
+    except KeyError:
+        raise HTTPException(404, "Dataset not found")
 
 @app.get("/datasets", response_model=List[DatasetWithHead])
-def list_datasets():
-    datasets = get_datasets(with_heads=True)
+def list_datasets(response: Response, limit: int = Query(DATASET_PAGE_SIZE, ge=1, le=MAX_DATASET_PAGE_SIZE),
+                  offset: int = Query(0, ge=0), cursor: Optional[str] = None, include_head: bool = True,
+                  content_hash: Optional[str] = None):
+    """
+    Newest first, one page at a time. Heads are the previews stored at
+    ingestion. Pass the X-Next-Cursor header back as `cursor` for the next page.
+    `content_hash` finds every upload of the same content.
+    """
+    try:
+        datasets = get_datasets(with_heads=include_head, limit=limit, offset=offset, cursor=cursor,
+                                content_hash=content_hash)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if len(datasets) == limit:
+        response.headers['X-Next-Cursor'] = page_cursor(datasets[-1])
     return datasets
 
 # Get specific dataset preview
 @app.get("/datasets/{dataset_id}", response_model=DatasetWithHead)
 def get_dataset_preview(dataset_id: str):
-    datasets = get_datasets(with_heads=True)
-    for ds in datasets:
-        if ds['id'] == dataset_id:  # Fixed: Use ['id'] for dict
-            return ds
-    raise HTTPException(404, "Dataset not found")
+    try:
+        return get_dataset(dataset_id)
+    except KeyError:
+        raise HTTPException(404, "Dataset not found")
 
 # Get function registry with argument metadata for FE
 @app.get("/functions")
@@ -106,27 +215,40 @@ def get_dataset_truncated(dataset_id: str, preview_rows: int = 10, max_cell_char
     Return dataset metadata and a truncated preview (first few rows and limited cell length).
     """
     try:
-        df = get_dataset_df(dataset_id)
+        dataset = get_dataset(dataset_id, with_head=preview_rows <= PREVIEW_ROWS)
+        num_rows = dataset['num_rows']
+        if dataset.get('head') is not None:
+            head = dataset['head'][:preview_rows]
+        else:
+            # Only the first row group(s) are decoded
+            head = df_records(get_dataset_df(dataset_id, row_range=(0, preview_rows)))
     except KeyError:
         raise HTTPException(status_code=404, detail="Dataset not found")
 
-    # Take only top rows
-    head_df = df.head(preview_rows)
-
     # Truncate long text cells
     def truncate(value):
         if isinstance(value, str) and len(value) > max_cell_chars:
             return value[:max_cell_chars].rsplit(' ', 1)[0] + "..."
         return value
 
-    truncated_df = head_df.applymap(truncate)
-
     return {
         "id": dataset_id,
-        "head": truncated_df.to_dict(orient="records"),
-        "num_rows": len(df)
+        "head": [{k: truncate(v) for k, v in row.items()} for row in head],
+        "num_rows": num_rows
     }
 
+@app.get("/datasets/{dataset_id}/export")
+def export_dataset(dataset_id: str):
+    """Download the dataset as CSV (streamed from the stored Parquet file)."""
+    try:
+        status = get_dataset_status(dataset_id)
+    except KeyError:
+        raise HTTPException(404, "Dataset not found")
+    if status['status'] != 'ready':
+        raise HTTPException(409, f"Dataset is {status['status']}")
+    return StreamingResponse(iter_dataset_csv(dataset_id), media_type='text/csv',
+                             headers={"Content-Disposition": f'attachment; filename="{dataset_id}.csv"'})
+
 # ---- Delete dataset ----
 @app.delete("/datasets/{dataset_id}")
 def delete_dataset(dataset_id: str):
@@ -144,39 +266,120 @@ def delete_dataset(dataset_id: str):
 
 
 # ---- Run status ----
+# Analysis statuses as reported by RunStatus
+RUN_STATUS = {"completed": "succeeded", "canceling": "running"}
+
 @app.get("/runs/{run_id}", response_model=RunStatus)
 def get_run_status(run_id: str):
+    """A run is an analysis; run_id is the analysis id."""
     try:
-        r = get_run(run_id)
+        r = get_analysis(run_id)
     except KeyError as e:
         raise HTTPException(status_code=404, detail=str(e))
     return RunStatus(
         run_id=run_id,
-        status=r["status"],
+        status=RUN_STATUS.get(r["status"], r["status"]),
         progress=r.get("progress"),
-        logs=r.get("logs", []),
+        logs=[f"{entry.get('function')}: {entry.get('status')}" for entry in r.get("execution_log", [])],
         artifacts=r.get("artifacts", {}),
         error=r.get("error"),
         cost_estimate_usd=r.get("cost_estimate_usd"),
         token_estimate=r.get("token_estimate"),
     )
 
+# ---- Progress events (Server-Sent Events) ----
+async def _analysis_events(analysis_id: Optional[str] = None):
+    """
+    Stream status/progress changes as SSE "analysis" events. Workers persist
+    progress to SQLite in batches; this polls those rows (status and progress
+    only) and sends only what changed. A single-analysis stream ends with a
+    "done" event once the analysis finishes; the all-analyses stream stays open.
+    """
+    sent: Dict[str, Any] = {}
+    tracked = {analysis_id} if analysis_id else set()
+    idle_ticks = 0
+    while True:
+        states = await asyncio.to_thread(get_analysis_states, tracked, analysis_id is None)
+        changed = False
+        for state in states:
+            if sent.get(state["id"]) != state:
+                sent[state["id"]] = state
+                changed = True
+                yield f"event: analysis\ndata: {json.dumps(state)}\n\n"
+        # Keep following analyses until we've sent their final state
+        tracked = {state["id"] for state in states if state["status"] in ACTIVE_STATUSES}
+
+        if analysis_id:
+            if not states:
+                yield f"event: error\ndata: {json.dumps({'detail': 'Analysis not found'})}\n\n"
+                return
+            if states[0]["status"] not in ACTIVE_STATUSES:
+                yield f"event: done\ndata: {json.dumps(states[0])}\n\n"
+                return
+
+        idle_ticks = 0 if changed else idle_ticks + 1
+        if idle_ticks * PROGRESS_STREAM_SECONDS >= 15:
+            idle_ticks = 0
+            yield ": keep-alive\n\n"
+        await asyncio.sleep(PROGRESS_STREAM_SECONDS)
+
+def _event_stream(generator):
+    return StreamingResponse(generator, media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/analyses/events")
+def stream_all_analysis_events():
+    """SSE: status/progress of every unfinished analysis, as it changes."""
+    return _event_stream(_analysis_events())
+
+@app.get("/analyses/{analysis_id}/events")
+def stream_analysis_events(analysis_id: str):
+    """SSE: status/progress of one analysis until it finishes."""
+    return _event_stream(_analysis_events(analysis_id))
+
 # ---- Compiler endpoint ----
 @app.post("/compiler/run")
-def run_compiler(req: CompilerRequest, background_tasks: BackgroundTasks):
+def run_compiler(req: CompilerRequest):
+    """Queue the analysis; a worker process (worker.py) picks it up."""
     try:
-        analysis_id = create_analysis(req.dataset_id)
-        background_tasks.add_task(run_flow_background, analysis_id=analysis_id, dataset_id=req.dataset_id, path_request=req.path_request)
-        return {"analysis_id": analysis_id}
+        analysis_id = create_analysis(req.dataset_id, path_request=req.path_request)
+        job_id = enqueue_job(
+            "run_flow",
+            {"analysis_id": analysis_id, "dataset_id": req.dataset_id, "path_request": req.path_request},
+            priority=req.priority,
+            analysis_id=analysis_id,
+        )
+        return {"analysis_id": analysis_id, "job_id": job_id}
     except KeyError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to start analysis: {str(e)}")
 
+# ---- Jobs ----
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+def get_job_status(job_id: str):
+    try:
+        return get_job(job_id)
+    except KeyError:
+        raise HTTPException(404, "Job not found")
+
 # GET /analyses
 @app.get("/analyses", response_model=List[AnalysisSummary])
-def list_analyses():
-    return get_analyses()
+def list_analyses(response: Response, limit: int = Query(ANALYSIS_PAGE_SIZE, ge=1, le=MAX_ANALYSIS_PAGE_SIZE),
+                  cursor: Optional[str] = None, status: Optional[str] = None, dataset_id: Optional[str] = None,
+                  include_log: bool = False):
+    """
+    Newest first, one keyset page at a time; pass the X-Next-Cursor header
+    back as `cursor`. Execution logs are left out unless `include_log`.
+    """
+    try:
+        analyses = get_analyses(limit=limit, cursor=cursor, status=status, dataset_id=dataset_id,
+                                include_log=include_log)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if len(analyses) == limit:
+        response.headers['X-Next-Cursor'] = page_cursor(analyses[-1])
+    return analyses
 
 # GET /analyses/{analysis_id}
 @app.get("/analyses/{analysis_id}", response_model=FullAnalysis)
@@ -186,32 +389,183 @@ def get_specific_analysis(analysis_id: str):
     except KeyError:
         raise HTTPException(404, "Analysis not found")
 
+@app.post("/analyses/{analysis_id}/cancel")
+def cancel_analysis(analysis_id: str, req: Optional[CancelRequest] = None):
+    """
+    Stop an analysis. New LLM requests stop within a few seconds; requests
+    already in flight finish or are abandoned per `in_flight`. Rows finished
+    so far are saved as artifacts and the analysis ends as "canceled".
+    """
+    req = req or CancelRequest()
+    try:
+        status = request_cancel(analysis_id, req.in_flight)
+    except KeyError:
+        raise HTTPException(404, "Analysis not found")
+    if status not in ("canceling", "canceled"):
+        raise HTTPException(409, f"Analysis already {status}")
+    return {"analysis_id": analysis_id, "status": status}
+
 @app.get("/analyses/{analysis_id}/artifacts/{artifact_key}")
-def get_artifact(analysis_id: str, artifact_key: str, format: Optional[str] = 'csv', nrows: Optional[int] = None):
-    analysis = get_analysis(analysis_id)
-    artifacts = analysis['artifacts']
-    value = artifacts[artifact_key]
-    print(f"Debug: artifact_key={artifact_key}, type(value)={type(value)}, value={value}")
-    if isinstance(value, (list, tuple)) and len(value) == 3 and isinstance(value[0], str):
-        path = value[0]
-    elif isinstance(value, str):
-        path = value
-    else:
+def get_artifact(analysis_id: str, artifact_key: str, response: Response,
+                 format: Literal['csv', 'json', 'ndjson'] = 'csv',
+                 offset: int = Query(0, ge=0), limit: Optional[int] = Query(None, ge=0),
+                 nrows: Optional[int] = Query(None, ge=0), columns: Optional[str] = None,
+                 sort: Optional[str] = None, filter: Optional[List[str]] = Query(None)):
+    """
+    Read an artifact. format=csv downloads the whole file; json returns one
+    page of rows (total matching rows in the X-Total-Count header); ndjson
+    streams the matching rows. `columns` is comma-separated, `sort` is
+    comma-separated with "-" for descending, each `filter` is
+    column:op:value (eq, ne, lt, le, gt, ge, in, contains, null, notnull).
+    `nrows` is the old name for `limit`.
+    """
+    try:
+        value = get_analysis(analysis_id)['artifacts'][artifact_key]
+    except KeyError:
+        raise HTTPException(404, "Artifact not found")
+    path = artifact_file(value)
+    if path is None:
         raise HTTPException(404, "Artifact not found or not a file")
-    print(f"Debug: extracted path={path}")
-    if format == 'json':
-        df = pd.read_csv(path, nrows=nrows)
-        return df.to_dict(orient='records')
-    else:
+
+    limit = limit if limit is not None else nrows
+    selected = [c.strip() for c in columns.split(',') if c.strip()] if columns else None
+    try:
+        if format == 'json':
+            table, total = read_artifact(path, selected, offset, limit if limit is not None else ARTIFACT_PAGE_SIZE,
+                                         sort, filter)
+            response.headers['X-Total-Count'] = str(total)
+            return table.to_pylist()
+        if format == 'ndjson':
+            rows = iter_artifact_ndjson(path, selected, offset, limit, sort, filter)
+            return StreamingResponse(rows, media_type='application/x-ndjson')
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    if not path.endswith('.parquet'):
         return FileResponse(path, media_type='text/csv', filename=f"{artifact_key}.csv")
+    return StreamingResponse(iter_artifact_csv(path), media_type='text/csv',
+                             headers={"Content-Disposition": f'attachment; filename="{artifact_key}.csv"'})
 
 
 
+@app.get("/analyses/{analysis_id}/summary")
+def get_analysis_summary(analysis_id: str):
+    """
+    Per-artifact value counts, crosstabs, list-column frequencies and group
+    sizes, computed when the run finished. Analyses that finished before
+    summaries existed are summarized on first request and stored.
+    """
+    try:
+        status, artifacts, summaries = get_analysis_summaries(analysis_id)
+    except KeyError:
+        raise HTTPException(404, "Analysis not found")
+    if summaries is None:
+        if status not in ('completed', 'canceled'):
+            raise HTTPException(409, f"Analysis is {status}")
+        summaries = summarize_artifacts(artifacts)
+        update_analysis(analysis_id, summaries=summaries)
+    return {"analysis_id": analysis_id, "artifacts": summaries}
+
+# ---- Queries ----
+@app.post("/analyses/{analysis_id}/query", response_model=QueryResponse)
+def query_analysis(analysis_id: str, req: QueryRequest):
+    """
+    Aggregate an artifact, e.g. label distributions
+    ({"artifact": "df_out", "group_by": ["follow_up_label"]}) or crosstabs
+    (group_by two label columns). Only the columns used are scanned.
+    """
+    if not req.artifact:
+        raise HTTPException(400, "artifact is required")
+    try:
+        value = get_analysis(analysis_id)['artifacts'][req.artifact]
+    except KeyError:
+        raise HTTPException(404, "Artifact not found")
+    path = artifact_file(value)
+    if path is None:
+        raise HTTPException(404, "Artifact not found or not a file")
+    try:
+        return run_query(path, req)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+@app.post("/datasets/{dataset_id}/query", response_model=QueryResponse)
+def query_dataset(dataset_id: str, req: QueryRequest):
+    """Same as /analyses/{id}/query, over an uploaded dataset."""
+    try:
+        path = get_dataset_file_path(dataset_id)
+    except KeyError:
+        raise HTTPException(404, "Dataset not found")
+    try:
+        return run_query(path, req)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+
 @app.post("/saved-graphs")
 def save_graph_endpoint(req: SaveGraphRequest):
     graph_id = save_graph(req.name, req.path)
     return {"graph_id": graph_id}
 
+@app.post("/saved-graphs/{graph_id}/run")
+def run_saved_graph(graph_id: str, req: GraphRunRequest):
+    """
+    Queue a run of a saved graph on a dataset. If this graph already completed
+    on the dataset, only rows appended since then go through row-local steps,
+    steps that need all rows are recomputed only when their input changed,
+    and the previous artifacts are extended ("mode": "incremental"). With no
+    new rows the previous analysis is returned ("up_to_date"). Otherwise, or
+    with `incremental: false`, the graph runs on all rows ("full").
+    """
+    try:
+        path = get_saved_graph(graph_id)['path']
+        status = get_dataset_status(req.dataset_id)
+    except KeyError as e:
+        raise HTTPException(404, str(e))
+    except ValueError as e:
+        raise HTTPException(500, str(e))
+    if status['status'] != 'ready':
+        raise HTTPException(409, f"Dataset is {status['status']}")
+
+    base, plan, reason = None, None, None
+    if req.incremental:
+        base = get_latest_completed_analysis(req.dataset_id, path)
+        if base is None:
+            reason = "No completed run of this graph on the dataset"
+        elif base['dataset_rows'] > status['num_rows']:
+            base, reason = None, "The dataset has fewer rows than the previous run"
+        else:
+            try:
+                plan = plan_incremental(path)
+                outputs = {"starting_df"} | {step["output_df_name"] for step in path}
+                missing = sorted(name for name in outputs if artifact_file(base['artifacts'].get(name)) is None)
+                if missing:
+                    raise IncrementalUnavailable(f"The previous run has no saved results for {', '.join(missing)}")
+            except IncrementalUnavailable as e:
+                base, plan, reason = None, None, str(e)
+            except ValueError as e:
+                raise HTTPException(400, str(e))
+
+    if base is not None and base['dataset_rows'] == status['num_rows']:
+        return {"analysis_id": base['id'], "job_id": None, "mode": "up_to_date", "new_rows": 0}
+
+    analysis_id = create_analysis(req.dataset_id, path_request=path, base_analysis_id=base and base['id'])
+    job_id = enqueue_job(
+        "run_flow",
+        {"analysis_id": analysis_id, "dataset_id": req.dataset_id, "path_request": path,
+         "base_analysis_id": base and base['id']},
+        priority=req.priority,
+        analysis_id=analysis_id,
+    )
+    return {
+        "analysis_id": analysis_id,
+        "job_id": job_id,
+        "mode": "incremental" if base else "full",
+        "base_analysis_id": base and base['id'],
+        "new_rows": status['num_rows'] - (base['dataset_rows'] if base else 0),
+        "plan": plan,
+        "reason": reason,
+    }
+
 # GET list of saved graphs
 @app.get("/saved-graphs")
 def list_saved_graphs():
@@ -29,18 +29,48 @@ class DatasetInfo(BaseModel):
     filename: str
     n_rows: int
 
+class ColumnInfo(BaseModel):
+    name: str
+    dtype: str
+    null_count: Optional[int] = None
+
 class DatasetWithHead(BaseModel):
     id: str
     original_filename: str
-    num_rows: int
+    num_rows: Optional[int] = None  # None while ingesting
+    status: Literal["ingesting", "ready", "failed"] = "ready"
+    content_hash: Optional[str] = None  # SHA-256 of the uploaded CSV; equal for duplicate uploads
     created_at: Optional[str] = None
+    columns: Optional[List[ColumnInfo]] = None
     head: Optional[List[Dict[str, Any]]] = None
 
+class DatasetStatus(BaseModel):
+    id: str
+    status: Literal["ingesting", "ready", "failed"]
+    num_rows: Optional[int] = None
+    error: Optional[str] = None
+    content_hash: Optional[str] = None
+
+class UploadCreate(BaseModel):
+    filename: str
+    total_bytes: Optional[int] = Field(None, ge=1)  # if given, completion checks it
+
+class UploadStatus(BaseModel):
+    upload_id: str
+    filename: str
+    total_bytes: Optional[int] = None
+    offset: int  # bytes received; the next chunk must start here
+    status: Literal["open", "complete", "aborted"]
+    dataset_id: Optional[str] = None
+
+class UploadComplete(BaseModel):
+    sha256: Optional[str] = None  # hex digest of the whole file, checked if given
+
 # ---- Runs ----
 class RunStatus(BaseModel):
     run_id: str
     status: Literal["queued", "running", "succeeded", "failed", "canceled"]
-    progress: Optional[Dict[str, Any]] = None   # e.g. {"step_idx": 2, "of": 4, "processed": 120, "total": 800}
+    progress: Optional[Dict[str, Any]] = None   # e.g. {"step_idx": 2, "of": 4, "processed": 120, "total": 800, "errors": 0, "rows_per_s": 3.1, "eta_s": 219.4}
     logs: List[str] = Field(default_factory=list)
     artifacts: Dict[str, Any] = Field(default_factory=dict)  # URIs or inline small JSON
     error: Optional[str] = None
@@ -62,6 +92,7 @@ class AnalysisSummary(BaseModel):
     execution_log: List[Dict[str, Any]] = Field(default_factory=list)
     created_at: Optional[str] = None
     finished_at: Optional[str] = None
+    progress: Optional[Dict[str, Any]] = None
 
 class FullAnalysis(BaseModel):
     id: str
@@ -72,12 +103,16 @@ class FullAnalysis(BaseModel):
     error: Optional[str] = None
     created_at: Optional[str] = None
     finished_at: Optional[str] = None
+    progress: Optional[Dict[str, Any]] = None
+    dataset_rows: Optional[int] = None  # results cover dataset rows [0, dataset_rows)
+    base_analysis_id: Optional[str] = None  # incremental runs: the analysis they extended
 
 # ---- Compiler specific models ----
 class CompilerRequest(BaseModel):
     dataset_id: str
     path_request: List[Dict[str, Any]] = Field(..., description="List of function calls with input_df_name and output_df_name")
     local_csv_path: Optional[str] = None  # Path to local CSV when dataset_id is "local_df"
+    priority: int = 0  # higher-priority jobs are leased first
 
 class CompilerResponse(BaseModel):
     success: bool
@@ -88,6 +123,53 @@ class CompilerResponse(BaseModel):
 
 
 
+class CancelRequest(BaseModel):
+    # What happens to LLM requests already sent: let them finish (results kept) or abandon them
+    in_flight: Literal["finish", "abort"] = "finish"
+
+# ---- Queries ----
+class QueryAggregation(BaseModel):
+    op: Literal["count", "count_distinct", "sum", "mean", "min", "max"] = "count"
+    column: Optional[str] = None  # None with op "count": number of rows
+    name: Optional[str] = None  # output column (default "<column>_<op>", or "count")
+
+class QueryRequest(BaseModel):
+    artifact: Optional[str] = None  # artifact key (analysis queries only)
+    group_by: List[str] = Field(default_factory=list)
+    aggregations: List[QueryAggregation] = Field(default_factory=list)  # default: row count
+    filters: List[str] = Field(default_factory=list)  # "column:op:value", as for artifact reads
+    explode: Optional[str] = None  # list column to unnest first (e.g. extracted categories)
+    sort: Optional[str] = None  # e.g. "-count"; default: first aggregation descending
+    limit: int = Field(1000, ge=1, le=10000)
+
+class QueryResponse(BaseModel):
+    columns: List[str]
+    rows: List[Dict[str, Any]]
+    num_groups: int
+    scanned_rows: int
+    elapsed_ms: float
+
+# ---- Jobs ----
+class JobStatus(BaseModel):
+    id: str
+    kind: str
+    analysis_id: Optional[str] = None
+    priority: int = 0
+    status: Literal["queued", "leased", "done", "failed", "canceled"]
+    attempts: int = 0
+    max_attempts: int
+    lease_owner: Optional[str] = None
+    heartbeat_at: Optional[str] = None
+    error: Optional[str] = None
+    created_at: Optional[str] = None
+    finished_at: Optional[str] = None
+
+class GraphRunRequest(BaseModel):
+    dataset_id: str
+    # Reuse the latest completed run of this graph on the dataset and process only rows appended since
+    incremental: bool = True
+    priority: int = 0
+
 class SaveGraphRequest(BaseModel):
     name: str
     path: List[Dict[str, Any]]
\ No newline at end of file
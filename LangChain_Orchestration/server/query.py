@@ -0,0 +1,92 @@
+# server/query.py
+"""
+Aggregations over artifacts and datasets (POST /analyses/{id}/query,
+POST /datasets/{id}/query).
+
+Queries run on Arrow compute over the Parquet file: only the columns the
+query touches are read, filters are pushed into the scan, and grouping is
+vectorized, so only the (small) aggregate is materialized in Python.
+"""
+from __future__ import annotations
+import time
+from typing import Any, Dict, List
+import pyarrow as pa
+import pyarrow.compute as pc
+from artifacts import arrow_source, parse_filters, check_columns, parse_sort
+
+# Query op -> Arrow hash aggregation
+AGGREGATIONS = {
+    'count': 'count',  # non-null values of `column`; rows if no column
+    'count_distinct': 'count_distinct',
+    'sum': 'sum',
+    'mean': 'mean',
+    'min': 'min',
+    'max': 'max',
+}
+
+
+def _explode(table: pa.Table, column: str) -> pa.Table:
+    """One row per list element of `column` (rows with empty/missing lists drop out)."""
+    if not pa.types.is_list(table.schema.field(column).type):
+        return table
+    parents = pc.list_parent_indices(table[column])
+    exploded = {name: (pc.list_flatten(table[column]) if name == column else pc.take(table[name], parents))
+                for name in table.column_names}
+    return pa.table(exploded)
+
+
+def run_query(path: str, query) -> Dict[str, Any]:
+    """
+    Run a QueryRequest (models.py) against a Parquet/CSV file.
+
+    Returns:
+        {"columns", "rows", "num_groups", "scanned_rows", "elapsed_ms"}; rows
+        are sorted by `query.sort` (default: first aggregation, descending) and
+        cut to `query.limit`.
+    """
+    started = time.perf_counter()
+    source = arrow_source(path)
+    schema = source.schema
+
+    aggregations = query.aggregations or []
+    used = list(query.group_by) + [agg.column for agg in aggregations if agg.column]
+    if query.explode:
+        used.append(query.explode)
+    check_columns(schema, used)
+
+    table = source.to_table(columns=list(dict.fromkeys(used)), filter=parse_filters(query.filters, schema))
+    scanned_rows = table.num_rows
+    if query.explode:
+        table = _explode(table, query.explode)
+
+    arrow_aggregations, names = [], []
+    for agg in aggregations:
+        if agg.column is None and agg.op != 'count':
+            raise ValueError(f"{agg.op} needs a column")
+        if agg.column is None:
+            arrow_aggregations.append(([], 'count_all'))
+            names.append(agg.name or 'count')
+        else:
+            arrow_aggregations.append((agg.column, AGGREGATIONS[agg.op]))
+            names.append(agg.name or f"{agg.column}_{agg.op}")
+    if not arrow_aggregations:
+        arrow_aggregations, names = [([], 'count_all')], ['count']
+
+    result = table.group_by(list(query.group_by)).aggregate(arrow_aggregations)
+    # Arrow names aggregates "<column>_<function>" ("count_all" for rows); the key/aggregate order varies by version
+    arrow_names = {('count_all' if column == [] else f"{column}_{function}"): name
+                   for (column, function), name in zip(arrow_aggregations, names)}
+    result = result.rename_columns([arrow_names.get(c, c) for c in result.column_names])
+    result = result.select(list(query.group_by) + names)
+
+    sort_keys = parse_sort(query.sort, result.schema) if query.sort else [(names[0], 'descending')]
+    result = result.sort_by(sort_keys)
+    num_groups = result.num_rows
+    rows: List[Dict[str, Any]] = result.slice(0, query.limit).to_pylist()
+    return {
+        'columns': result.column_names,
+        'rows': rows,
+        'num_groups': num_groups,
+        'scanned_rows': scanned_rows,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
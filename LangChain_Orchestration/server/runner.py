@@ -2,9 +2,15 @@
 from __future__ import annotations
 from typing import List, Dict, Any, Tuple
 import traceback
+import threading
+import time
 import pandas as pd
 from concurrent.futures import ThreadPoolExecutor
-from storage import get_dataset_df, update_analysis, DATA_DIR
+from df_cache import df_cache
+from artifacts import artifact_file, write_artifact, append_artifact, read_artifact_df
+from summaries import summarize_artifacts
+from storage import get_dataset_df, get_analysis, update_analysis, transition_analysis, get_analysis_status, DATA_DIR
+from config import CANCEL_POLL_SECONDS, PROGRESS_FLUSH_SECONDS
 from pydantic import BaseModel
 import smtplib
 import os
@@ -18,33 +24,135 @@ COMPILER_DIR = os.path.join(ROOT, "Compiler")
 if COMPILER_DIR not in sys.path:
     sys.path.append(COMPILER_DIR)
 
-from compiler import compile_and_run, FUNCTION_REGISTRY  # your existing code
+from compiler import compile_and_run, compile_and_run_incremental, FUNCTION_REGISTRY  # your existing code
+from Functions.run_context import CancelToken, RunProgress
+
+
+def _monitor_run(analysis_id: str, cancel_token: CancelToken, progress: RunProgress, done: threading.Event):
+    """
+    Runs beside the analysis: writes progress to SQLite in batches (at most every
+    PROGRESS_FLUSH_SECONDS, only when it changed) and trips the cancel token once
+    POST /analyses/{id}/cancel is received.
+    """
+    written_version, last_cancel_check = -1, time.monotonic()
+    while not done.wait(PROGRESS_FLUSH_SECONDS):
+        try:
+            if progress.version != written_version:
+                written_version = progress.version
+                update_analysis(analysis_id, progress=progress.snapshot())
+            if not cancel_token.is_canceled() and time.monotonic() - last_cancel_check >= CANCEL_POLL_SECONDS:
+                last_cancel_check = time.monotonic()
+                status, policy = get_analysis_status(analysis_id)
+                if status == 'canceling':
+                    print(f"🛑 Canceling analysis {analysis_id} (in-flight requests: {policy or 'finish'})")
+                    cancel_token.cancel(policy or "finish")
+        except Exception as e:
+            print(f"⚠️ Run monitor failed for {analysis_id}: {e}")
+
+def _run_incremental(base_analysis_id: str, dataset_id: str, path_request: List[Dict[str, Any]],
+                     cancel_token: CancelToken, progress: RunProgress):
+    """
+    Run the steps over the rows appended since the base analysis. Returns
+    (state, execution_log, appended, reused, base_artifacts, dataset_rows);
+    states in `appended` are new rows to add to the base artifact of the same
+    name, states in `reused` keep the base artifact as it is.
+    """
+    base = get_analysis(base_analysis_id)
+    start = base['dataset_rows']
+    # Row ids are dataset positions: everything from the base's row count on is new
+    new_rows = get_dataset_df(dataset_id, row_range=(start, None))
+    print(f"➕ Incremental run over {len(new_rows)} new rows (base {base_analysis_id}: {start} rows)")
+    previous = lambda name: read_artifact_df(artifact_file(base['artifacts'][name]))
+    state, execution_log, appended, reused = compile_and_run_incremental(
+        path_request, new_rows, previous, cancel_token=cancel_token, progress=progress
+    )
+    return state, execution_log, appended, reused, base['artifacts'], start + len(new_rows)
+
+def _abandoned(analysis_id: str, cancel_token: CancelToken) -> bool:
+    """
+    True if the run was stopped without a user cancel: the worker lost its job
+    lease (worker.py) and another worker owns the analysis now, so this run
+    must not write anything.
+    """
+    return cancel_token.is_canceled() and get_analysis_status(analysis_id)[0] != 'canceling'
 
 # --- token/cost estimate: very rough heuristic for dry-run ---
-def run_flow_background(analysis_id: str, dataset_id: str, path_request: List[Dict[str, Any]]):
-    """Runs in a background task/thread. Updates RUNS store as we go."""
-    update_analysis(analysis_id, status="running")
+def run_flow_background(analysis_id: str, dataset_id: str, path_request: List[Dict[str, Any]],
+                        base_analysis_id: str = None, cancel_token: CancelToken = None):
+    """
+    Runs in a worker process (see worker.py). Updates the analysis record as it goes.
+    With `base_analysis_id`, only rows appended since that analysis are processed
+    and its artifacts are extended (see /saved-graphs/{id}/run). The worker passes
+    a `cancel_token` that it trips if it loses the job lease.
+    """
+    # A re-leased job may find its analysis already running; a canceled one never starts,
+    # and one a previous attempt already finished is left as it is
+    if not transition_analysis(analysis_id, ["queued", "running"], "running"):
+        if transition_analysis(analysis_id, ["canceling"], "canceled"):
+            print(f"🛑 Analysis {analysis_id} was canceled before it started")
+        else:
+            print(f"⏭️ Analysis {analysis_id} is already {get_analysis_status(analysis_id)[0]}; nothing to run")
+        return
     # append_log equivalent: we'll collect logs in memory and update at end
 
+    cancel_token = cancel_token or CancelToken()
+    progress = RunProgress()
+    done = threading.Event()
+    monitor = threading.Thread(target=_monitor_run, args=(analysis_id, cancel_token, progress, done), daemon=True)
+    monitor.start()
+
     try:
-        df = get_dataset_df(dataset_id)
         print('path_request', path_request)
-        state, execution_log = compile_and_run(path_request, df)
+        if base_analysis_id:
+            state, execution_log, appended, reused, base_artifacts, dataset_rows = _run_incremental(
+                base_analysis_id, dataset_id, path_request, cancel_token, progress
+            )
+        else:
+            df = get_dataset_df(dataset_id)
+            print(f"📦 DataFrame cache: {df_cache.stats()}")
+            state, execution_log = compile_and_run(path_request, df, cancel_token=cancel_token, progress=progress)
+            appended, reused, base_artifacts, dataset_rows = set(), set(), {}, len(df)
+        # Stop the monitor so its last progress write can't race the final status update
+        done.set()
+        monitor.join()
+        if _abandoned(analysis_id, cancel_token):
+            print(f"⚠️ Abandoning analysis {analysis_id}: this worker lost the job lease")
+            return
         print('We have gotten to the point where we are writing the artifacts')
         # Save artifacts
         artifacts = {}
         artifacts_dir = os.path.join(DATA_DIR, 'artifacts', analysis_id)
         os.makedirs(artifacts_dir, exist_ok=True)
         for key, value in state.items():
-            if isinstance(value, tuple) and len(value) == 3 and isinstance(value[0], pd.DataFrame):
-                csv_path = os.path.join(artifacts_dir, f"{key}.csv")
-                value[0].to_csv(csv_path, index=False)
-                #artifacts[key] = (csv_path, value[1], value[2])  # Replace DF with path, keep structure
-                artifacts[key] = csv_path  
+            if key in reused:
+                # No new rows reached this step: point at the base run's file, it is never rewritten
+                artifacts[key] = base_artifacts[key]
+            elif key in appended:
+                # The base run's rows followed by the new ones
+                artifacts[key] = append_artifact(artifact_file(base_artifacts[key]), value[0],
+                                                 os.path.join(artifacts_dir, f"{key}.parquet"))
+            elif isinstance(value, tuple) and len(value) == 3 and isinstance(value[0], pd.DataFrame):
+                # Parquet with row groups, so pages/columns can be read without loading it (artifacts.py)
+                artifacts[key] = write_artifact(value[0], os.path.join(artifacts_dir, f"{key}.parquet"))
             else:
                 artifacts[key] = value  # Small/serializable values as-is
+        # Value counts, crosstabs etc. for the insight visualizer, so it never scans the artifacts
+        summaries = summarize_artifacts(artifacts)
+
+        # Complete only if still 'running': a cancel posted after the monitor stopped
+        # has set 'canceling', and the run ends as canceled instead
+        if cancel_token.is_canceled() or not transition_analysis(
+                analysis_id, ["running"], "completed", execution_log=execution_log, artifacts=artifacts,
+                summaries=summaries, progress=progress.snapshot(), dataset_rows=dataset_rows):
+            # Partial outputs: rows finished before the cancel are in the artifacts
+            update_analysis(analysis_id, status="canceled", execution_log=execution_log, artifacts=artifacts,
+                            summaries=summaries, progress=progress.snapshot())
+            send_email_notification(
+                subject=f"🛑 Analysis {analysis_id} canceled",
+                body=f"Your analysis was canceled. Results finished before the cancel were saved."
+            )
+            return
 
-        update_analysis(analysis_id, status="completed", execution_log=execution_log, artifacts=artifacts)
         send_email_notification(
             subject=f"✅ Analysis {analysis_id} complete",
             body=f"Your analysis is finished! Check the dashboard for results."
@@ -52,11 +160,18 @@ def run_flow_background(analysis_id: str, dataset_id: str, path_request: List[Di
 
     except Exception as e:
         tb = traceback.format_exc()
+        done.set()
+        monitor.join()
+        if _abandoned(analysis_id, cancel_token):
+            print(f"⚠️ Abandoning analysis {analysis_id} ({e}): this worker lost the job lease")
+            return
         update_analysis(analysis_id, status="failed", error=f"{str(e)}\n{tb}", execution_log=[])
         send_email_notification(
             subject=f"❌ Analysis {analysis_id} failed",
             body=f"Error details:\n\n{str(e)}\n\n{tb}"
         )
+    finally:
+        done.set()
 
 def send_email_notification(subject: str, body: str):
     """Send a simple email when an analysis completes or fails."""
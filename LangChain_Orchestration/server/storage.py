@@ -3,14 +3,22 @@ from __future__ import annotations
 from typing import Dict, Any, List
 from dataclasses import dataclass, field
 import uuid
+import contextlib
+import hashlib
 import pandas as pd
-from sqlalchemy import create_engine, Column, String, Integer, Text, DateTime, ForeignKey
-from sqlalchemy.orm import sessionmaker, declarative_base
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+from sqlalchemy import create_engine, event, inspect, text, or_, and_, Column, String, Integer, Text, DateTime, ForeignKey, Index
+from sqlalchemy.orm import sessionmaker, declarative_base, deferred, undefer
 from sqlalchemy.exc import IntegrityError
 import os
-import shutil
 from datetime import datetime
 import json
+import csv
+import threading
+from df_cache import df_cache, file_version
+from config import CSV_BLOCK_BYTES, DATASET_ROW_GROUP_ROWS, PARQUET_COMPRESSION, PREVIEW_ROWS, SQLITE_BUSY_TIMEOUT_SECONDS
 
 Base = declarative_base()
 
@@ -18,21 +26,68 @@ class Dataset(Base):
     __tablename__ = 'datasets'
     id = Column(String, primary_key=True)
     original_filename = Column(String)
-    file_path = Column(String)
+    file_path = Column(String)  # blobs/<content_hash>.parquet, shared by datasets with identical content
+    content_hash = Column(String, index=True)  # SHA-256 of the uploaded CSV (decompressed); NULL for older datasets
     num_rows = Column(Integer)
+    status = Column(String, index=True)  # ingesting | ready | failed (NULL: uploaded before ingestion tracking, ready)
+    error = Column(Text)
+    preview = deferred(Column(Text))  # JSON string: first PREVIEW_ROWS rows, computed at ingestion
+    column_info = Column(Text)  # JSON string: [{"name", "dtype", "null_count"}]
     created_at = Column(DateTime)
 
+    __table_args__ = (Index('ix_datasets_created_at_id', 'created_at', 'id'),)
+
 class Analysis(Base):
     __tablename__ = 'analyses'
     id = Column(String, primary_key=True)
-    dataset_id = Column(String, ForeignKey('datasets.id'))
-    status = Column(String)
-    execution_log = Column(Text)  # JSON string
-    artifacts = Column(Text)  # JSON string with paths
+    dataset_id = Column(String, ForeignKey('datasets.id'), index=True)
+    status = Column(String, index=True)  # queued | running | canceling | completed | failed | canceled
+    cancel_policy = Column(String)  # "finish" | "abort" in-flight requests, set by a cancel request
+    progress = Column(Text)  # JSON string: {"step_idx", "of", "function", "processed", "total", "errors", ...}
+    # Heavy JSON columns are only loaded when accessed
+    execution_log = deferred(Column(Text))  # JSON string
+    artifacts = deferred(Column(Text))  # JSON string with paths
+    summaries = deferred(Column(Text))  # JSON string: per-artifact value counts/crosstabs (summaries.py)
+    error = deferred(Column(Text))
+    path_request = deferred(Column(Text))  # JSON string (sorted keys) of the steps run
+    dataset_rows = Column(Integer)  # the results cover dataset rows [0, dataset_rows)
+    base_analysis_id = Column(String)  # for incremental runs: the analysis whose results were extended
+    created_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    __table_args__ = (Index('ix_analyses_created_at_id', 'created_at', 'id'),)
+
+class Job(Base):
+    __tablename__ = 'jobs'
+    id = Column(String, primary_key=True)
+    kind = Column(String)  # key of worker.JOB_HANDLERS
+    payload = Column(Text)  # JSON string of handler kwargs
+    analysis_id = Column(String, ForeignKey('analyses.id'), index=True)
+    priority = Column(Integer, default=0)  # higher runs first
+    status = Column(String)  # queued | leased | done | failed | canceled
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer)
+    lease_owner = Column(String)
+    lease_expires_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)
     error = Column(Text)
     created_at = Column(DateTime)
     finished_at = Column(DateTime)
 
+    # lease_job: runnable jobs by priority, then age
+    __table_args__ = (Index('ix_jobs_status_priority_created_at', 'status', 'priority', 'created_at'),)
+
+class Upload(Base):
+    __tablename__ = 'uploads'
+    id = Column(String, primary_key=True)
+    original_filename = Column(String)
+    total_bytes = Column(Integer)  # declared by the client (optional)
+    received_bytes = Column(Integer, default=0)  # the offset the next chunk must start at
+    status = Column(String)  # open | complete | aborted
+    dataset_id = Column(String)  # set once the upload is completed
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+
 class SavedGraph(Base):
     __tablename__ = 'saved_graphs'
     id = Column(String, primary_key=True)
@@ -45,31 +100,403 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 DB_PATH = os.path.join(DATA_DIR, "app.db")
 
-engine = create_engine(f"sqlite:///{DB_PATH}")
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    WAL lets readers (API, SSE streams) run alongside the writing worker
+    processes; writers wait up to the busy timeout for each other instead of
+    failing with "database is locked".
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_SECONDS * 1000)}")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+def make_engine(db_path):
+    db_engine = create_engine(f"sqlite:///{db_path}", connect_args={"timeout": SQLITE_BUSY_TIMEOUT_SECONDS})
+    event.listen(db_engine, "connect", _sqlite_pragmas)
+    return db_engine
+
+engine = make_engine(DB_PATH)
 Session = sessionmaker(bind=engine)
 
+_db_ready = False
+_db_lock = threading.Lock()
+
 def init_db():
-    os.makedirs(os.path.join(DATA_DIR, 'datasets'), exist_ok=True)
-    os.makedirs(os.path.join(DATA_DIR, 'artifacts'), exist_ok=True)
-    Base.metadata.create_all(engine)
+    """Create directories, tables, columns and indexes; does the work once per process, then returns immediately."""
+    global _db_ready
+    if _db_ready:
+        return
+    with _db_lock:
+        if _db_ready:
+            return
+        os.makedirs(os.path.join(DATA_DIR, 'datasets'), exist_ok=True)
+        os.makedirs(os.path.join(DATA_DIR, 'artifacts'), exist_ok=True)
+        os.makedirs(os.path.join(DATA_DIR, 'uploads'), exist_ok=True)
+        os.makedirs(os.path.join(DATA_DIR, 'blobs'), exist_ok=True)
+        Base.metadata.create_all(engine)
+        _migrate()
+        _db_ready = True
+
+def _migrate():
+    """create_all doesn't alter existing tables: add columns and indexes introduced since the DB was created."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                    print(f"🛠️ Added column {table.name}.{column.name}")
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
 
 def new_id(prefix):
     return f"{prefix}_{uuid.uuid4().hex[:8]}"
 
+def dataset_path(ds_id, ext='parquet'):
+    """
+    Per-dataset file. Uploads land as `.upload` (possibly compressed) and are
+    decompressed to `.csv`; ingestion then stores the content as a blob
+    (blob_path). Datasets ingested before blobs keep their `.parquet` here.
+    """
+    return os.path.join(DATA_DIR, "datasets", f"{ds_id}.{ext}")
+
+def blob_path(content_hash):
+    """Parquet file holding the content with this hash; one per distinct upload, whatever the filename."""
+    return os.path.join(DATA_DIR, "blobs", f"{content_hash}.parquet")
+
+def file_sha256(path, chunk_bytes=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_bytes):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def read_csv_header(path):
+    """Column names of a CSV upload; raises ValueError if it has no usable header row."""
+    csv.field_size_limit(2**31 - 1)
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        header = next(csv.reader(f), None)
+    if not header or not any(name.strip() for name in header):
+        raise ValueError("File has no CSV header row")
+    return header
+
+def csv_column_names(header):
+    """Column names as pandas reads them: blank ones become "Unnamed: i", repeats get ".1", ".2", ..."""
+    names, seen = [], set()
+    for i, name in enumerate(header):
+        name = name or f"Unnamed: {i}"
+        base, n = name, 0
+        while name in seen:
+            n += 1
+            name = f"{base}.{n}"
+        seen.add(name)
+        names.append(name)
+    return names
+
+def open_csv_batches(csv_path, column_types, names=None):
+    """
+    Record batches of a CSV, one block (CSV_BLOCK_BYTES) at a time. Columns
+    are read as `column_types` and in that order; `names` are the file's
+    column names if already known.
+    """
+    names = names or csv_column_names(read_csv_header(csv_path))
+    return pacsv.open_csv(
+        csv_path,
+        read_options=pacsv.ReadOptions(column_names=names, skip_rows=1, block_size=CSV_BLOCK_BYTES),
+        parse_options=pacsv.ParseOptions(newlines_in_values=True),
+        convert_options=pacsv.ConvertOptions(column_types=column_types, include_columns=list(column_types),
+                                             strings_can_be_null=True),
+    )
+
+# Types a CSV column can still take, given the type its earlier values fit (None: no values yet)
+_CSV_TYPE_CANDIDATES = {
+    None: (pa.int64(), pa.float64(), pa.bool_()),
+    pa.int64(): (pa.int64(), pa.float64()),
+    pa.float64(): (pa.float64(),),
+    pa.bool_(): (pa.bool_(),),
+}
+
+def _widen_type(current, values):
+    """Narrowest type that the strings `values` and the column's earlier values fit; string if none does."""
+    if current == pa.string() or values.null_count == len(values):
+        return current
+    for candidate in _CSV_TYPE_CANDIDATES[current]:
+        try:
+            values.cast(candidate)
+            return candidate
+        except pa.ArrowInvalid:
+            continue
+    return pa.string()
+
+def infer_csv_schema(csv_path):
+    """
+    Column types of a CSV from all of its rows, as pandas would infer them
+    (int64, float64, bool, else string; all-empty columns are string). Reads
+    the file once as strings, a block at a time.
+    """
+    names = csv_column_names(read_csv_header(csv_path))
+    types = dict.fromkeys(names)
+    for batch in open_csv_batches(csv_path, {name: pa.string() for name in names}, names):
+        for name, values in zip(names, batch.columns):
+            types[name] = _widen_type(types[name], values)
+    return pa.schema([(name, column_type or pa.string()) for name, column_type in types.items()])
+
+def write_row_groups(writer, batches, row_group_rows=DATASET_ROW_GROUP_ROWS):
+    """Write record batches as row groups of `row_group_rows` rows (the last may be shorter); returns rows written."""
+    pending, pending_rows, written = [], 0, 0
+    for batch in batches:
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        while pending_rows >= row_group_rows:
+            table = pa.Table.from_batches(pending)
+            writer.write_table(table.slice(0, row_group_rows), row_group_size=row_group_rows)
+            rest = table.slice(row_group_rows)
+            pending, pending_rows = rest.to_batches(), rest.num_rows
+            written += row_group_rows
+    if pending_rows:
+        writer.write_table(pa.Table.from_batches(pending), row_group_size=row_group_rows)
+        written += pending_rows
+    return written
+
+@contextlib.contextmanager
+def _parquet_writer(parquet_path, schema):
+    """
+    ParquetWriter for a file next to `parquet_path` that is renamed into place
+    when the block succeeds and removed otherwise, so a half-written file is
+    never picked up.
+    """
+    tmp_path = f"{parquet_path}.tmp"
+    try:
+        with pq.ParquetWriter(tmp_path, schema, compression=PARQUET_COMPRESSION) as writer:
+            yield writer
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, parquet_path)
+
+def convert_csv_to_parquet(csv_path, parquet_path, row_group_rows=DATASET_ROW_GROUP_ROWS):
+    """
+    Convert an uploaded CSV to Parquet (zstd, fixed-size row groups) and return its row count.
+
+    The CSV is streamed block by block, so memory doesn't grow with the file:
+    one pass infers the column types (infer_csv_schema), a second converts the
+    rows and writes them.
+    """
+    schema = infer_csv_schema(csv_path)
+    with _parquet_writer(parquet_path, schema) as writer:
+        return write_row_groups(
+            writer, open_csv_batches(csv_path, dict(zip(schema.names, schema.types))), row_group_rows
+        )
+
+def df_records(df):
+    """DataFrame rows as JSON-safe dicts (missing values become None rather than NaN)."""
+    return df.astype(object).where(df.notna(), None).to_dict(orient='records')
+
+def profile_dataset_file(path, preview_rows=PREVIEW_ROWS):
+    """
+    Head preview and per-column metadata of a stored dataset, saved with the
+    dataset row so listings never open the file. Null counts come from the
+    Parquet row-group statistics.
+    """
+    head_df = read_dataset_file(path, row_range=(0, preview_rows))
+    preview = df_records(head_df)
+    null_counts = {}
+    if path.endswith('.parquet'):
+        metadata = pq.ParquetFile(path, memory_map=True).metadata
+        for i in range(metadata.num_row_groups):
+            group = metadata.row_group(i)
+            for j in range(group.num_columns):
+                chunk = group.column(j)
+                if chunk.statistics is not None and chunk.statistics.has_null_count:
+                    null_counts[chunk.path_in_schema] = null_counts.get(chunk.path_in_schema, 0) + chunk.statistics.null_count
+    column_info = [{'name': name, 'dtype': str(dtype), 'null_count': null_counts.get(name)}
+                   for name, dtype in head_df.dtypes.items()]
+    return preview, column_info
+
+_file_locks: Dict[Any, threading.Lock] = {}
+_file_locks_guard = threading.Lock()
+
+def _file_lock(key):
+    """Serializes writers of one blob (content hash) or one dataset's file within this process."""
+    with _file_locks_guard:
+        return _file_locks.setdefault(key, threading.Lock())
+
+def store_dataset_blob(csv_path, content_hash):
+    """
+    Store an uploaded CSV as the blob for `content_hash`. If that content was
+    uploaded before, the existing blob is reused and the CSV is not parsed again.
+
+    Returns:
+        (blob path, num_rows, preview, column_info, reused)
+    """
+    init_db()
+    path = blob_path(content_hash)
+    with _file_lock(content_hash):
+        reused = os.path.exists(path)
+        if reused:
+            num_rows = pq.ParquetFile(path).metadata.num_rows
+        else:
+            read_csv_header(csv_path)
+            num_rows = convert_csv_to_parquet(csv_path, path)
+    preview, column_info = profile_dataset_file(path)
+    return path, num_rows, preview, column_info, reused
+
 def save_dataset(upload_file, original_filename):
+    """Synchronous upload for scripts; the API streams uploads through ingestion.py instead."""
     init_db()
     ds_id = new_id('ds')
-    target_path = os.path.join(DATA_DIR, "datasets", f"{ds_id}.csv")
-    with open(target_path, 'wb') as f:
-        shutil.copyfileobj(upload_file.file, f)
-    # Compute num_rows
-    df = pd.read_csv(target_path)
-    num_rows = len(df)
-    with Session() as session:
-        ds = Dataset(id=ds_id, original_filename=original_filename, file_path=target_path, num_rows=num_rows, created_at=datetime.now())
+    csv_path = dataset_path(ds_id, 'csv')
+    digest = hashlib.sha256()
+    with open(csv_path, 'wb') as f:
+        while chunk := upload_file.file.read(1024 * 1024):
+            digest.update(chunk)
+            f.write(chunk)
+    content_hash = digest.hexdigest()
+    target_path, num_rows, preview, column_info, _ = store_dataset_blob(csv_path, content_hash)
+    os.remove(csv_path)
+    create_dataset_record(ds_id, original_filename, target_path, status='ready', num_rows=num_rows,
+                          content_hash=content_hash)
+    update_dataset(ds_id, preview=preview, column_info=column_info)
+    return ds_id
+
+def create_dataset_record(ds_id, original_filename, file_path, status='ingesting', num_rows=None, content_hash=None):
+    init_db()
+    with Session() as session:
+        ds = Dataset(id=ds_id, original_filename=original_filename, file_path=file_path, num_rows=num_rows,
+                     content_hash=content_hash, status=status, created_at=datetime.now())
         session.add(ds)
         session.commit()
-    return ds_id
+
+def update_dataset(ds_id, **kwargs):
+    init_db()
+    for k in ['preview', 'column_info']:
+        if k in kwargs:
+            kwargs[k] = json.dumps(kwargs[k], default=str) if kwargs[k] is not None else None
+    with Session() as session:
+        updated = session.query(Dataset).filter_by(id=ds_id).update(kwargs, synchronize_session=False)
+        session.commit()
+        if not updated:
+            raise KeyError(f"Dataset {ds_id} not found")
+
+def upload_part_path(upload_id):
+    """Bytes received so far for a chunked upload."""
+    return os.path.join(DATA_DIR, "uploads", f"{upload_id}.part")
+
+def _upload_dict(upload):
+    return {'upload_id': upload.id, 'filename': upload.original_filename, 'total_bytes': upload.total_bytes,
+            'offset': upload.received_bytes or 0, 'status': upload.status, 'dataset_id': upload.dataset_id}
+
+def create_upload(original_filename, total_bytes=None):
+    init_db()
+    upload_id = new_id('upl')
+    now = datetime.now()
+    with Session() as session:
+        upload = Upload(id=upload_id, original_filename=original_filename, total_bytes=total_bytes,
+                        received_bytes=0, status='open', created_at=now, updated_at=now)
+        session.add(upload)
+        session.commit()
+        return _upload_dict(upload)
+
+def get_upload(upload_id):
+    init_db()
+    with Session() as session:
+        upload = session.query(Upload).filter_by(id=upload_id).first()
+        if not upload:
+            raise KeyError(f"Upload {upload_id} not found")
+        return _upload_dict(upload)
+
+def update_upload(upload_id, **kwargs):
+    init_db()
+    with Session() as session:
+        updated = session.query(Upload).filter_by(id=upload_id).update(
+            {**kwargs, 'updated_at': datetime.now()}, synchronize_session=False
+        )
+        session.commit()
+        if not updated:
+            raise KeyError(f"Upload {upload_id} not found")
+
+def get_dataset_status(ds_id):
+    init_db()
+    with Session() as session:
+        ds = session.query(Dataset).filter_by(id=ds_id).first()
+        if not ds:
+            raise KeyError(f"Dataset {ds_id} not found")
+        return {'id': ds.id, 'status': ds.status or 'ready', 'num_rows': ds.num_rows, 'error': ds.error,
+                'content_hash': ds.content_hash}
+
+def get_dataset_ids_by_status(status):
+    init_db()
+    with Session() as session:
+        return [row.id for row in session.query(Dataset.id).filter_by(status=status).all()]
+
+def _file_shared(session, file_path, dataset_id):
+    """Whether a dataset other than `dataset_id` is stored in `file_path` (a shared blob)."""
+    return bool(file_path) and session.query(Dataset.id).filter(
+        Dataset.file_path == file_path, Dataset.id != dataset_id).first() is not None
+
+def append_dataset_rows(ds_id, csv_path, rows_hash):
+    """
+    Append the rows of a CSV to a ready dataset. Rows are only ever appended,
+    never reordered or removed, so a row's position is its stable id: an
+    analysis that covered rows [0, n) can be extended with rows [n, ...).
+
+    The appended dataset is a new blob (existing row groups are copied, not
+    re-encoded); its content hash chains the previous hash with `rows_hash`,
+    the SHA-256 of the appended CSV.
+
+    Returns:
+        {"id", "num_rows", "appended_rows", "content_hash"}
+    """
+    init_db()
+    with _file_lock(('dataset', ds_id)):
+        with Session() as session:
+            ds = session.query(Dataset).filter_by(id=ds_id).first()
+            if not ds:
+                raise KeyError(f"Dataset {ds_id} not found")
+            if (ds.status or 'ready') != 'ready':
+                raise ValueError(f"Dataset is {ds.status}")
+            old_path, old_hash = ds.file_path, ds.content_hash
+        if not old_path.endswith('.parquet'):
+            raise ValueError("Dataset was stored before Parquet storage; upload it again to append rows")
+
+        parquet_file = pq.ParquetFile(old_path)
+        schema = parquet_file.schema_arrow.remove_metadata()
+        header = csv_column_names(read_csv_header(csv_path))
+        if sorted(header) != sorted(schema.names):
+            raise ValueError(f"Appended columns {header} don't match the dataset's {schema.names}")
+
+        content_hash = hashlib.sha256(f"{old_hash or file_sha256(old_path)}+{rows_hash}".encode()).hexdigest()
+        path = blob_path(content_hash)
+        with _file_lock(content_hash):
+            if os.path.exists(path):
+                appended_rows = pq.ParquetFile(path).metadata.num_rows - parquet_file.metadata.num_rows
+            else:
+                # New rows are streamed in the dataset's column order and types, never loaded whole
+                try:
+                    with _parquet_writer(path, schema) as writer:
+                        for i in range(parquet_file.num_row_groups):
+                            writer.write_table(parquet_file.read_row_group(i).replace_schema_metadata(None))
+                        appended_rows = write_row_groups(
+                            writer, open_csv_batches(csv_path, dict(zip(schema.names, schema.types)), header)
+                        )
+                except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+                    raise ValueError(f"Appended rows don't match the dataset's column types: {e}")
+        num_rows = parquet_file.metadata.num_rows + appended_rows
+        preview, column_info = profile_dataset_file(path)
+        update_dataset(ds_id, file_path=path, num_rows=num_rows, content_hash=content_hash, preview=preview,
+                       column_info=column_info)
+
+        with Session() as session:
+            if old_path != path and not _file_shared(session, old_path, None) and os.path.exists(old_path):
+                os.remove(old_path)
+                df_cache.invalidate(lambda key: key[:2] in (('dataset', ds_id), ('dataset', old_hash)))
+    print(f"➕ Appended {appended_rows} rows to dataset {ds_id} ({num_rows} rows)")
+    return {'id': ds_id, 'num_rows': num_rows, 'appended_rows': appended_rows, 'content_hash': content_hash}
 
 def delete_dataset_record(dataset_id: str):
     """
@@ -81,12 +508,20 @@ def delete_dataset_record(dataset_id: str):
         if not ds:
             raise KeyError(f"Dataset {dataset_id} not found")
 
-        # Delete the CSV file if it exists
-        if ds.file_path and os.path.exists(ds.file_path):
+        # Delete the dataset file (and an upload that was never converted) if it exists
+        # and no other dataset with the same content still references it
+        shared = _file_shared(session, ds.file_path, dataset_id)
+        if shared:
+            print(f"ℹ️ Keeping {ds.file_path}: still used by other datasets")
+        elif ds.file_path and os.path.exists(ds.file_path):
             os.remove(ds.file_path)
             print(f"✅ Deleted dataset file: {ds.file_path}")
         else:
             print(f"⚠️ File for dataset {dataset_id} not found on disk")
+        for ext in ('upload', 'csv'):
+            upload_path = dataset_path(dataset_id, ext)
+            if upload_path != ds.file_path and os.path.exists(upload_path):
+                os.remove(upload_path)
 
         # Delete associated analyses (optional cleanup)
         analyses = session.query(Analysis).filter_by(dataset_id=dataset_id).all()
@@ -96,72 +531,242 @@ def delete_dataset_record(dataset_id: str):
         # Delete the dataset record
         session.delete(ds)
         session.commit()
+        if not shared:
+            df_cache.invalidate(lambda key: key[:2] in (('dataset', dataset_id), ('dataset', ds.content_hash)))
         print(f"🗑️ Deleted dataset record from database: {dataset_id}")
 
 
-def get_datasets(with_heads=False):
+def _dataset_dict(ds, with_head):
+    info = {'id': ds.id, 'original_filename': ds.original_filename, 'num_rows': ds.num_rows,
+            'status': ds.status or 'ready', 'content_hash': ds.content_hash,
+            'created_at': ds.created_at.isoformat() if ds.created_at else None,
+            'columns': json.loads(ds.column_info) if ds.column_info else None}
+    if with_head and info['status'] == 'ready':
+        if ds.preview is None:
+            # Uploaded before previews were stored: profile once and keep it
+            preview, column_info = profile_dataset_file(ds.file_path)
+            update_dataset(ds.id, preview=preview, column_info=column_info)
+            info['head'], info['columns'] = preview, column_info
+        else:
+            info['head'] = json.loads(ds.preview)
+    return info
+
+def page_cursor(item):
+    """Keyset cursor of a listed item (dict with created_at/id): pass it back to get the next page."""
+    return f"{item['created_at']}|{item['id']}"
+
+def _after_cursor(query, model, cursor):
+    """Newest-first keyset page: rows strictly after `cursor` in (created_at, id) descending order."""
+    query = query.order_by(model.created_at.desc(), model.id.desc())
+    if not cursor:
+        return query
+    try:
+        created_at, item_id = cursor.split('|', 1)
+        created_at = datetime.fromisoformat(created_at)
+    except ValueError:
+        raise ValueError(f"Invalid cursor {cursor!r}")
+    return query.filter(or_(model.created_at < created_at,
+                            and_(model.created_at == created_at, model.id < item_id)))
+
+def get_datasets(with_heads=False, limit=None, offset=0, cursor=None, content_hash=None):
+    """
+    Newest first. Page with `cursor` (page_cursor of the last item; index
+    seek) or `offset`. Heads come from the stored previews. `content_hash`
+    lists only uploads of that exact content (duplicates).
+    """
     init_db()
     with Session() as session:
-        datasets = session.query(Dataset).all()
-        result = []
-        for ds in datasets:
-            info = {'id': ds.id, 'original_filename': ds.original_filename, 'num_rows': ds.num_rows, 'created_at': ds.created_at.isoformat()}
-            if with_heads:
-                print(f"Reading file: {ds.file_path}")
-                head_df = pd.read_csv(ds.file_path, nrows=10)
-                info['head'] = head_df.to_dict(orient='records')
-            result.append(info)
-        return result
+        query = session.query(Dataset)
+        if with_heads:
+            # One query for the page, not one lazy load of the deferred preview per dataset
+            query = query.options(undefer(Dataset.preview))
+        if content_hash:
+            query = query.filter_by(content_hash=content_hash)
+        query = _after_cursor(query, Dataset, cursor).offset(offset)
+        if limit is not None:
+            query = query.limit(limit)
+        return [_dataset_dict(ds, with_heads) for ds in query.all()]
+
+def get_dataset(ds_id, with_head=True):
+    init_db()
+    with Session() as session:
+        ds = session.query(Dataset).filter_by(id=ds_id).first()
+        if not ds:
+            raise KeyError(f"Dataset {ds_id} not found")
+        return _dataset_dict(ds, with_head)
 
-def get_dataset_df(ds_id):
+def get_dataset_df(ds_id, columns=None, row_range=None):
+    """
+    Load a dataset as a DataFrame (cached in-process, see df_cache.py).
+
+    Args:
+        ds_id: Dataset id.
+        columns: Only read these columns (default: all).
+        row_range: (start, stop) to read only rows [start, stop) (default: all rows).
+    """
     init_db()
     with Session() as session:
         ds = session.query(Dataset).filter_by(id=ds_id).first()
         if not ds:
             raise KeyError(f"Dataset {ds_id} not found")
-        return pd.read_csv(ds.file_path)
+        file_path, cache_id = ds.file_path, ds.content_hash or ds_id
 
-def create_analysis(dataset_id):
+    # Served from the in-process cache, keyed on the content so duplicate uploads share entries;
+    # a projection of a fully cached dataset is sliced from memory
+    version = file_version(file_path)
+    if columns is not None or row_range is not None:
+        full = df_cache.peek(('dataset', cache_id, version, None, None))
+        if full is not None:
+            start, stop = row_range or (0, None)
+            return full.iloc[start:stop][list(columns or full.columns)].reset_index(drop=True)
+    key = ('dataset', cache_id, version, tuple(columns) if columns is not None else None,
+           tuple(row_range) if row_range is not None else None)
+    return df_cache.get_or_load(key, lambda: read_dataset_file(file_path, columns=columns, row_range=row_range))
+
+def get_dataset_file_path(ds_id):
+    init_db()
+    with Session() as session:
+        row = session.query(Dataset.file_path).filter_by(id=ds_id).first()
+        if not row:
+            raise KeyError(f"Dataset {ds_id} not found")
+        return row.file_path
+
+def read_dataset_file(path, columns=None, row_range=None):
+    """
+    Read a stored dataset file. Parquet files are memory-mapped and only the
+    requested columns and the row groups overlapping `row_range` are decoded;
+    datasets uploaded before Parquet storage are still read from CSV.
+    """
+    if not path.endswith('.parquet'):
+        start, stop = row_range or (0, None)
+        return pd.read_csv(path, usecols=columns, skiprows=range(1, start + 1) if start else None,
+                           nrows=None if stop is None else max(stop - start, 0))
+
+    return read_parquet_rows(path, columns=columns, row_range=row_range).to_pandas()
+
+def read_parquet_rows(path, columns=None, row_range=None):
+    """Arrow table of a memory-mapped Parquet file, decoding only the row groups overlapping `row_range`."""
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    if row_range is None:
+        return parquet_file.read(columns=columns)
+
+    start, stop = row_range
+    stop = parquet_file.metadata.num_rows if stop is None else min(stop, parquet_file.metadata.num_rows)
+    groups, group_start, first_group_start = [], 0, None
+    for i in range(parquet_file.num_row_groups):
+        group_rows = parquet_file.metadata.row_group(i).num_rows
+        if group_start < stop and group_start + group_rows > start:
+            groups.append(i)
+            first_group_start = group_start if first_group_start is None else first_group_start
+        group_start += group_rows
+    if not groups:
+        return parquet_file.schema_arrow.empty_table().select(columns or parquet_file.schema_arrow.names)
+    table = parquet_file.read_row_groups(groups, columns=columns)
+    return table.slice(start - first_group_start, stop - start)
+
+def iter_dataset_csv(ds_id, batch_rows=DATASET_ROW_GROUP_ROWS):
+    """Export a dataset as CSV text, one batch of rows at a time."""
+    path = get_dataset_file_path(ds_id)
+    if not path.endswith('.parquet'):
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from iter(lambda: f.read(1024 * 1024), '')
+        return
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    header = True
+    for batch in parquet_file.iter_batches(batch_size=batch_rows):
+        yield batch.to_pandas().to_csv(index=False, header=header)
+        header = False
+    if header:
+        yield pd.DataFrame(columns=parquet_file.schema_arrow.names).to_csv(index=False)
+
+def _path_json(path_request):
+    return json.dumps(path_request, sort_keys=True)
+
+def create_analysis(dataset_id, path_request=None, base_analysis_id=None):
     init_db()
     analysis_id = new_id('analysis')
     with Session() as session:
-        analysis = Analysis(id=analysis_id, dataset_id=dataset_id, status='queued', created_at=datetime.now())
+        analysis = Analysis(id=analysis_id, dataset_id=dataset_id, status='queued', created_at=datetime.now(),
+                            path_request=_path_json(path_request) if path_request is not None else None,
+                            base_analysis_id=base_analysis_id)
         session.add(analysis)
         session.commit()
     return analysis_id
 
+def _analysis_values(kwargs):
+    """Column values for an analysis update; the JSON columns are serialized."""
+    return {k: (json.dumps(v) if v else None) if k in ['execution_log', 'artifacts', 'progress', 'summaries'] else v
+            for k, v in kwargs.items()}
+
 def update_analysis(analysis_id, **kwargs):
     init_db()
     with Session() as session:
         analysis = session.query(Analysis).filter_by(id=analysis_id).first()
         if not analysis:
             raise KeyError(f"Analysis {analysis_id} not found")
-        for k, v in kwargs.items():
-            if k in ['execution_log', 'artifacts']:
-                v = json.dumps(v) if v else None
+        for k, v in _analysis_values(kwargs).items():
             setattr(analysis, k, v)
-        if 'status' in kwargs and kwargs['status'] in ['completed', 'failed']:
+        if 'status' in kwargs and kwargs['status'] in ['completed', 'failed', 'canceled']:
             analysis.finished_at = datetime.now()
         session.commit()
 
-def get_analyses():
+def transition_analysis(analysis_id, from_statuses, to_status, **kwargs) -> bool:
+    """Set the status only if it is currently one of `from_statuses`. Returns whether it changed."""
+    init_db()
+    values = {'status': to_status, **_analysis_values(kwargs)}
+    if to_status in ['completed', 'failed', 'canceled']:
+        values['finished_at'] = datetime.now()
+    with Session() as session:
+        changed = session.query(Analysis).filter(
+            Analysis.id == analysis_id, Analysis.status.in_(from_statuses)
+        ).update(values, synchronize_session=False)
+        session.commit()
+        return bool(changed)
+
+def get_analysis_status(analysis_id):
+    """(status, cancel_policy) without loading the JSON columns; polled by running workers."""
     init_db()
     with Session() as session:
-        analyses = session.query(Analysis).all()
-        return [{'id': a.id,
-                'dataset_id': a.dataset_id, 
-                'status': a.status, 
-                'execution_log': json.loads(a.execution_log) if a.execution_log else [],
-                'created_at': a.created_at.isoformat() if a.created_at else None,
-                'finished_at': a.finished_at.isoformat() if a.finished_at else None
-                } 
-                for a in analyses
-            ]
+        row = session.query(Analysis.status, Analysis.cancel_policy).filter_by(id=analysis_id).first()
+        if not row:
+            raise KeyError(f"Analysis {analysis_id} not found")
+        return row.status, row.cancel_policy
+
+def get_analyses(limit=None, cursor=None, status=None, dataset_id=None, include_log=False):
+    """
+    Newest first, one keyset page at a time (`cursor` is page_cursor of the
+    last item). The execution log is only loaded with `include_log`.
+    """
+    init_db()
+    with Session() as session:
+        query = session.query(Analysis)
+        if status:
+            query = query.filter(Analysis.status == status)
+        if dataset_id:
+            query = query.filter(Analysis.dataset_id == dataset_id)
+        query = _after_cursor(query, Analysis, cursor)
+        if limit is not None:
+            query = query.limit(limit)
+        result = []
+        for a in query.all():
+            info = {'id': a.id,
+                    'dataset_id': a.dataset_id,
+                    'status': a.status,
+                    'created_at': a.created_at.isoformat() if a.created_at else None,
+                    'finished_at': a.finished_at.isoformat() if a.finished_at else None,
+                    'progress': json.loads(a.progress) if a.progress else None,
+                    }
+            if include_log:
+                info['execution_log'] = json.loads(a.execution_log) if a.execution_log else []
+            result.append(info)
+        return result
 
 def get_analysis(analysis_id):
     init_db()
     with Session() as session:
-        a = session.query(Analysis).filter_by(id=analysis_id).first()
+        a = session.query(Analysis).options(
+            undefer(Analysis.execution_log), undefer(Analysis.artifacts), undefer(Analysis.error)
+        ).filter_by(id=analysis_id).first()
         if not a:
             raise KeyError(f"Analysis {analysis_id} not found")
         result = {
@@ -169,9 +774,63 @@ def get_analysis(analysis_id):
             'execution_log': json.loads(a.execution_log) if a.execution_log else [],
             'artifacts': json.loads(a.artifacts) if a.artifacts else {},
             'error': a.error, 'created_at': a.created_at.isoformat(),
-            'finished_at': a.finished_at.isoformat() if a.finished_at else None
+            'finished_at': a.finished_at.isoformat() if a.finished_at else None,
+            'progress': json.loads(a.progress) if a.progress else None,
+            'dataset_rows': a.dataset_rows, 'base_analysis_id': a.base_analysis_id,
         }
         return result
+
+def get_latest_completed_analysis(dataset_id, path_request):
+    """
+    The newest completed run of exactly these steps on the dataset (with the
+    rows it covered), or None: the base an incremental rerun extends.
+    """
+    init_db()
+    with Session() as session:
+        a = session.query(Analysis).options(undefer(Analysis.artifacts)).filter(
+            Analysis.dataset_id == dataset_id, Analysis.status == 'completed',
+            Analysis.path_request == _path_json(path_request), Analysis.dataset_rows.isnot(None),
+        ).order_by(Analysis.created_at.desc()).first()
+        if not a:
+            return None
+        return {'id': a.id, 'dataset_rows': a.dataset_rows,
+                'artifacts': json.loads(a.artifacts) if a.artifacts else {}}
+
+def get_analysis_summaries(analysis_id):
+    """(status, artifacts, summaries) without the execution log; summaries is None if never computed."""
+    init_db()
+    with Session() as session:
+        row = session.query(Analysis.status, Analysis.artifacts, Analysis.summaries).filter_by(id=analysis_id).first()
+        if not row:
+            raise KeyError(f"Analysis {analysis_id} not found")
+        return (row.status, json.loads(row.artifacts) if row.artifacts else {},
+                json.loads(row.summaries) if row.summaries else None)
+
+ACTIVE_STATUSES = ['queued', 'running', 'canceling']
+
+def get_analysis_states(analysis_ids=None, include_active=False):
+    """
+    Status and progress (no logs or artifacts) of the given analyses and, if
+    `include_active`, of every analysis that hasn't finished. Polled by the
+    progress event streams.
+    """
+    init_db()
+    with Session() as session:
+        query = session.query(Analysis.id, Analysis.dataset_id, Analysis.status, Analysis.progress,
+                              Analysis.created_at, Analysis.finished_at)
+        conditions = []
+        if analysis_ids:
+            conditions.append(Analysis.id.in_(list(analysis_ids)))
+        if include_active:
+            conditions.append(Analysis.status.in_(ACTIVE_STATUSES))
+        if not conditions:
+            return []
+        return [{
+            'id': a.id, 'dataset_id': a.dataset_id, 'status': a.status,
+            'progress': json.loads(a.progress) if a.progress else None,
+            'created_at': a.created_at.isoformat() if a.created_at else None,
+            'finished_at': a.finished_at.isoformat() if a.finished_at else None,
+        } for a in query.filter(or_(*conditions)).all()]
 def save_graph(name: str, graph: List[Dict[str, Any]]) -> str:
     init_db()
     graph_id = new_id('graph')
@@ -0,0 +1,125 @@
+# server/summaries.py
+"""
+Compact summaries of a run's artifacts, computed once when the run finishes
+and stored with the analysis (GET /analyses/{id}/summary).
+
+For each DataFrame artifact:
+- value_counts: every label/category column (few distinct values)
+- crosstabs: counts for each pair of label columns
+- list_frequencies: element counts of list columns (e.g. extracted categories)
+- group_sizes: size distribution of grouping columns (more distinct values than
+  a label, but still repeated, e.g. a group or customer id)
+
+Only short-valued columns are read; long text (transcripts, explanations) is
+skipped using the Parquet column sizes.
+"""
+from __future__ import annotations
+import itertools
+import traceback
+from typing import Any, Dict, List, Optional
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from artifacts import artifact_file, arrow_source
+from config import SUMMARY_MAX_LABELS, SUMMARY_MAX_GROUPS, SUMMARY_MAX_VALUE_BYTES, SUMMARY_TOP_VALUES
+
+
+def _is_text(data_type) -> bool:
+    return pa.types.is_string(data_type) or pa.types.is_large_string(data_type) or pa.types.is_dictionary(data_type)
+
+
+def _short_columns(path: str, schema: pa.Schema) -> List[str]:
+    """String/bool/list columns whose values average at most SUMMARY_MAX_VALUE_BYTES."""
+    candidates = [f.name for f in schema if _is_text(f.type) or pa.types.is_boolean(f.type)
+                  or (pa.types.is_list(f.type) and _is_text(f.type.value_type))]
+    if not path.endswith('.parquet'):
+        return candidates
+    metadata = pq.ParquetFile(path, memory_map=True).metadata
+    if not metadata.num_rows:
+        return candidates
+    sizes: Dict[str, int] = {}
+    for i in range(metadata.num_row_groups):
+        group = metadata.row_group(i)
+        for j in range(group.num_columns):
+            chunk = group.column(j)
+            name = chunk.path_in_schema.split('.')[0]
+            sizes[name] = sizes.get(name, 0) + chunk.total_uncompressed_size
+    return [name for name in candidates if sizes.get(name, 0) / metadata.num_rows <= SUMMARY_MAX_VALUE_BYTES]
+
+
+def _counts(table: pa.Table, keys: List[str], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    counts = table.group_by(keys).aggregate([([], 'count_all')])
+    counts = counts.rename_columns(['count' if c == 'count_all' else c for c in counts.column_names])
+    counts = counts.sort_by([('count', 'descending')])
+    if limit is not None:
+        counts = counts.slice(0, limit)
+    return counts.select(keys + ['count']).to_pylist()
+
+
+def summarize_artifact(path: str) -> Dict[str, Any]:
+    source = arrow_source(path)
+    columns = _short_columns(path, source.schema)
+    table = source.to_table(columns=columns)
+
+    labels, groups, lists = [], [], []
+    for name in columns:
+        column = table[name]
+        if pa.types.is_list(column.type):
+            lists.append(name)
+            continue
+        if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+            # Dictionary-encoded repeats of long text look small on disk
+            if (pc.mean(pc.utf8_length(column)).as_py() or 0) > SUMMARY_MAX_VALUE_BYTES:
+                continue
+        distinct = pc.count_distinct(column, mode='all').as_py()
+        if distinct <= SUMMARY_MAX_LABELS:
+            labels.append(name)
+        elif distinct <= SUMMARY_MAX_GROUPS and distinct < table.num_rows / 2:
+            groups.append(name)
+
+    summary: Dict[str, Any] = {
+        'num_rows': table.num_rows,
+        'label_columns': labels,
+        'value_counts': {name: _counts(table, [name]) for name in labels},
+        'crosstabs': [
+            {'columns': [a, b], 'counts': _counts(table, [a, b])}
+            for a, b in itertools.combinations(labels, 2)
+        ],
+        'list_frequencies': {},
+        'group_sizes': {},
+    }
+
+    for name in lists:
+        values = pc.list_flatten(table[name])
+        summary['list_frequencies'][name] = {
+            'rows_with_values': int(pc.sum(pc.greater(pc.fill_null(pc.list_value_length(table[name]), 0), 0)).as_py() or 0),
+            'total_values': len(values),
+            'top': _counts(pa.table({name: values}), [name], SUMMARY_TOP_VALUES),
+        }
+
+    for name in groups:
+        sizes = table.group_by([name]).aggregate([([], 'count_all')])['count_all']
+        summary['group_sizes'][name] = {
+            'groups': len(sizes),
+            'min': pc.min(sizes).as_py(),
+            'max': pc.max(sizes).as_py(),
+            'mean': round(pc.mean(sizes).as_py(), 2),
+            'median': pc.approximate_median(sizes).as_py(),
+            'largest': _counts(table, [name], SUMMARY_TOP_VALUES),
+        }
+    return summary
+
+
+def summarize_artifacts(artifacts: Dict[str, Any]) -> Dict[str, Any]:
+    """Summaries of every file artifact; an artifact that can't be summarized gets {"error": ...}."""
+    summaries = {}
+    for key, value in artifacts.items():
+        path = artifact_file(value)
+        if path is None:
+            continue
+        try:
+            summaries[key] = summarize_artifact(path)
+        except Exception as e:
+            traceback.print_exc()
+            summaries[key] = {'error': str(e)}
+    return summaries
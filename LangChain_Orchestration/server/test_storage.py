@@ -0,0 +1,127 @@
+# test_storage.py
+import os
+import types
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from sqlalchemy import event
+import storage
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    """CSV blocks of a few rows, so a test file spans many of them."""
+    monkeypatch.setattr(storage, "CSV_BLOCK_BYTES", 64)
+
+
+def _write_csv(path, lines):
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def test_convert_streams_into_fixed_size_row_groups(tmp_path, small_blocks):
+    csv_path = _write_csv(tmp_path / "in.csv", ["id,text"] + [f'{i},"line {i}\nsecond line"' for i in range(25)])
+    parquet_path = str(tmp_path / "out.parquet")
+
+    assert storage.convert_csv_to_parquet(csv_path, parquet_path, row_group_rows=10) == 25
+
+    metadata = pq.ParquetFile(parquet_path).metadata
+    assert [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)] == [10, 10, 5]
+    table = pq.read_table(parquet_path)
+    assert table.column("text")[24].as_py() == "line 24\nsecond line"
+    assert not os.path.exists(f"{parquet_path}.tmp")
+
+
+def test_convert_infers_types_from_every_block(tmp_path, small_blocks):
+    # The first block only holds ints; a later one makes `score` float and `code` text
+    rows = [f"{i},{i},{i},{'true' if i % 2 else 'false'}," for i in range(30)]
+    rows += ["30,30.5,A7,true,"]
+    csv_path = _write_csv(tmp_path / "in.csv", ["id,score,code,flag,empty"] + rows)
+    parquet_path = str(tmp_path / "out.parquet")
+
+    storage.convert_csv_to_parquet(csv_path, parquet_path)
+
+    schema = pq.read_schema(parquet_path)
+    assert [schema.field(name).type for name in schema.names] == [
+        pa.int64(), pa.float64(), pa.string(), pa.bool_(), pa.string()
+    ]
+    df = pq.read_table(parquet_path).to_pandas()
+    assert df["code"].iloc[-1] == "A7" and df["code"].iloc[0] == "0"
+    assert df["empty"].isna().all()
+
+
+def test_convert_names_columns_like_pandas(tmp_path):
+    csv_path = _write_csv(tmp_path / "in.csv", ["\ufeffa,a,", "1,2,3"])
+    parquet_path = str(tmp_path / "out.parquet")
+
+    storage.convert_csv_to_parquet(csv_path, parquet_path)
+
+    assert pq.read_schema(parquet_path).names == ["a", "a.1", "Unnamed: 2"]
+
+
+def test_convert_rejects_invalid_utf8_without_leaving_a_file(tmp_path, small_blocks):
+    csv_path = tmp_path / "in.csv"
+    csv_path.write_bytes(b"id,text\n" + b"".join(b"%d,ok\n" % i for i in range(20)) + b"20,\xff\n")
+    parquet_path = str(tmp_path / "out.parquet")
+
+    with pytest.raises(ValueError):
+        storage.convert_csv_to_parquet(str(csv_path), parquet_path)
+    assert not os.path.exists(parquet_path) and not os.path.exists(f"{parquet_path}.tmp")
+
+
+def test_ingestion_counts_rows_from_the_stream_and_reused_blobs_from_metadata(data_dir, monkeypatch):
+    import ingestion
+    monkeypatch.setattr(storage, "CSV_BLOCK_BYTES", 64)
+    content = "id,text\n" + "".join(f'{i},"turn one\nturn two"\n' for i in range(12))
+
+    ids = []
+    for _ in range(2):
+        ds_id = storage.new_id('ds')
+        with open(storage.dataset_path(ds_id, 'csv'), 'w', encoding='utf-8') as f:
+            f.write(content)
+        storage.create_dataset_record(ds_id, "calls.csv", storage.dataset_path(ds_id, 'csv'))
+        ingestion.ingest_dataset(ds_id)
+        ids.append(ds_id)
+
+    # Quoted newlines don't count as rows; the second upload reuses the first blob's footer count
+    statuses = [storage.get_dataset_status(ds_id) for ds_id in ids]
+    assert [(status['status'], status['num_rows']) for status in statuses] == [('ready', 12), ('ready', 12)]
+    assert statuses[0]['content_hash'] == statuses[1]['content_hash']
+
+
+def test_keyset_pages_break_created_at_ties_by_id(data_dir, monkeypatch):
+    class FrozenDatetime(storage.datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return cls(2024, 1, 1, 12, 0, 0)
+
+    # Every record gets the same created_at, so paging relies on the id tie-break alone
+    monkeypatch.setattr(storage, "datetime", FrozenDatetime)
+    for ds_id in ["ds_a", "ds_b", "ds_c", "ds_d", "ds_e"]:
+        storage.create_dataset_record(ds_id, f"{ds_id}.csv", str(data_dir / ds_id), status="ready")
+
+    pages, cursor = [], None
+    while page := storage.get_datasets(limit=2, cursor=cursor):
+        pages.append([ds["id"] for ds in page])
+        cursor = storage.page_cursor(page[-1])
+
+    assert pages == [["ds_e", "ds_d"], ["ds_c", "ds_b"], ["ds_a"]]
+    with pytest.raises(ValueError):
+        storage.get_datasets(cursor="not a cursor")
+
+
+def test_listing_with_heads_loads_previews_in_the_page_query(data_dir, tmp_path):
+    for i in range(3):
+        path = _write_csv(tmp_path / f"in{i}.csv", ["id,text", f"{i},row {i}"])
+        with open(path, 'rb') as f:
+            storage.save_dataset(types.SimpleNamespace(file=f), f"in{i}.csv")
+    statements = []
+    listen = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(storage.engine, "before_cursor_execute", listen)
+    try:
+        datasets = storage.get_datasets(with_heads=True)
+    finally:
+        event.remove(storage.engine, "before_cursor_execute", listen)
+
+    assert sorted(ds["head"][0]["text"] for ds in datasets) == ["row 0", "row 1", "row 2"]
+    assert len([s for s in statements if s.lstrip().upper().startswith("SELECT")]) == 1
@@ -0,0 +1,171 @@
+# test_uploads.py
+import asyncio
+import hashlib
+import os
+import types
+import pyarrow as pa
+import pytest
+import storage
+import uploads
+
+
+async def _chunks(*parts):
+    for part in parts:
+        yield part
+
+
+async def _dropped_after(part):
+    """A chunk body whose connection drops after `part` was received."""
+    yield part
+    raise ConnectionResetError("client went away")
+
+
+def _write(upload_id, offset, *parts, checksum=None):
+    return asyncio.run(uploads.write_chunk(upload_id, offset, _chunks(*parts), checksum))
+
+
+@pytest.fixture
+def no_ingestion(monkeypatch):
+    """Completing an upload registers the dataset without converting it on the ingestion pool."""
+    import ingestion
+    started = []
+    monkeypatch.setattr(ingestion, "start_ingestion", started.append)
+    return started
+
+
+# -------------------------------
+# Chunked uploads
+# -------------------------------
+def test_chunks_must_start_at_the_recorded_offset(data_dir):
+    upload_id = storage.create_upload("calls.csv")['upload_id']
+    assert _write(upload_id, 0, b"id,", b"text\n")['offset'] == 8
+
+    with pytest.raises(uploads.OffsetMismatch) as error:
+        _write(upload_id, 4, b"1,a\n")
+    assert error.value.offset == 8
+    assert storage.get_upload(upload_id)['offset'] == 8
+
+
+def test_bad_checksum_discards_the_chunk(data_dir):
+    upload_id = storage.create_upload("calls.csv")['upload_id']
+    _write(upload_id, 0, b"id,text\n")
+
+    with pytest.raises(ValueError, match="checksum"):
+        _write(upload_id, 8, b"1,a\n", checksum=hashlib.sha256(b"1,b\n").hexdigest())
+    assert storage.get_upload(upload_id)['offset'] == 8
+    assert os.path.getsize(storage.upload_part_path(upload_id)) == 8
+
+    assert _write(upload_id, 8, b"1,a\n", checksum=hashlib.sha256(b"1,a\n").hexdigest())['offset'] == 12
+
+
+def test_resume_after_dropped_connection(data_dir, no_ingestion):
+    upload_id = storage.create_upload("calls.csv", total_bytes=16)['upload_id']
+    _write(upload_id, 0, b"id,text\n")
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(uploads.write_chunk(upload_id, 8, _dropped_after(b"1,a\n")))
+
+    # The partial chunk isn't recorded; the client asks for the offset and sends it again
+    offset = storage.get_upload(upload_id)['offset']
+    assert offset == 8
+    _write(upload_id, offset, b"1,a\n2,b\n")
+
+    ds_id = asyncio.run(uploads.complete_upload(upload_id, hashlib.sha256(b"id,text\n1,a\n2,b\n").hexdigest()))
+    assert no_ingestion == [ds_id]
+    assert storage.get_dataset_status(ds_id)['content_hash'] == hashlib.sha256(b"id,text\n1,a\n2,b\n").hexdigest()
+
+
+def test_complete_rehashes_the_file_after_a_restart(data_dir, no_ingestion):
+    upload_id = storage.create_upload("calls.csv")['upload_id']
+    _write(upload_id, 0, b"id,text\n1,a\n")
+    uploads._digests.clear()
+
+    with pytest.raises(ValueError, match="checksum"):
+        asyncio.run(uploads.complete_upload(upload_id, hashlib.sha256(b"something else").hexdigest()))
+    ds_id = asyncio.run(uploads.complete_upload(upload_id, hashlib.sha256(b"id,text\n1,a\n").hexdigest()))
+    assert storage.get_upload(upload_id)['status'] == 'complete' and storage.get_upload(upload_id)['dataset_id'] == ds_id
+
+
+def test_complete_checks_the_declared_size(data_dir, no_ingestion):
+    upload_id = storage.create_upload("calls.csv", total_bytes=100)['upload_id']
+    _write(upload_id, 0, b"id,text\n")
+
+    with pytest.raises(ValueError, match="Received 8 of 100 bytes"):
+        asyncio.run(uploads.complete_upload(upload_id))
+    assert no_ingestion == []
+
+
+def _zstd(data):
+    sink = pa.BufferOutputStream()
+    with pa.CompressedOutputStream(sink, 'zstd') as f:
+        f.write(data)
+    return sink.getvalue().to_pybytes()
+
+
+def test_zstd_upload_is_decompressed_during_ingestion(data_dir, no_ingestion):
+    import ingestion
+    content = b"id,text\n" + b"".join(b"%d,line %d\n" % (i, i) for i in range(50))
+    compressed = _zstd(content)
+    upload_id = storage.create_upload("calls.csv.zst", total_bytes=len(compressed))['upload_id']
+    _write(upload_id, 0, compressed[:10], compressed[10:])
+
+    ds_id = asyncio.run(uploads.complete_upload(upload_id, hashlib.sha256(compressed).hexdigest()))
+    ingestion.ingest_dataset(ds_id)
+
+    dataset = storage.get_dataset_status(ds_id)
+    assert dataset['status'] == 'ready' and dataset['num_rows'] == 50
+    # The content hash is that of the CSV, so the same data uploaded uncompressed is a duplicate
+    assert dataset['content_hash'] == hashlib.sha256(content).hexdigest()
+    assert storage.get_dataset_df(ds_id)["text"].tolist()[-1] == "line 49"
+
+
+# -------------------------------
+# Appending rows
+# -------------------------------
+def _dataset(tmp_path, content):
+    path = tmp_path / "dataset.csv"
+    path.write_bytes(content)
+    with open(path, 'rb') as f:
+        return storage.save_dataset(types.SimpleNamespace(file=f), "dataset.csv")
+
+
+def _append(tmp_path, ds_id, content):
+    path = tmp_path / "append.csv"
+    path.write_bytes(content)
+    return storage.append_dataset_rows(ds_id, str(path), hashlib.sha256(content).hexdigest())
+
+
+def test_append_streams_rows_in_the_dataset_column_order(data_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "CSV_BLOCK_BYTES", 64)
+    ds_id = _dataset(tmp_path, b"id,text,score\n0,a,0.5\n")
+    rows = b"text,score,id\n" + b"".join(b"t%d,%d,%d\n" % (i, i, i) for i in range(1, 40))
+
+    result = _append(tmp_path, ds_id, rows)
+
+    assert (result['num_rows'], result['appended_rows']) == (40, 39)
+    df = storage.get_dataset_df(ds_id)
+    assert list(df.columns) == ["id", "text", "score"]
+    assert df["id"].tolist() == list(range(40)) and df["score"].dtype == "float64"
+    assert storage.get_dataset(ds_id)['num_rows'] == 40
+
+
+def test_append_rejects_other_columns(data_dir, tmp_path):
+    ds_id = _dataset(tmp_path, b"id,text\n0,a\n")
+    with pytest.raises(ValueError, match="don't match"):
+        _append(tmp_path, ds_id, b"id,comment\n1,b\n")
+
+
+def test_append_rejects_other_types_and_keeps_the_dataset(data_dir, tmp_path):
+    ds_id = _dataset(tmp_path, b"id,text\n0,a\n")
+    before = storage.get_dataset(ds_id)
+
+    with pytest.raises(ValueError, match="column types"):
+        _append(tmp_path, ds_id, b"id,text\n1,b\nnot a number,c\n")
+
+    after = storage.get_dataset(ds_id)
+    assert (after['num_rows'], after['content_hash']) == (before['num_rows'], before['content_hash'])
+    assert os.listdir(os.path.join(data_dir, "blobs")) == [f"{before['content_hash']}.parquet"]
+
+
+def test_append_to_unknown_dataset(data_dir, tmp_path):
+    with pytest.raises(KeyError):
+        _append(tmp_path, "ds_missing", b"id\n1\n")
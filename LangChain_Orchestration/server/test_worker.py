@@ -0,0 +1,127 @@
+# test_worker.py
+import os
+import sys
+import time
+import types
+import pandas as pd
+import storage
+import runner
+import worker
+from artifacts import read_artifact_df
+from Functions.run_context import CancelToken
+
+
+def _analysis(tmp_path, status):
+    csv_path = tmp_path / "calls.csv"
+    csv_path.write_text("call_id,call_text\n1,hello\n", encoding="utf-8")
+    with open(csv_path, 'rb') as f:
+        ds_id = storage.save_dataset(types.SimpleNamespace(file=f), "calls.csv")
+    analysis_id = storage.create_analysis(ds_id, path_request=[])
+    storage.update_analysis(analysis_id, status=status)
+    return analysis_id, ds_id
+
+
+def _wait_for(cancel_token, timeout=5.0):
+    """Block like a long run would, until the token is tripped (or `timeout` seconds pass)."""
+    deadline = time.monotonic() + timeout
+    while not cancel_token.is_canceled() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return cancel_token.is_canceled()
+
+
+def test_lost_lease_cancels_the_running_handler(monkeypatch):
+    finished = []
+    monkeypatch.setattr(worker, "JOB_HEARTBEAT_SECONDS", 0.01)
+    monkeypatch.setattr(worker, "heartbeat_job", lambda job_id, worker_id: False)
+    monkeypatch.setattr(worker, "complete_job", lambda *args: finished.append("complete"))
+    monkeypatch.setattr(worker, "fail_job", lambda *args: finished.append("fail"))
+
+    seen = {}
+
+    def handler(cancel_token):
+        seen["canceled"] = _wait_for(cancel_token)
+        seen["policy"] = cancel_token.policy
+
+    monkeypatch.setitem(worker.JOB_HANDLERS, "slow", handler)
+    worker.run_job({"id": "job_1", "kind": "slow", "payload": {}}, "worker-a")
+
+    # In-flight requests are abandoned and the job is left to the worker that holds the lease now
+    assert seen == {"canceled": True, "policy": "abort"}
+    assert finished == []
+
+
+def test_releasing_a_finished_analysis_is_a_no_op(data_dir, tmp_path, capsys):
+    analysis_id, ds_id = _analysis(tmp_path, 'completed')
+
+    runner.run_flow_background(analysis_id, ds_id, [])
+
+    assert storage.get_analysis_status(analysis_id)[0] == 'completed'
+    assert f"Analysis {analysis_id} is already completed" in capsys.readouterr().out
+
+
+def test_analysis_canceled_while_queued_never_starts(data_dir, tmp_path, capsys):
+    analysis_id, ds_id = _analysis(tmp_path, 'canceling')
+
+    runner.run_flow_background(analysis_id, ds_id, [])
+
+    assert storage.get_analysis_status(analysis_id)[0] == 'canceled'
+    assert "canceled before it started" in capsys.readouterr().out
+
+
+def test_run_that_lost_its_lease_writes_nothing(data_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(runner, "DATA_DIR", str(data_dir))
+    analysis_id, ds_id = _analysis(tmp_path, 'queued')
+    cancel_token = CancelToken()
+    cancel_token.cancel("abort")
+
+    runner.run_flow_background(analysis_id, ds_id, [], cancel_token=cancel_token)
+
+    # The analysis belongs to the new lease holder: still running, no artifacts from this attempt
+    assert storage.get_analysis_status(analysis_id)[0] == 'running'
+    assert not os.path.exists(os.path.join(data_dir, 'artifacts', analysis_id))
+
+
+def test_incremental_run_keeps_outputs_no_new_rows_reach(data_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(runner, "DATA_DIR", str(data_dir))
+    monkeypatch.setattr(runner, "send_email_notification", lambda **kwargs: None)
+    compiler = sys.modules[runner.compile_and_run.__module__]
+    monkeypatch.setitem(runner.FUNCTION_REGISTRY, "label",
+                        lambda df: df[df["call_text"] != "drop"].assign(label="x"))
+    monkeypatch.setitem(runner.FUNCTION_REGISTRY, "count", lambda df: pd.DataFrame({"rows": [len(df)]}))
+    monkeypatch.setattr(compiler, "ROW_LOCAL_FUNCTIONS", {"label"})
+    path = [{"function": "label", "args": {}, "input_df_name": "starting_df", "output_df_name": "kept"},
+            {"function": "count", "args": {}, "input_df_name": "kept", "output_df_name": "counts"}]
+    base_id, ds_id = _analysis(tmp_path, 'queued')
+    runner.run_flow_background(base_id, ds_id, path)
+
+    rows = tmp_path / "append.csv"
+    rows.write_text("call_id,call_text\n2,drop\n", encoding="utf-8")
+    storage.append_dataset_rows(ds_id, str(rows), "rows")
+    analysis_id = storage.create_analysis(ds_id, path_request=path, base_analysis_id=base_id)
+    runner.run_flow_background(analysis_id, ds_id, path, base_analysis_id=base_id)
+
+    base, analysis = storage.get_analysis(base_id), storage.get_analysis(analysis_id)
+    assert analysis['status'] == 'completed'
+    counts = read_artifact_df(analysis['artifacts']['counts'])
+    assert counts.equals(read_artifact_df(base['artifacts']['counts']))
+    assert list(counts.columns) == ["rows"] and counts["rows"].tolist() == [1]
+    assert read_artifact_df(analysis['artifacts']['starting_df'])["call_text"].tolist() == ["hello", "drop"]
+
+
+def test_cancel_posted_after_the_run_finished_is_not_overwritten(data_dir, tmp_path, monkeypatch):
+    import jobs
+    monkeypatch.setattr(runner, "DATA_DIR", str(data_dir))
+    monkeypatch.setattr(runner, "send_email_notification", lambda **kwargs: None)
+    analysis_id, ds_id = _analysis(tmp_path, 'queued')
+
+    def cancel_while_saving(artifacts):
+        # The monitor has stopped by now, so only the final status write can see the cancel
+        assert jobs.request_cancel(analysis_id) == 'canceling'
+        return {}
+
+    monkeypatch.setattr(runner, "summarize_artifacts", cancel_while_saving)
+    runner.run_flow_background(analysis_id, ds_id, [])
+
+    analysis = storage.get_analysis(analysis_id)
+    assert analysis['status'] == 'canceled'
+    assert 'starting_df' in analysis['artifacts']
@@ -0,0 +1,209 @@
+# server/uploads.py
+"""
+Resumable chunked uploads and compressed CSV input.
+
+Protocol (see main.py):
+    POST   /uploads                 {"filename", "total_bytes"?} -> {"upload_id", "offset": 0}
+    PUT    /uploads/{id}?offset=N   raw chunk bytes, optional X-Chunk-SHA256 header
+    GET    /uploads/{id}            -> current offset, to resume after a dropped connection
+    POST   /uploads/{id}/complete   {"sha256"?} -> {"dataset_id"}; ingestion starts
+    DELETE /uploads/{id}
+
+A chunk must start exactly at the offset the server has recorded; anything
+else is rejected with the current offset so the client can resume from
+there. A chunk whose checksum doesn't match is discarded. The assembled file
+may be a plain, gzip, zip or zstd-compressed CSV; it is decompressed as a
+stream during ingestion.
+
+Chunks are hashed (SHA-256) as they arrive, so completing an upload doesn't
+re-read it; the hash becomes the dataset's content hash (ingestion.py).
+"""
+from __future__ import annotations
+import asyncio
+import contextlib
+import gzip
+import hashlib
+import os
+import zipfile
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+import pyarrow as pa
+from storage import (new_id, dataset_path, upload_part_path, file_sha256, create_dataset_record, get_upload,
+                     update_upload)
+from config import UPLOAD_CHUNK_BYTES, MAX_UPLOAD_CHUNK_BYTES
+
+# Filenames accepted by the upload endpoints; the format is detected from the content
+UPLOAD_SUFFIXES = ('.csv', '.gz', '.zip', '.zst', '.zstd')
+
+_MAGIC = {
+    b'\x1f\x8b': 'gzip',
+    b'PK\x03\x04': 'zip',
+    b'\x28\xb5\x2f\xfd': 'zstd',
+}
+
+
+class OffsetMismatch(Exception):
+    """A chunk didn't start at the recorded offset; `offset` is where the client should resume."""
+    def __init__(self, offset: int):
+        super().__init__(f"Upload is at offset {offset}")
+        self.offset = offset
+
+
+# -------------------------------
+# Compressed input
+# -------------------------------
+def compression_of(head: bytes) -> Optional[str]:
+    """'gzip', 'zip', 'zstd' or None (plain), from the first bytes of a file."""
+    for magic, kind in _MAGIC.items():
+        if head.startswith(magic):
+            return kind
+    return None
+
+
+def detect_compression(path: str) -> Optional[str]:
+    with open(path, 'rb') as f:
+        return compression_of(f.read(4))
+
+
+@contextlib.contextmanager
+def open_decompressed(path: str):
+    """Binary stream of the (decompressed) file contents; nothing is read ahead of the caller."""
+    kind = detect_compression(path)
+    if kind is None:
+        with open(path, 'rb') as f:
+            yield f
+    elif kind == 'gzip':
+        with gzip.open(path, 'rb') as f:
+            yield f
+    elif kind == 'zip':
+        with zipfile.ZipFile(path) as archive:
+            members = [m for m in archive.infolist() if not m.is_dir()]
+            csv_members = [m for m in members if m.filename.lower().endswith('.csv')] or members
+            if len(csv_members) != 1:
+                raise ValueError(f"Zip upload must contain exactly one CSV file, found {len(csv_members)}")
+            with archive.open(csv_members[0]) as f:
+                yield f
+    else:
+        # pyarrow's own zstd codec (the one Parquet files are written with)
+        with pa.CompressedInputStream(pa.OSFile(path), 'zstd') as f:
+            yield f
+
+
+def decompress_to_csv(src: str, dst: str) -> Optional[str]:
+    """
+    Write the decompressed contents of `src` to `dst` chunk by chunk and
+    return their SHA-256. Plain files are just moved (None: their upload hash
+    already is the content hash).
+    """
+    if detect_compression(src) is None:
+        os.replace(src, dst)
+        return None
+    digest = hashlib.sha256()
+    with open_decompressed(src) as f_in, open(dst, 'wb') as f_out:
+        while chunk := f_in.read(UPLOAD_CHUNK_BYTES):
+            digest.update(chunk)
+            f_out.write(chunk)
+    os.remove(src)
+    return digest.hexdigest()
+
+
+# -------------------------------
+# Chunked uploads
+# -------------------------------
+_locks: Dict[str, asyncio.Lock] = {}
+# upload id -> (offset, SHA-256 of bytes [0, offset)); lost on restart, then completion re-reads the file
+_digests: Dict[str, Tuple[int, Any]] = {}
+
+
+def _lock(upload_id: str) -> asyncio.Lock:
+    return _locks.setdefault(upload_id, asyncio.Lock())
+
+
+def _open_upload(upload_id: str) -> dict:
+    upload = get_upload(upload_id)
+    if upload['status'] != 'open':
+        raise ValueError(f"Upload is {upload['status']}")
+    return upload
+
+
+async def write_chunk(upload_id: str, offset: int, chunks: AsyncIterator[bytes],
+                      checksum: Optional[str] = None) -> dict:
+    """
+    Append one chunk at `offset`, streaming it to disk. Raises OffsetMismatch
+    if `offset` isn't the recorded offset and ValueError if the chunk is too
+    large or doesn't match `checksum` (hex SHA-256); either way nothing is kept.
+    """
+    async with _lock(upload_id):
+        upload = await asyncio.to_thread(_open_upload, upload_id)
+        if offset != upload['offset']:
+            raise OffsetMismatch(upload['offset'])
+
+        digest, written = hashlib.sha256(), 0
+        running_offset, running = _digests.get(upload_id, (0, hashlib.sha256()))
+        running = running.copy() if running_offset == offset else None
+        with open(upload_part_path(upload_id), 'ab') as f:
+            # Drop bytes of an earlier chunk that was cut off before it was recorded
+            f.truncate(offset)
+            try:
+                async for chunk in chunks:
+                    written += len(chunk)
+                    if written > MAX_UPLOAD_CHUNK_BYTES:
+                        raise ValueError(f"Chunk larger than {MAX_UPLOAD_CHUNK_BYTES} bytes")
+                    digest.update(chunk)
+                    if running is not None:
+                        running.update(chunk)
+                    await asyncio.to_thread(f.write, chunk)
+                if checksum and digest.hexdigest() != checksum.lower():
+                    raise ValueError("Chunk checksum mismatch")
+            except BaseException:
+                f.truncate(offset)
+                raise
+
+        offset += written
+        await asyncio.to_thread(update_upload, upload_id, received_bytes=offset)
+        if running is not None:
+            _digests[upload_id] = (offset, running)
+        return {**upload, 'offset': offset}
+
+
+def _complete(upload_id: str, sha256: Optional[str]) -> str:
+    upload = _open_upload(upload_id)
+    part_path = upload_part_path(upload_id)
+    if upload['total_bytes'] is not None and upload['offset'] != upload['total_bytes']:
+        raise ValueError(f"Received {upload['offset']} of {upload['total_bytes']} bytes")
+    if not upload['offset'] or not os.path.exists(part_path):
+        raise ValueError("Nothing was uploaded")
+    running_offset, running = _digests.get(upload_id, (None, None))
+    upload_hash = running.hexdigest() if running_offset == upload['offset'] else file_sha256(part_path)
+    if sha256 and upload_hash != sha256.lower():
+        raise ValueError("File checksum mismatch")
+
+    ds_id = new_id('ds')
+    raw_path = dataset_path(ds_id, 'upload')
+    # A plain CSV's upload hash is its content hash; compressed uploads are hashed as they are decompressed
+    content_hash = upload_hash if detect_compression(part_path) is None else None
+    os.replace(part_path, raw_path)
+    create_dataset_record(ds_id, upload['filename'], raw_path, content_hash=content_hash)
+    update_upload(upload_id, status='complete', dataset_id=ds_id)
+    return ds_id
+
+
+async def complete_upload(upload_id: str, sha256: Optional[str] = None) -> str:
+    """Check size/checksum, turn the upload into a dataset and queue its ingestion. Returns the dataset id."""
+    from ingestion import start_ingestion
+    async with _lock(upload_id):
+        ds_id = await asyncio.to_thread(_complete, upload_id, sha256)
+    _locks.pop(upload_id, None)
+    _digests.pop(upload_id, None)
+    start_ingestion(ds_id)
+    return ds_id
+
+
+async def abort_upload(upload_id: str):
+    async with _lock(upload_id):
+        await asyncio.to_thread(_open_upload, upload_id)
+        await asyncio.to_thread(update_upload, upload_id, status='aborted')
+        part_path = upload_part_path(upload_id)
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    _locks.pop(upload_id, None)
+    _digests.pop(upload_id, None)
@@ -0,0 +1,124 @@
+# server/worker.py
+"""
+Worker processes for the job queue (jobs.py).
+
+Run from the server directory, next to the API:
+    python worker.py --workers 4
+
+Each process leases one job at a time, renews the lease on a heartbeat
+thread while the handler runs, and records the outcome. If the lease can't
+be renewed (another worker has taken the job over), the handler's cancel
+token is tripped so the run stops instead of racing the new one. The supervisor
+restarts worker processes that exit unexpectedly; a job held by a dead
+worker is picked up again once its lease expires.
+"""
+from __future__ import annotations
+import argparse
+import multiprocessing as mp
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+from config import WORKER_COUNT, JOB_HEARTBEAT_SECONDS, JOB_POLL_SECONDS
+from storage import init_db
+from jobs import lease_job, heartbeat_job, complete_job, fail_job
+from runner import run_flow_background
+from Functions.run_context import CancelToken
+
+# Job kind -> handler called with the job payload as keyword arguments, plus `cancel_token`
+JOB_HANDLERS = {
+    "run_flow": run_flow_background,
+}
+
+
+def _heartbeat(job_id: str, worker_id: str, done: threading.Event, lease_lost: threading.Event,
+               cancel_token: CancelToken):
+    while not done.wait(JOB_HEARTBEAT_SECONDS):
+        try:
+            renewed = heartbeat_job(job_id, worker_id)
+        except Exception as e:
+            # e.g. the database is locked; the next beat tells whether the lease survived
+            print(f"⚠️ [{worker_id}] Heartbeat for job {job_id} failed: {e}")
+            continue
+        if not renewed:
+            print(f"⚠️ [{worker_id}] Lost the lease on job {job_id}; stopping it")
+            lease_lost.set()
+            cancel_token.cancel("abort")
+            return
+
+
+def run_job(job, worker_id: str):
+    done, lease_lost = threading.Event(), threading.Event()
+    cancel_token = CancelToken()
+    beat = threading.Thread(target=_heartbeat, args=(job["id"], worker_id, done, lease_lost, cancel_token),
+                            daemon=True)
+    beat.start()
+    try:
+        JOB_HANDLERS[job["kind"]](**job["payload"], cancel_token=cancel_token)
+        if lease_lost.is_set():
+            print(f"⏹️ [{worker_id}] Stopped job {job['id']} after losing its lease")
+            return
+        complete_job(job["id"], worker_id)
+        print(f"✅ [{worker_id}] Finished job {job['id']}")
+    except Exception as e:
+        traceback.print_exc()
+        fail_job(job["id"], worker_id, f"{e}\n{traceback.format_exc()}")
+    finally:
+        done.set()
+        beat.join()
+
+
+def worker_loop(index: int):
+    """Lease and run jobs until SIGTERM/SIGINT; finishes the current job first."""
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+    init_db()
+    print(f"👷 Worker {index} started ({worker_id})")
+
+    while not stopping.is_set():
+        job = lease_job(worker_id)
+        if job is None:
+            stopping.wait(JOB_POLL_SECONDS)
+            continue
+        print(f"🚀 [{worker_id}] Running job {job['id']} ({job['kind']}, attempt {job['attempts']})")
+        run_job(job, worker_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run job queue workers.")
+    parser.add_argument("--workers", type=int, default=WORKER_COUNT, help="Number of worker processes")
+    args = parser.parse_args()
+
+    init_db()
+    processes = {}
+    stopping = threading.Event()
+
+    def stop(*_):
+        stopping.set()
+        for process in processes.values():
+            if process.is_alive():
+                process.terminate()  # SIGTERM: workers finish their current job, then exit
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while not stopping.is_set():
+        for index in range(args.workers):
+            process = processes.get(index)
+            if process is None or not process.is_alive():
+                if process is not None:
+                    print(f"⚠️ Worker {index} exited with code {process.exitcode}; restarting")
+                processes[index] = mp.Process(target=worker_loop, args=(index,), daemon=False)
+                processes[index].start()
+        stopping.wait(JOB_POLL_SECONDS)
+
+    for process in processes.values():
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ import Navbar from "@/components/navbar";
 import{
   getDatasets,
   uploadDataset,
+  waitForDatasetReady,
   getTruncatedDataset,
   deleteDataset,
 } from "@/lib/api";
@@ -53,6 +54,7 @@ const DataInputPage: React.FC = () => {
     setUploading(true);
     try {
       const data = await uploadDataset(file);
+      await waitForDatasetReady(data.dataset_id);
       const newFile = {
         name: file.name,
         datasetId: data.dataset_id,
@@ -155,7 +157,7 @@ const DataInputPage: React.FC = () => {
               {uploading ? "Uploading..." : "Select CSV file"}
               <input
                 type="file"
-                accept=".csv"
+                accept=".csv,.gz,.zip,.zst"
                 onChange={handleFileUpload}
                 className="hidden"
               />
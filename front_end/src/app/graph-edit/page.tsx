@@ -507,7 +507,7 @@ function ListEditor({ value, inferred, onChange, parentFunction, argName }: List
         explanation_col: "binary_explanation",
         label_col: "binary_label",
         input_data: "call_text",
-        include_explanation: "true",
+        include_explanation: true,
       };
     } else {
       // Existing default logic
@@ -13,6 +13,25 @@ interface Analysis {
   error?: string;
   created_at?: string;
   finished_at?: string;
+  progress?: AnalysisProgress | null;
+}
+
+interface AnalysisProgress {
+  step_idx: number;
+  of: number;
+  function?: string;
+  processed: number;
+  total: number;
+  errors: number;
+  rows_per_s?: number;
+  eta_s?: number | null;
+}
+
+interface ArtifactSummary {
+  num_rows?: number;
+  value_counts?: Record<string, { count: number; [column: string]: any }[]>;
+  list_frequencies?: Record<string, { top: { count: number; [column: string]: any }[] }>;
+  error?: string;
 }
 
 interface DataFrameRow {
@@ -21,6 +40,7 @@ interface DataFrameRow {
 
 const API_BASE = "http://127.0.0.1:8000";
 const MAX_CELL_CHARS = 200;
+const PAGE_SIZE = 20;
 
 const truncate = (value: any) => {
   if (typeof value === "string" && value.length > MAX_CELL_CHARS) {
@@ -32,12 +52,15 @@ const truncate = (value: any) => {
 const InsightVisualizerPage: React.FC = () => {
   const [analyses, setAnalyses] = useState<Analysis[]>([]);
   const [selectedAnalysis, setSelectedAnalysis] = useState<Analysis | null>(null);
-  const [dataFrames, setDataFrames] = useState<{ key: string; df: DataFrameRow[] }[]>([]);
+  const [dataFrames, setDataFrames] = useState<
+    { key: string; df: DataFrameRow[]; offset: number; total: number }[]
+  >([]);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [collapsed, setCollapsed] = useState<Record<string, boolean>>({});
   const [downloading, setDownloading] = useState(false);
   const [datasets, setDatasets] = useState<Record<string, string>>({});
+  const [summaries, setSummaries] = useState<Record<string, ArtifactSummary>>({});
 
   // 🔹 Full-page loading overlay (independent spinner)
   const LoadingSpinner = () => (
@@ -73,7 +96,7 @@ const InsightVisualizerPage: React.FC = () => {
       try {
         const [analysesRes, datasetsRes] = await Promise.all([
           fetch(`${API_BASE}/analyses`),
-          fetch(`${API_BASE}/datasets`),
+          fetch(`${API_BASE}/datasets?include_head=false&limit=500`),
         ]);
         if (!analysesRes.ok || !datasetsRes.ok) throw new Error("Failed to fetch data");
 
@@ -94,30 +117,72 @@ const InsightVisualizerPage: React.FC = () => {
     fetchAll();
   }, []);
 
-  // 🔹 Poll backend every 5 seconds to refresh analysis statuses
+  // 🔹 Live status/progress pushed by the backend (Server-Sent Events) instead of polling
   useEffect(() => {
-    const interval = setInterval(async () => {
-      try {
-        const res = await fetch(`${API_BASE}/analyses`);
-        if (!res.ok) throw new Error("Failed to fetch analyses");
-        const updated: Analysis[] = await res.json();
-        setAnalyses(updated);
-
-        // ✅ Update selected analysis if its status changes
-        if (selectedAnalysis) {
-          const refreshed = updated.find((a) => a.id === selectedAnalysis.id);
-          if (refreshed && refreshed.status !== selectedAnalysis.status) {
-            setSelectedAnalysis(refreshed);
-          }
-        }
-      } catch (err) {
-        console.error("Error refreshing analyses:", err);
-      }
-    }, 5000);
+    const source = new EventSource(`${API_BASE}/analyses/events`);
+
+    source.addEventListener("analysis", (event) => {
+      const update: Analysis = JSON.parse((event as MessageEvent).data);
+      setAnalyses((prev) =>
+        prev.some((a) => a.id === update.id)
+          ? prev.map((a) => (a.id === update.id ? { ...a, ...update } : a))
+          : [...prev, update]
+      );
+
+      // ✅ Update selected analysis if its status or progress changes
+      setSelectedAnalysis((selected) =>
+        selected && selected.id === update.id
+          ? { ...selected, status: update.status, progress: update.progress }
+          : selected
+      );
+    });
+
+    source.onerror = (err) => {
+      // EventSource reconnects on its own
+      console.error("Analysis event stream error:", err);
+    };
+
+    return () => source.close();
+  }, []);
+
+  const formatProgress = (p?: AnalysisProgress | null) => {
+    if (!p || !p.of) return "";
+    const rows = p.total ? ` · ${p.processed}/${p.total} rows` : "";
+    const errors = p.errors ? ` · ${p.errors} errors` : "";
+    const eta = p.eta_s != null ? ` · ~${Math.ceil(p.eta_s)}s left` : "";
+    return `step ${p.step_idx}/${p.of} ${p.function ?? ""}${rows}${errors}${eta}`;
+  };
 
-    return () => clearInterval(interval);
-  }, [selectedAnalysis]);
 
+  // 🔹 One page of an artifact (the server reads only the row groups it needs)
+  const fetchArtifactPage = async (analysisId: string, key: string, offset: number) => {
+    const res = await fetch(
+      `${API_BASE}/analyses/${analysisId}/artifacts/${key}?format=json&offset=${offset}&limit=${PAGE_SIZE}`
+    );
+    if (!res.ok) throw new Error(`Failed to fetch artifact ${key}`);
+    const rows = await res.json();
+    const total = Number(res.headers.get("X-Total-Count") ?? rows.length);
+
+    const df = rows.map((row: Record<string, any>) => {
+      const newRow: Record<string, any> = {};
+      Object.entries(row).forEach(([k, v]) => {
+        newRow[k] = truncate(Array.isArray(v) ? v.join(", ") : v);
+      });
+      return newRow;
+    });
+
+    return { key, df, offset, total };
+  };
+
+  const changePage = async (key: string, offset: number) => {
+    if (!selectedAnalysis) return;
+    try {
+      const page = await fetchArtifactPage(selectedAnalysis.id, key, offset);
+      setDataFrames((prev) => prev.map((d) => (d.key === key ? page : d)));
+    } catch (err: any) {
+      setError(err.message || "Error loading artifact page");
+    }
+  };
 
   // 🔹 Load artifacts for selected analysis
   const loadArtifacts = async (analysis: Analysis) => {
@@ -135,29 +200,17 @@ const InsightVisualizerPage: React.FC = () => {
         return;
       }
 
-      const dfPromises = Object.entries(detailedAnalysis.artifacts).map(
-        async ([key]) => {
-          const res = await fetch(
-            `${API_BASE}/analyses/${detailedAnalysis.id}/artifacts/${key}?format=json&nrows=20`
-          );
-          if (!res.ok) throw new Error(`Failed to fetch artifact ${key}`);
-          const df = await res.json();
-
-          const truncatedDf = df.map((row: Record<string, any>) => {
-            const newRow: Record<string, any> = {};
-            Object.entries(row).forEach(([k, v]) => {
-              newRow[k] = truncate(v);
-            });
-            return newRow;
-          });
-
-          return { key, df: truncatedDf };
-        }
+      const dfPromises = Object.keys(detailedAnalysis.artifacts).map((key) =>
+        fetchArtifactPage(detailedAnalysis.id, key, 0)
       );
 
       const dfs = await Promise.all(dfPromises);
       setDataFrames(dfs);
 
+      // Precomputed at run completion, so this doesn't scan the artifacts
+      const summaryRes = await fetch(`${API_BASE}/analyses/${detailedAnalysis.id}/summary`);
+      setSummaries(summaryRes.ok ? (await summaryRes.json()).artifacts : {});
+
       const initialCollapsed: Record<string, boolean> = {};
       dfs.forEach(({ key }) => (initialCollapsed[key] = true));
       setCollapsed(initialCollapsed);
@@ -171,6 +224,37 @@ const InsightVisualizerPage: React.FC = () => {
     }
   };
 
+  // 🔹 Label distributions and list-column frequencies from the run summary
+  const renderSummary = (summary?: ArtifactSummary) => {
+    if (!summary || summary.error) return null;
+    const distributions = [
+      ...Object.entries(summary.value_counts ?? {}),
+      ...Object.entries(summary.list_frequencies ?? {}).map(
+        ([column, f]) => [column, f.top.slice(0, 10)] as [string, { count: number; [column: string]: any }[]]
+      ),
+    ];
+    if (distributions.length === 0) return null;
+    return (
+      <div className="flex flex-wrap gap-6 mb-5">
+        {distributions.map(([column, counts]) => {
+          const max = Math.max(...counts.map((c) => c.count), 1);
+          return (
+            <div key={column} className="min-w-[220px]">
+              <h3 className="font-semibold text-gray-700 mb-2">{column}</h3>
+              {counts.map((c, i) => (
+                <div key={i} className="flex items-center gap-2 text-sm mb-1">
+                  <span className="w-28 truncate">{String(c[column] ?? "—")}</span>
+                  <div className="bg-blue-400 h-3 rounded" style={{ width: `${(c.count / max) * 120}px` }} />
+                  <span className="text-gray-600">{c.count}</span>
+                </div>
+              ))}
+            </div>
+          );
+        })}
+      </div>
+    );
+  };
+
   const toggleCollapse = (key: string) => {
     setCollapsed((prev) => ({ ...prev, [key]: !prev[key] }));
   };
@@ -235,6 +319,9 @@ const InsightVisualizerPage: React.FC = () => {
               <span className="text-base font-medium tracking-wide">
                 Loading analysis data…
               </span>
+              {selectedAnalysis?.status === "running" && selectedAnalysis.progress && (
+                <span className="text-sm mt-1">{formatProgress(selectedAnalysis.progress)}</span>
+              )}
             </div>
           </div>
         </div>
@@ -289,6 +376,7 @@ const InsightVisualizerPage: React.FC = () => {
                   return (
                     <option key={a.id} value={a.id}>
                       {statusIcon} {datasetName} — {createdAt}
+                      {a.status === "running" && a.progress ? ` (${formatProgress(a.progress)})` : ""}
                     </option>
                   );
                 })}
@@ -314,7 +402,7 @@ const InsightVisualizerPage: React.FC = () => {
 
         {/* Artifacts */}
         <div className="space-y-6">
-          {dataFrames.map(({ key, df }) => (
+          {dataFrames.map(({ key, df, offset, total }) => (
             <div
               key={key}
               className="bg-white rounded-2xl shadow-sm border border-blue-100 overflow-hidden transition hover:shadow-md"
@@ -328,6 +416,7 @@ const InsightVisualizerPage: React.FC = () => {
               </div>
               {!collapsed[key] && (
                 <div className="p-5 overflow-x-auto">
+                  {renderSummary(summaries[key])}
                   {df.length === 0 ? (
                     <p className="text-gray-500">No data available</p>
                   ) : (
@@ -360,6 +449,27 @@ const InsightVisualizerPage: React.FC = () => {
                       </tbody>
                     </table>
                   )}
+                  {total > PAGE_SIZE && (
+                    <div className="flex items-center justify-end gap-3 mt-3 text-sm text-gray-700">
+                      <span>
+                        Rows {offset + 1}–{Math.min(offset + PAGE_SIZE, total)} of {total}
+                      </span>
+                      <button
+                        onClick={() => changePage(key, Math.max(offset - PAGE_SIZE, 0))}
+                        disabled={offset === 0}
+                        className="px-3 py-1 rounded border border-gray-300 bg-white disabled:opacity-50"
+                      >
+                        ← Prev
+                      </button>
+                      <button
+                        onClick={() => changePage(key, offset + PAGE_SIZE)}
+                        disabled={offset + PAGE_SIZE >= total}
+                        className="px-3 py-1 rounded border border-gray-300 bg-white disabled:opacity-50"
+                      >
+                        Next →
+                      </button>
+                    </div>
+                  )}
                 </div>
               )}
             </div>
@@ -12,6 +12,17 @@ export async function getAnalyses() {
   return res.json();
 }
 
+// Aggregate an analysis artifact, e.g. { artifact: "df_out", group_by: ["follow_up_label"] }
+export async function queryAnalysis(analysisId: string, query: Record<string, any>) {
+  const res = await fetch(`${API_BASE}/analyses/${analysisId}/query`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(query),
+  });
+  if (!res.ok) throw new Error("Failed to query analysis");
+  return res.json();
+}
+
 // Fetch preview of a dataset by ID (adjust endpoint if needed)
 export async function getDatasetPreview(id: string) {
   const res = await fetch(`${API_BASE}/datasets/${id}`);
@@ -50,6 +61,17 @@ export async function get_saved_graph(id: string) {
   return res.json();
 }
 
+// mode: "incremental" (only rows appended since the last run), "full" or "up_to_date"
+export async function runSavedGraph(graphId: string, datasetId: string, incremental = true) {
+  const res = await fetch(`${API_BASE}/saved-graphs/${graphId}/run`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ dataset_id: datasetId, incremental }),
+  });
+  if (!res.ok) throw new Error(`Failed to run saved graph ${graphId}`);
+  return res.json();
+}
+
 export async function save_graph(name: string, path: any[]) {
   const res = await fetch(`${API_BASE}/saved-graphs`, {
     method: "POST",
@@ -61,13 +83,67 @@ export async function save_graph(name: string, path: any[]) {
 }
 /* ----------------------------- DATASETS ----------------------------- */
 
-export async function getDatasets() {
-  const res = await fetch(`${API_BASE}/datasets`);
+export async function getDatasets(limit = 100, offset = 0) {
+  const res = await fetch(`${API_BASE}/datasets?limit=${limit}&offset=${offset}`);
   if (!res.ok) throw new Error("Failed to fetch datasets");
   return res.json();
 }
 
+// Files above this size go through the resumable /uploads endpoints, one chunk at a time
+const UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024;
+const UPLOAD_RETRIES = 5;
+
+async function sha256Hex(data: ArrayBuffer) {
+  const digest = await crypto.subtle.digest("SHA-256", data);
+  return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, "0")).join("");
+}
+
+async function getUploadOffset(uploadId: string) {
+  const res = await fetch(`${API_BASE}/uploads/${uploadId}`);
+  if (!res.ok) throw new Error(`Failed to fetch upload ${uploadId}`);
+  return (await res.json()).offset as number;
+}
+
+export async function uploadDatasetChunked(file: File) {
+  const start = await fetch(`${API_BASE}/uploads`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ filename: file.name, total_bytes: file.size }),
+  });
+  if (!start.ok) throw new Error("File upload failed");
+  const { upload_id } = await start.json();
+
+  let offset = 0;
+  let failures = 0;
+  while (offset < file.size) {
+    const chunk = await file.slice(offset, offset + UPLOAD_CHUNK_BYTES).arrayBuffer();
+    try {
+      const res = await fetch(`${API_BASE}/uploads/${upload_id}?offset=${offset}`, {
+        method: "PUT",
+        headers: { "Content-Type": "application/octet-stream", "X-Chunk-SHA256": await sha256Hex(chunk) },
+        body: chunk,
+      });
+      if (!res.ok) throw new Error(`Chunk at ${offset} failed (${res.status})`);
+      offset = (await res.json()).offset;
+      failures = 0;
+    } catch (err) {
+      // Dropped connection or rejected chunk: resume from wherever the server got to
+      if (++failures > UPLOAD_RETRIES) throw err;
+      offset = await getUploadOffset(upload_id);
+    }
+  }
+
+  const res = await fetch(`${API_BASE}/uploads/${upload_id}/complete`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({}),
+  });
+  if (!res.ok) throw new Error("File upload failed");
+  return res.json();
+}
+
 export async function uploadDataset(file: File) {
+  if (file.size > UPLOAD_CHUNK_BYTES) return uploadDatasetChunked(file);
   const formData = new FormData();
   formData.append("file", file);
   const res = await fetch(`${API_BASE}/datasets`, {
@@ -78,6 +154,34 @@ export async function uploadDataset(file: File) {
   return res.json();
 }
 
+// Appended rows keep the dataset's existing row ids; rerun a saved graph to process only them
+export async function appendDatasetRows(id: string, file: File) {
+  const formData = new FormData();
+  formData.append("file", file);
+  const res = await fetch(`${API_BASE}/datasets/${id}/rows`, {
+    method: "POST",
+    body: formData,
+  });
+  if (!res.ok) throw new Error(`Failed to append rows to dataset ${id}`);
+  return res.json();
+}
+
+// Ingestion runs in the background after upload: "ingesting" -> "ready" | "failed"
+export async function getDatasetStatus(id: string) {
+  const res = await fetch(`${API_BASE}/datasets/${id}/status`);
+  if (!res.ok) throw new Error(`Failed to fetch status for dataset ${id}`);
+  return res.json();
+}
+
+export async function waitForDatasetReady(id: string, intervalMs = 1000) {
+  for (;;) {
+    const status = await getDatasetStatus(id);
+    if (status.status === "ready") return status;
+    if (status.status === "failed") throw new Error(status.error || "Dataset ingestion failed");
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+}
+
 export async function getTruncatedDataset(id: string) {
   const res = await fetch(`${API_BASE}/datasets/truncated/${id}`);
   console.log(res);  // This is optional for debugging